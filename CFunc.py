@@ -2,10 +2,14 @@
 """General Python Functions"""
 
 # Python includes.
+import concurrent.futures
+import contextlib
 import ctypes
+import errno
 import encodings.idna  # pyright: ignore[reportUnusedImport], needed for downloadfile() which sometimes errors with "LookupError: unknown encoding: idna"
 import fnmatch
 import functools
+import hashlib
 import json
 import logging
 import os
@@ -14,9 +18,12 @@ import platform
 import re
 import shlex
 import shutil
+import stat
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 import urllib.request
 
 ### Detect Windows Function ###
@@ -30,6 +37,7 @@ def is_windows():
 
 # Exclude imports not available on Windows.
 if is_windows() is False:
+    import fcntl
     import grp
     import pwd
 
@@ -55,8 +63,263 @@ def dlProgress(count, blockSize, totalSize):
     if percent >= 100:
         sys.stdout.write("\n")
     sys.stdout.flush()
-def downloadfile(url, localpath, filename=None, overwrite=False):
-    """Retrieve a file and return its fullpath and filename"""
+# Segmented downloads split files into ranges of at least this size.
+DL_SEGMENT_MINSIZE = 16 * 1024 * 1024
+def digestindex_key(filestat: os.stat_result):
+    """Return the digest index key and the metadata which must match for a cached digest to be valid."""
+    return ("{0}:{1}".format(filestat.st_dev, filestat.st_ino), {"size": filestat.st_size, "mtime_ns": filestat.st_mtime_ns})
+def digestindex_load(indexpath: str):
+    """Load a persistent digest index (json), or return an empty index."""
+    index = {}
+    if os.path.isfile(indexpath):
+        try:
+            with open(indexpath, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+    return index
+def digestindex_store(indexpath: str, filepath: str, digests: dict, filestat: os.stat_result = None):
+    """Record digests of a file in a persistent digest index, keyed on (device, inode, size, mtime_ns)."""
+    if filestat is None:
+        filestat = os.stat(filepath)
+    key, meta = digestindex_key(filestat)
+    indexfolder = os.path.dirname(os.path.abspath(indexpath))
+    try:
+        # Reload and replace the index under a lock, so entries added by concurrent runs (i.e. matrix builds) are kept.
+        with dlcache_lock(indexfolder, ".{0}.lock".format(os.path.basename(indexpath))):
+            index = digestindex_load(indexpath)
+            entry = index.get(key, {})
+            if {k: entry.get(k) for k in meta} != meta:
+                entry = {}
+            entry.update(meta)
+            entry["path"] = os.path.abspath(filepath)
+            entry.setdefault("digests", {}).update(digests)
+            index[key] = entry
+            with tempfile.NamedTemporaryFile('w', dir=indexfolder, prefix=".digests.", delete=False) as f:
+                json.dump(index, f, indent=2)
+            os.replace(f.name, indexpath)
+    except OSError as e:
+        logging.info("WARNING: Unable to write digest index %s (%s).", indexpath, e)
+def file_digests(filepath: str, algorithms: tuple = ("md5",), blocksize: int = 1024 * 1024, indexpath: str = None):
+    """
+    Calculate the hex digests of a file for each of the given hashlib algorithms.
+    indexpath: Persistent digest index (json). Digests are returned from the index while the file's device, inode, size and mtime are unchanged, and are recomputed and stored otherwise.
+    """
+    if indexpath:
+        filestat = os.stat(filepath)
+        key, meta = digestindex_key(filestat)
+        entry = digestindex_load(indexpath).get(key, {})
+        cached = entry.get("digests", {})
+        if {k: entry.get(k) for k in meta} == meta and all(alg in cached for alg in algorithms):
+            logging.info("Digest cache hit for %s.", filepath)
+            return {alg: cached[alg] for alg in algorithms}
+        logging.info("Digest cache miss for %s. Hashing file.", filepath)
+    hashes = {alg: hashlib.new(alg) for alg in algorithms}
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(blocksize), b""):
+            for h in hashes.values():
+                h.update(block)
+    digests = {alg: h.hexdigest() for alg, h in hashes.items()}
+    if indexpath:
+        digestindex_store(indexpath, filepath, digests, filestat)
+    return digests
+def download_segmented(url: str, fullpath: str, segments: int = 8, headers: dict = None, digests: tuple = ("sha256",), blocksize: int = 1024 * 1024):
+    """
+    Download a url to fullpath using concurrent HTTP Range requests.
+    Data is written into a preallocated sparse fullpath.part file, with per-segment progress kept in a fullpath.part.json sidecar. An interrupted download resumes from the sidecar on the next call, as long as the remote size and validators (ETag/Last-Modified) are unchanged. The file is only renamed to fullpath once complete.
+    Servers without range support are downloaded as a single stream, still through the .part file.
+    headers: Extra request headers for the initial probe (i.e. If-None-Match). A 304 response is raised as urllib.error.HTTPError.
+    digests: hashlib algorithms computed while the data arrives, so the file doesn't need to be read again to checksum it.
+    Returns a dict with the final url, size, etag, last_modified and digests of the download. Raises RuntimeError if the download can't be completed.
+    """
+    if headers is None:
+        headers = {}
+    hashes = {alg: hashlib.new(alg) for alg in digests}
+    part_path = fullpath + ".part"
+    state_path = part_path + ".json"
+    # Probe the file size and range support. The final url is used for all ranges, so a mirror redirector sends every segment to the same mirror.
+    size = -1
+    accept_ranges = False
+    final_url = url
+    info = {"url": url, "size": -1, "etag": None, "last_modified": None, "digests": {}}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers, method="HEAD"), timeout=60) as response:
+            final_url = response.geturl()
+            size = int(response.headers.get("Content-Length", -1))
+            accept_ranges = bool(response.headers.get("Accept-Ranges", "").lower() == "bytes")
+            info["etag"] = response.headers.get("ETag")
+            info["last_modified"] = response.headers.get("Last-Modified")
+    except urllib.error.HTTPError as e:
+        # Some servers don't implement HEAD. Fall through to a plain GET.
+        if e.code not in (403, 405, 501):
+            raise
+    info["url"] = final_url
+    info["size"] = size
+
+    # Single stream fallback.
+    if accept_ranges is False or size <= 0:
+        with urllib.request.urlopen(urllib.request.Request(final_url, headers=headers), timeout=60) as response:
+            info["etag"] = response.headers.get("ETag")
+            info["last_modified"] = response.headers.get("Last-Modified")
+            totalsize = int(response.headers.get("Content-Length", -1))
+            count = 0
+            with open(part_path, 'wb') as f:
+                for block in iter(lambda: response.read(blocksize), b""):
+                    f.write(block)
+                    for h in hashes.values():
+                        h.update(block)
+                    count += 1
+                    if totalsize > 0:
+                        dlProgress(count, blocksize, totalsize)
+        info["size"] = os.path.getsize(part_path)
+        info["digests"] = {alg: h.hexdigest() for alg, h in hashes.items()}
+        os.replace(part_path, fullpath)
+        return info
+
+    # Load the sidecar if it belongs to the same remote file.
+    state = None
+    if os.path.isfile(state_path) and os.path.isfile(part_path):
+        try:
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = None
+        if state and (state.get("url") != url or state.get("size") != size or state.get("etag") != info["etag"] or state.get("last_modified") != info["last_modified"]):
+            print("Remote file changed, restarting download of {0}.".format(url))
+            state = None
+    if state is None:
+        nsegments = max(1, min(segments, size // DL_SEGMENT_MINSIZE))
+        seg_size = size // nsegments
+        state = {"url": url, "size": size, "etag": info["etag"], "last_modified": info["last_modified"], "segments": []}
+        for i in range(nsegments):
+            start = i * seg_size
+            end = size - 1 if i == nsegments - 1 else start + seg_size - 1
+            state["segments"].append({"start": start, "end": end, "pos": start})
+        # Preallocate as a sparse file.
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+    else:
+        print("Resuming download of {0}.".format(url))
+
+    # Weak ETags can't be used with If-Range.
+    if_range = info["etag"] if info["etag"] and not info["etag"].startswith("W/") else info["last_modified"]
+    lock = threading.Lock()
+    stop = threading.Event()
+    progress = {"done": sum(seg["pos"] - seg["start"] for seg in state["segments"]), "percent": -1, "saved": time.monotonic()}
+    # Digests must be computed in file order. Blocks landing at the hash cursor are hashed straight from memory. Data that arrived ahead of the cursor (later segments, or a resumed .part file) is read back once the cursor reaches it, which for a fresh download is normally still in the page cache.
+    hash_lock = threading.Lock()
+    hash_state = {"cursor": 0}
+
+    def hash_advance(block_start: int = -1, block: bytes = b""):
+        """Feed a just-written block into the digests if it is next in order, then catch up on data already written past the cursor."""
+        with hash_lock:
+            if block_start == hash_state["cursor"] and block:
+                for h in hashes.values():
+                    h.update(block)
+                hash_state["cursor"] += len(block)
+            fread = None
+            while hashes and hash_state["cursor"] < size:
+                seg = next(seg for seg in state["segments"] if seg["start"] <= hash_state["cursor"] <= seg["end"])
+                available = seg["pos"] - hash_state["cursor"]
+                if available <= 0:
+                    break
+                if fread is None:
+                    fread = open(part_path, 'rb')
+                fread.seek(hash_state["cursor"])
+                data = fread.read(min(available, blocksize))
+                for h in hashes.values():
+                    h.update(data)
+                hash_state["cursor"] += len(data)
+            if fread is not None:
+                fread.close()
+
+    def state_save():
+        """Write the sidecar. Must be called with lock held."""
+        with open(state_path + ".tmp", 'w') as f:
+            json.dump(state, f)
+        os.replace(state_path + ".tmp", state_path)
+        progress["saved"] = time.monotonic()
+
+    def segment_fetch(seg: dict):
+        """Download the remaining bytes of one segment, retrying from the last written byte."""
+        attempts = 0
+        while seg["pos"] <= seg["end"] and not stop.is_set():
+            start_pos = seg["pos"]
+            request = urllib.request.Request(final_url, headers={"Range": "bytes={0}-{1}".format(seg["pos"], seg["end"])})
+            if if_range:
+                request.add_header("If-Range", if_range)
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response, open(part_path, 'r+b', buffering=0) as f:
+                    # A 200 means the remote file changed (If-Range failed) or ranges were ignored.
+                    if response.status != 206:
+                        raise RuntimeError("Server did not honor range request for {0}.".format(url))
+                    f.seek(seg["pos"])
+                    for block in iter(lambda: response.read(blocksize), b""):
+                        if stop.is_set():
+                            return
+                        block = block[:seg["end"] - seg["pos"] + 1]
+                        block_start = seg["pos"]
+                        f.write(block)
+                        with lock:
+                            seg["pos"] += len(block)
+                            progress["done"] += len(block)
+                            percent = int(progress["done"] * 100 / size)
+                            if percent != progress["percent"]:
+                                progress["percent"] = percent
+                                dlProgress(progress["done"], 1, size)
+                            if time.monotonic() - progress["saved"] > 1:
+                                state_save()
+                        hash_advance(block_start, block)
+                        if seg["pos"] > seg["end"]:
+                            break
+            except (urllib.error.URLError, OSError) as e:
+                attempts += 1
+                if attempts > 3:
+                    raise
+                print("\nRetrying segment {0}-{1} of {2} ({3}).".format(seg["pos"], seg["end"], url, e))
+                time.sleep(attempts)
+                continue
+            # A response which ends early is continued from the last written byte, but one without any data counts as a failed attempt.
+            if seg["pos"] == start_pos and not stop.is_set():
+                attempts += 1
+                if attempts > 3:
+                    raise RuntimeError("Server sent no data for bytes {0}-{1} of {2}.".format(seg["pos"], seg["end"], url))
+                print("\nRetrying segment {0}-{1} of {2} (empty response).".format(seg["pos"], seg["end"], url))
+                time.sleep(attempts)
+
+    pending = [seg for seg in state["segments"] if seg["pos"] <= seg["end"]]
+    with lock:
+        state_save()
+    # Hash whatever a previous run already downloaded.
+    hash_advance()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+        futures = [executor.submit(segment_fetch, seg) for seg in pending]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        except BaseException:
+            # Keep the .part file and sidecar so the next run can resume.
+            stop.set()
+            executor.shutdown(wait=True)
+            with lock:
+                state_save()
+            raise
+    if os.path.getsize(part_path) != size or any(seg["pos"] <= seg["end"] for seg in state["segments"]):
+        raise RuntimeError("File {0} was not completely downloaded.".format(fullpath))
+    hash_advance()
+    info["digests"] = {alg: h.hexdigest() for alg, h in hashes.items()}
+    os.replace(part_path, fullpath)
+    os.remove(state_path)
+    return info
+def downloadfile(url, localpath, filename=None, overwrite=False, cache=True, digests: tuple = None, digest_index: str = None, readonly: bool = False):
+    """
+    Retrieve a file and return its fullpath and filename
+    cache: Fetch through the shared download cache (see dlcache_fetch) and link the cached copy into localpath.
+    digests: hashlib algorithms (i.e. ("md5", "sha256")) to compute while downloading. If set, a dict of hex digests is returned as a third item.
+    digest_index: Persistent digest index (see file_digests) used for files which already exist, and updated with the digests of new downloads.
+    readonly: The file is only read (i.e. isos), so a large cached copy may be hardlinked when it can't be reflinked. The file then shares the read-only cache blob, and keeps it from being evicted.
+    """
+    file_hashes = None
     # Get filename for extensions
     fileinfo = urllib.parse.urlparse(url)
     if filename is None:
@@ -67,14 +330,269 @@ def downloadfile(url, localpath, filename=None, overwrite=False):
         os.remove(fullpath)
     # Download the file if it doesn't exist.
     if os.path.isfile(fullpath) is False:
-        # Download the file.
-        print("Downloading {0} from {1}.".format(filename, url))
-        urllib.request.urlretrieve(url, fullpath, reporthook=dlProgress)
+        try:
+            if cache is True and dlcache_enabled():
+                blobpath, entry = dlcache_fetch(url, digests=digests if digests else ())
+                file_link_or_copy(blobpath, fullpath, hardlink=bool(readonly and os.path.getsize(blobpath) >= DLCACHE_LINKMIN))
+                file_hashes = entry["digests"]
+            else:
+                # Download the file.
+                print("Downloading {0} from {1}.".format(filename, url))
+                file_hashes = download_segmented(url, fullpath, digests=digests if digests else ())["digests"]
+        except RuntimeError as e:
+            sys.exit("File {0} not downloaded ({1}). Exiting.".format(filename, e))
         if not os.path.isfile(fullpath):
             sys.exit("File {0} not downloaded. Exiting.".format(filename))
     else:
         print("File {0} already exists. Skipping download.".format(fullpath))
+    if digests:
+        # Files which already existed have to be hashed.
+        if file_hashes is None or any(alg not in file_hashes for alg in digests):
+            file_hashes = file_digests(fullpath, digests, indexpath=digest_index)
+        elif digest_index:
+            digestindex_store(digest_index, fullpath, file_hashes)
+        return (fullpath, filename, {alg: file_hashes[alg] for alg in digests})
     return (fullpath, filename)
+### Download cache ###
+# Content-addressed store shared by every downloadfile() caller. Blobs are stored as objects/<sha256>, and index.json maps each url to its blob plus the validators (ETag/Last-Modified) used to revalidate it.
+DLCACHE_PATH = os.environ.get("CFUNC_DLCACHE", os.path.join(os.path.expanduser("~"), ".cache", "CustomScripts", "downloads"))
+# Size cap of the cache in MB. Least recently used blobs are evicted above this. Set to 0 to disable the cache.
+DLCACHE_MAXBYTES = int(os.environ.get("CFUNC_DLCACHE_MAXMB", 65536)) * 1024 * 1024
+# Read-only downloads (see downloadfile) at least this large are hardlinked out of the cache if a reflink is not possible. Everything else is copied, so that edits, chmod or chown of the file can't modify the cached blob.
+DLCACHE_LINKMIN = 64 * 1024 * 1024
+def dlcache_enabled(cachepath: str = DLCACHE_PATH):
+    """Return True if the download cache can be used."""
+    if DLCACHE_MAXBYTES <= 0:
+        return False
+    try:
+        os.makedirs(os.path.join(cachepath, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(cachepath, "tmp"), exist_ok=True)
+    except OSError:
+        return False
+    return os.access(cachepath, os.W_OK)
+@contextlib.contextmanager
+def dlcache_lock(cachepath: str = DLCACHE_PATH, lockname: str = "index.lock"):
+    """Hold an exclusive lock on the cache index (or another named cache lock) while it is modified."""
+    with open(os.path.join(cachepath, lockname), 'w') as lockfile:
+        if is_windows() is False:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if is_windows() is False:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+def dlcache_index_load(cachepath: str = DLCACHE_PATH):
+    """Load the cache index, which maps urls to cache entries."""
+    index_path = os.path.join(cachepath, "index.json")
+    index = {}
+    if os.path.isfile(index_path):
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            print("WARNING: Download cache index {0} is unreadable, starting a new index.".format(index_path))
+            index = {}
+    # Drop entries whose blob has disappeared.
+    return {url: entry for url, entry in index.items() if os.path.isfile(os.path.join(cachepath, "objects", entry.get("sha256", "")))}
+def dlcache_index_save(index: dict, cachepath: str = DLCACHE_PATH):
+    """Atomically write the cache index."""
+    index_path = os.path.join(cachepath, "index.json")
+    with tempfile.NamedTemporaryFile('w', dir=cachepath, prefix=".index.", delete=False) as f:
+        json.dump(index, f, indent=2)
+    os.replace(f.name, index_path)
+def dlcache_evict(index: dict, cachepath: str = DLCACHE_PATH, maxbytes: int = DLCACHE_MAXBYTES):
+    """Remove least recently used blobs until the cache is under maxbytes. Returns the number of bytes freed."""
+    objects_path = os.path.join(cachepath, "objects")
+    # A blob can be shared by several urls. Its last use is the newest atime of any url pointing to it.
+    blob_atime = {}
+    for entry in index.values():
+        blob_atime[entry["sha256"]] = max(blob_atime.get(entry["sha256"], 0), entry.get("atime", 0))
+    # Blobs which aren't referenced by the index are evicted first.
+    blob_sizes = {}
+    for dirent in os.scandir(objects_path):
+        if dirent.is_file(follow_symlinks=False):
+            blob_sizes[dirent.name] = dirent.stat(follow_symlinks=False).st_size
+    total = sum(blob_sizes.values())
+    freed = 0
+    for sha in sorted(blob_sizes, key=lambda s: blob_atime.get(s, 0)):
+        if total <= maxbytes:
+            break
+        print("Evicting {0} from download cache.".format(sha))
+        try:
+            os.remove(os.path.join(objects_path, sha))
+        except OSError:
+            continue
+        total -= blob_sizes[sha]
+        freed += blob_sizes[sha]
+        for url in [u for u, e in index.items() if e["sha256"] == sha]:
+            del index[url]
+    return freed
+def dlcache_fetch(url: str, cachepath: str = DLCACHE_PATH, digests: tuple = ()):
+    """
+    Return the cached blob path and cache entry for a url, downloading or revalidating it as needed.
+    Existing entries are revalidated with If-None-Match/If-Modified-Since, and a 304 response reuses the blob. If the server can't be reached, the cached blob is used as-is.
+    digests: Extra hashlib algorithms to record in entry["digests"]. They are computed during the download and stored in the index, so later hits return them without reading the blob.
+    """
+    algorithms = tuple(dict.fromkeys(("sha256",) + tuple(digests)))
+    # Partial downloads are kept under a name derived from the url, so an interrupted download resumes on the next run.
+    urlkey = hashlib.sha256(url.encode()).hexdigest()
+    tmp_path = os.path.join(cachepath, "tmp", urlkey)
+    # Hold a per-url lock, so concurrent runs wait for one download instead of fetching the same file twice.
+    with dlcache_lock(cachepath, lockname=os.path.join("tmp", urlkey + ".lock")):
+        with dlcache_lock(cachepath):
+            entry = dlcache_index_load(cachepath).get(url)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        downloaded = False
+        try:
+            print("Fetching {0} through download cache.".format(url))
+            info = download_segmented(url, tmp_path, headers=headers, digests=algorithms)
+            entry = {"sha256": info["digests"]["sha256"],
+                     "size": os.path.getsize(tmp_path),
+                     "etag": info["etag"],
+                     "last_modified": info["last_modified"],
+                     "digests": info["digests"]}
+            downloaded = True
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry:
+                print("Cached copy of {0} is current.".format(url))
+            else:
+                raise
+        except urllib.error.URLError as e:
+            if entry:
+                print("WARNING: Unable to revalidate {0} ({1}). Using cached copy.".format(url, e.reason))
+            else:
+                raise
+        blobpath = os.path.join(cachepath, "objects", entry["sha256"])
+        if downloaded:
+            if os.path.isfile(blobpath):
+                # Identical content is already stored (i.e. from a mirror url).
+                os.remove(tmp_path)
+            else:
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, blobpath)
+    # Entries from before a digest was requested are hashed once, and the result is kept in the index.
+    entry.setdefault("digests", {"sha256": entry["sha256"]})
+    missing = [alg for alg in algorithms if alg not in entry["digests"]]
+    if missing:
+        entry["digests"].update(file_digests(blobpath, tuple(missing)))
+    entry["atime"] = time.time()
+    with dlcache_lock(cachepath):
+        index = dlcache_index_load(cachepath)
+        index[url] = entry
+        # Don't evict the blob which was just requested.
+        dlcache_evict(index, cachepath, max(DLCACHE_MAXBYTES, entry["size"]))
+        dlcache_index_save(index, cachepath)
+    return (blobpath, entry)
+def file_link_or_copy(src: str, dest: str, hardlink: bool = True):
+    """
+    Place src at dest without copying data where possible.
+    Tries a reflink (copy-on-write clone), then a hardlink if allowed, then falls back to a normal copy. Returns the method used.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    # Reflink using the FICLONE ioctl (btrfs, xfs).
+    if platform.system() == "Linux":
+        try:
+            with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+                fcntl.ioctl(fdest.fileno(), 0x40049409, fsrc.fileno())
+            shutil.copymode(src, dest)
+            os.chmod(dest, os.stat(dest).st_mode | 0o200)
+            return "reflink"
+        except OSError:
+            if os.path.isfile(dest):
+                os.remove(dest)
+    if hardlink is True:
+        try:
+            os.link(src, dest)
+            return "hardlink"
+        except OSError:
+            pass
+    shutil.copyfile(src, dest)
+    return "copy"
+def file_copy_sparse(src: str, dest: str):
+    """
+    Copy a file, keeping holes in sparse files (i.e. disk images). Metadata is copied like shutil.copy2.
+    Tries a reflink first. Otherwise only the data regions (found with SEEK_DATA/SEEK_HOLE) are copied, using copy_file_range where available. Returns the method used.
+    """
+    if os.path.lexists(dest):
+        os.remove(dest)
+    # Positional reads are not available on Windows.
+    if not hasattr(os, "pread"):
+        shutil.copy2(src, dest)
+        return "copy"
+    method = "sparse"
+    with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+        src_fd = fsrc.fileno()
+        dest_fd = fdest.fileno()
+        if platform.system() == "Linux":
+            try:
+                fcntl.ioctl(dest_fd, 0x40049409, src_fd)
+                method = "reflink"
+            except OSError:
+                pass
+        if method != "reflink":
+            size = os.fstat(src_fd).st_size
+            pos = 0
+            while pos < size:
+                # Find the next data region. Without SEEK_DATA support, the whole file is data.
+                try:
+                    data_start = os.lseek(src_fd, pos, os.SEEK_DATA)
+                    data_end = os.lseek(src_fd, data_start, os.SEEK_HOLE)
+                except AttributeError:
+                    data_start, data_end = pos, size
+                except OSError as e:
+                    # ENXIO means there is no more data, only a hole to the end.
+                    if e.errno == errno.ENXIO:
+                        break
+                    data_start, data_end = pos, size
+                offset = data_start
+                while offset < data_end:
+                    count = min(data_end - offset, 64 * 1024 * 1024)
+                    copied = 0
+                    if method == "sparse" and hasattr(os, "copy_file_range"):
+                        try:
+                            copied = os.copy_file_range(src_fd, dest_fd, count, offset, offset)
+                        except OSError:
+                            # Not supported between these filesystems, use read/write from now on.
+                            method = "sparse-rw"
+                    if not copied:
+                        chunk = os.pread(src_fd, min(count, 8 * 1024 * 1024), offset)
+                        if not chunk:
+                            break
+                        copied = os.pwrite(dest_fd, chunk, offset)
+                    offset += copied
+                pos = data_end
+            # Holes at the end of the file are kept by setting the size.
+            fdest.truncate(size)
+    shutil.copystat(src, dest)
+    return method
+def file_move(src: str, dest: str):
+    """Move a file. It is renamed on the same filesystem, otherwise copied with file_copy_sparse and removed. Returns the method used."""
+    try:
+        os.replace(src, dest)
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    method = file_copy_sparse(src, dest)
+    os.remove(src)
+    return method
+def tree_move(src: str, dest: str):
+    """Move a folder. It is renamed on the same filesystem, otherwise copied with file_copy_sparse and removed."""
+    try:
+        os.rename(src, dest)
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    shutil.copytree(src, dest, symlinks=True, copy_function=file_copy_sparse)
+    shutil.rmtree(src)
+    return "copy"
 def find_pattern_infile(file, find, printlines=False):
     """Find a pattern in a signle file"""
     abs_file = os.path.abspath(file)
@@ -94,14 +612,42 @@ def find_replace(directory, find, replace, filePattern):
     Find and replace recursively.
     https://stackoverflow.com/questions/4205854/python-way-to-recursively-find-and-replace-string-in-text-files
     """
+    return find_replace_many(directory, {find: replace}, filePattern)
+def find_replace_many(directory, mapping: dict, patterns="*"):
+    """
+    Find and replace several strings recursively, in a single pass over the tree.
+    mapping: Dict of find strings to replacement strings. All of them are matched by one regex, so a replacement is never substituted again.
+    patterns: fnmatch pattern, or list of patterns, for the filenames to edit.
+    Binary files are skipped, and a file is only rewritten (atomically) if its content changed. Returns the number of files changed.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    if not mapping:
+        return 0
+    mapping_bytes = {k.encode(): v.encode() for k, v in mapping.items()}
+    # Longest strings first, so a find string that is a prefix of another doesn't win.
+    find_regex = re.compile(b"|".join(re.escape(k) for k in sorted(mapping_bytes, key=len, reverse=True)))
+    changed = 0
     for walkresult in os.walk(os.path.abspath(directory)):
-        for filename in fnmatch.filter(walkresult[2], filePattern):
+        for filename in walkresult[2]:
+            if not any(fnmatch.fnmatch(filename, p) for p in patterns):
+                continue
             filepath = os.path.join(walkresult[0], filename)
-            with open(filepath) as f:
-                s = f.read()
-            s = s.replace(find, replace)
-            with open(filepath, "w") as f:
-                f.write(s)
+            if os.path.islink(filepath) or not os.path.isfile(filepath):
+                continue
+            with open(filepath, 'rb') as f:
+                content = f.read()
+            if b"\0" in content[:8192]:
+                continue
+            new_content = find_regex.sub(lambda m: mapping_bytes[m.group(0)], content)
+            if new_content == content:
+                continue
+            with tempfile.NamedTemporaryFile('wb', dir=walkresult[0], prefix=".{0}.".format(filename), delete=False) as f:
+                f.write(new_content)
+            shutil.copymode(filepath, f.name)
+            os.replace(f.name, filepath)
+            changed += 1
+    return changed
 def gitclone(url, destination):
     """If destination exists, do a git pull, otherwise git clone"""
     abs_dest = os.path.abspath(destination)
@@ -126,13 +672,16 @@ def log_config(logfile_path):
             logging.FileHandler(logfile_path, 'w'),
             logging.StreamHandler()
         ])
-def log_subprocess_output(pipe):
-    """Log piped output"""
+def log_subprocess_output(pipe, line_callback=None):
+    """Log piped output. line_callback is called with each decoded line as it arrives."""
     # b'\n'-separated lines
     for line in iter(pipe.readline, b''):
         # Remove the newlines and decode.
-        logging.info('%s', line.strip().decode(errors="ignore"))
-def subpout_logger(cmd: str = None, cmd_list: list = None, suppress_out: bool = False):
+        line = line.strip().decode(errors="ignore")
+        logging.info('%s', line)
+        if line_callback:
+            line_callback(line)
+def subpout_logger(cmd: str = None, cmd_list: list = None, suppress_out: bool = False, line_callback=None):
     """Run command which will output stdout to logger"""
     stdout_opt = subprocess.PIPE
     stderr_opt = subprocess.STDOUT
@@ -149,7 +698,7 @@ def subpout_logger(cmd: str = None, cmd_list: list = None, suppress_out: bool =
         process = subprocess.Popen(cmd, stdout=stdout_opt, stderr=stderr_opt, shell=True)
     if suppress_out is False:
         with process.stdout:
-            log_subprocess_output(process.stdout)
+            log_subprocess_output(process.stdout, line_callback)
     exitcode = process.wait()
     if process.returncode != 0 and suppress_out is False:
         print("ERROR: {0} has non-zero return code.".format(cmd))
@@ -300,6 +849,7 @@ def demote(user_uid, user_gid):
     return result
 def run_as_user(user_name, cmd: str = None, cmd_list: list = None, shell_cmd=None, error_on_fail=False):
     """Run a command as the specified username."""
+    package_batch_flush()
     cwd = os.getcwd()
     pw_record = pwd.getpwnam(user_name)
     user_name = pw_record.pw_name
@@ -325,48 +875,102 @@ def run_as_user(user_name, cmd: str = None, cmd_list: list = None, shell_cmd=Non
     return process.returncode
 def run_as_user_su(user_name, cmd, shell_cmd="/bin/sh", error_on_fail=False):
     """Run a command as the specified username using the su command."""
+    package_batch_flush()
     process = subprocess.run(["su", "-l", user_name, "-s", shell_cmd, "-c", cmd], check=error_on_fail)
     return process.returncode
+def tree_metadata_apply(path: str, uid: int = -1, gid: int = -1, mode_func=None, workers: int = None):
+    """
+    Recursively apply ownership and/or permissions to a path, returning counts of changed, skipped and failed entries.
+    uid, gid: Owner to set, or -1 to leave unchanged.
+    mode_func: Function mapping an entry's current st_mode to the desired permission bits, or None to leave permissions unchanged.
+    Directories are listed with os.scandir, and changes are made relative to the directory fd without following symlinks. Entries whose owner and mode already match (from the scandir stat) are skipped. Subtrees are spread across a thread pool.
+    """
+    if workers is None:
+        workers = min(16, (os.cpu_count() or 1) * 2)
+
+    def entry_apply(name: str, st: os.stat_result, dir_fd: int = None, displaypath: str = None, follow: bool = False):
+        """Apply the owner and mode to one entry. follow changes the target of a symlink instead of the link. Returns (changed, skipped, failed)."""
+        if displaypath is None:
+            displaypath = name
+        is_link = stat.S_ISLNK(st.st_mode)
+        changed = False
+        try:
+            if (uid != -1 and st.st_uid != uid) or (gid != -1 and st.st_gid != gid):
+                if follow:
+                    os.chown(name, uid, gid)
+                else:
+                    os.chown(name, uid, gid, dir_fd=dir_fd, follow_symlinks=False)
+                changed = True
+        except OSError:
+            print("ERROR, chown failed for {0}".format(displaypath))
+            return (0, 0, 1)
+        # Symlink permissions can't be changed on Linux, and chmod would modify the link target.
+        if mode_func is not None and not is_link:
+            new_mode = mode_func(st.st_mode)
+            if stat.S_IMODE(st.st_mode) != new_mode:
+                try:
+                    os.chmod(name, new_mode, dir_fd=dir_fd)
+                    changed = True
+                except OSError:
+                    print("ERROR, chmod {0:o} failed for {1}".format(new_mode, displaypath))
+                    return (0, 0, 1)
+        return (1, 0, 0) if changed else (0, 1, 0)
+
+    def directory_apply(dirpath: str):
+        """Apply to the contents of one directory. Returns the counts and the subdirectories to descend into."""
+        counts = [0, 0, 0]
+        subdirs = []
+        try:
+            dir_fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+        except OSError:
+            print("ERROR, unable to open {0}".format(dirpath))
+            return (counts, subdirs)
+        try:
+            with os.scandir(dir_fd) as it:
+                for dirent in it:
+                    try:
+                        st = dirent.stat(follow_symlinks=False)
+                    except OSError:
+                        counts[2] += 1
+                        continue
+                    result = entry_apply(dirent.name, st, dir_fd, os.path.join(dirpath, dirent.name))
+                    counts = [a + b for a, b in zip(counts, result)]
+                    if stat.S_ISDIR(st.st_mode):
+                        subdirs.append(os.path.join(dirpath, dirent.name))
+        finally:
+            os.close(dir_fd)
+        return (counts, subdirs)
+
+    # The top level path is followed if it is a symlink, like chown/chmod on the command line.
+    counts = list(entry_apply(path, os.stat(path), follow=True))
+    if os.path.isdir(path):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(directory_apply, os.path.realpath(path))}
+            while futures:
+                done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    dir_counts, subdirs = future.result()
+                    counts = [a + b for a, b in zip(counts, dir_counts)]
+                    for subdir in subdirs:
+                        futures.add(executor.submit(directory_apply, subdir))
+    return {"changed": counts[0], "skipped": counts[1], "failed": counts[2]}
 def chown_recursive(path, user_name, group_name):
-    """Recursive chown."""
+    """Recursive chown. Returns counts of changed, skipped and failed entries."""
     print("Running chown on {0}.".format(path))
     uid = pwd.getpwnam(user_name).pw_uid
     gid = grp.getgrnam(group_name).gr_gid
-    os.chown(path, uid, gid)
-    # Drill down into the folder if it is a folder.
-    if os.path.isdir(path):
-        for dirpath, dirnames, filenames in os.walk(path):
-            for dname in dirnames:
-                try:
-                    os.chown(os.path.join(dirpath, dname), uid, gid)
-                except:
-                    print("ERROR, chown failed for {0}".format(os.path.join(dirpath, dname)))
-            for fname in filenames:
-                try:
-                    os.chown(os.path.join(dirpath, fname), uid, gid)
-                except:
-                    print("ERROR, chown failed for {0}".format(os.path.join(dirpath, fname)))
-    return
+    counts = tree_metadata_apply(path, uid=uid, gid=gid)
+    print("chown {0}: {1} changed, {2} unchanged, {3} failed.".format(path, counts["changed"], counts["skipped"], counts["failed"]))
+    return counts
 def chmod_recursive(path, mode: oct):
     """
-    Recursive chmod.
+    Recursive chmod. Returns counts of changed, skipped and failed entries.
     mode: octal mode for chmod
     """
     print("Running chmod on {0}.".format(path))
-    os.chmod(path, mode)
-    # Drill down into the folder if it is a folder.
-    if os.path.isdir(path):
-        for dirpath, dirnames, filenames in os.walk(path):
-            for dname in dirnames:
-                try:
-                    os.chmod(os.path.join(dirpath, dname), mode)
-                except:
-                    print("ERROR, chmod {0} failed for {1}".format(mode, os.path.join(dirpath, dname)))
-            for fname in filenames:
-                try:
-                    os.chmod(os.path.join(dirpath, fname), mode)
-                except:
-                    print("ERROR, chmod {0} failed for {1}".format(mode, os.path.join(dirpath, fname)))
+    counts = tree_metadata_apply(path, mode_func=lambda st_mode: mode)
+    print("chmod {0}: {1} changed, {2} unchanged, {3} failed.".format(path, counts["changed"], counts["skipped"], counts["failed"]))
+    return counts
 def chmod_mask(path: str, mask: oct, and_mask: bool = False):
     """
     AND/OR a chmod mask on an individual file/folder.
@@ -384,19 +988,17 @@ def chmod_mask(path: str, mask: oct, and_mask: bool = False):
         print("ERROR, chmod {0:o} failed for {1}".format(mask, path))
 def chmod_recursive_mask(path: str, mask: oct, and_mask: bool = False):
     """
-    AND/OR a chmod mask recursively.
+    AND/OR a chmod mask recursively. Returns counts of changed, skipped and failed entries.
     mask: Bit mask to merge into the file mode
     and_mask: AND the mask into the file mode if True, OR if False.
     """
     print("Running chmod on {0}.".format(path))
-    chmod_mask(path, mask, and_mask)
-    # Drill down into the folder if it is a folder.
-    if os.path.isdir(path):
-        for dirpath, dirnames, filenames in os.walk(path):
-            for dname in dirnames:
-                chmod_mask(os.path.join(dirpath, dname), mask, and_mask)
-            for fname in filenames:
-                chmod_mask(os.path.join(dirpath, fname), mask, and_mask)
+    if and_mask:
+        counts = tree_metadata_apply(path, mode_func=lambda st_mode: stat.S_IMODE(st_mode) & mask)
+    else:
+        counts = tree_metadata_apply(path, mode_func=lambda st_mode: stat.S_IMODE(st_mode) | mask)
+    print("chmod {0}: {1} changed, {2} unchanged, {3} failed.".format(path, counts["changed"], counts["skipped"], counts["failed"]))
+    return counts
 ### Systemd Functions ###
 def sysctl_isrunning() -> bool:
     status = False
@@ -407,12 +1009,14 @@ def sysctl_isrunning() -> bool:
     return status
 def sysctl_enable(options: str, now: bool = False, error_on_fail: bool = False):
     """Enable systemctl services"""
+    package_batch_flush()
     sysctl_cmd = "systemctl enable {0}".format(options)
     if now is True and sysctl_isrunning() is True:
         sysctl_cmd += " --now"
     subprocess.run(sysctl_cmd, shell=True, check=error_on_fail)
 def sysctl_disable(options, now: bool = False, error_on_fail: bool = False):
     """Disable systemctl services"""
+    package_batch_flush()
     sysctl_cmd = "systemctl disable {0}".format(options)
     if now is True and sysctl_isrunning() is True:
         sysctl_cmd += " --now"
@@ -487,6 +1091,7 @@ def detectdistro():
     return (lsb_distro, lsb_release)
 def AddUserToGroup(group, username=None):
     """Add a given user to a single given group."""
+    package_batch_flush()
     # Detect user if not passed.
     if username is None:
         usertuple = getnormaluser()
@@ -597,32 +1202,221 @@ def json_configwrite(json_data: list, json_path: str, print_json: bool = False):
             json.dump(json_data, f, indent=2)
     else:
         print("ERROR: {0} config path missing. Not writing config.".format(dirname))
+# Installed package index
+# Names of installed packages for each package manager. The index is loaded on first use and dropped after every transaction, so re-running a provisioning script does not invoke the package manager for packages it already installed.
+pkgindex_state = {"installed": {}, "skipped": 0}
+pkgindex_commands = {
+    "dnf": "rpm -qa --queryformat '%{NAME}\\n'",
+    "apt": "dpkg-query -W -f='${db:Status-Status} ${Package}\\n'",
+    "pacman": "pacman -Qq",
+    "apk": "apk info",
+    "zypper": "zypper --quiet --no-refresh search --installed-only --type package",
+}
+def package_index_installed(manager: str):
+    """Return the set of installed package names for a package manager, or None if they could not be listed."""
+    if manager not in pkgindex_state["installed"]:
+        installed = None
+        if manager in pkgindex_commands:
+            result = subprocess.run(pkgindex_commands[manager], shell=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=False)
+            if result.returncode == 0:
+                installed = set()
+                for line in result.stdout.splitlines():
+                    if manager == "apt":
+                        # Only count fully installed packages, not removed packages with leftover config files.
+                        status, _, name = line.partition(" ")
+                        if status == "installed":
+                            installed.add(name)
+                    elif manager == "zypper":
+                        # Table rows are: status | name | summary | type
+                        columns = [column.strip() for column in line.split("|")]
+                        if len(columns) >= 2 and columns[0].startswith("i"):
+                            installed.add(columns[1])
+                    elif line.strip():
+                        installed.add(line.strip())
+        pkgindex_state["installed"][manager] = installed
+    return pkgindex_state["installed"][manager]
+def package_index_invalidate(manager: str = None):
+    """Drop the installed package index, so it is reloaded on next use."""
+    if manager is None:
+        pkgindex_state["installed"] = {}
+    else:
+        pkgindex_state["installed"].pop(manager, None)
+def package_index_filter(manager: str, packages: str):
+    """
+    Remove installed packages from an install command line. Returns the remaining arguments, or None if everything is already installed.
+    Options, groups, files, urls and anything that is not a plain package name are always kept.
+    """
+    installed = package_index_installed(manager)
+    if not installed:
+        return packages
+    kept = []
+    skipped = []
+    for token in packages.split():
+        if not token.startswith("-") and re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9_.+-]*", token) and token in installed:
+            skipped.append(token)
+        else:
+            kept.append(token)
+    if not skipped:
+        return packages
+    pkgindex_state["skipped"] += len(skipped)
+    print("Already installed, skipping: {0}".format(" ".join(skipped)))
+    if all(token.startswith("-") for token in kept):
+        return None
+    return " ".join(kept)
+def package_index_summary():
+    """Print how many package installs were skipped because they were already installed."""
+    print("Skipped {0} already installed package(s).".format(pkgindex_state["skipped"]))
+    return pkgindex_state["skipped"]
+# Package install batching
+# While a batch is active, dnfinstall/aptinstall/pacman_install queue their packages instead of running the package manager. The queue is installed in as few transactions as possible when the batch ends, or when a barrier flushes it.
+pkgbatch_state = {"depth": 0, "flushing": False, "queue": []}
+@contextlib.contextmanager
+def package_batch():
+    """
+    Batch package installs within a block.
+    Example:
+    with CFunc.package_batch():
+        CFunc.dnfinstall("git")
+        CFunc.dnfinstall("--allowerasing ffmpeg")
+    Anything in the block which needs a queued package to already be installed must call package_batch_flush() first. Functions in this module which change repositories or depend on installed packages (i.e. aptupdate, sysctl_enable, run_as_user) flush automatically.
+    """
+    pkgbatch_state["depth"] += 1
+    try:
+        yield
+    except BaseException:
+        pkgbatch_state["depth"] -= 1
+        if pkgbatch_state["depth"] == 0 and pkgbatch_state["queue"]:
+            print("Discarding {0} queued package installs due to an error.".format(len(pkgbatch_state["queue"])))
+            pkgbatch_state["queue"] = []
+        raise
+    pkgbatch_state["depth"] -= 1
+    if pkgbatch_state["depth"] == 0:
+        package_batch_flush()
+def pkgbatch_is_barrier(args: str):
+    """Return True if an install must run on its own, because later installs may need it (urls, local package files, repo release packages), or it uses shell syntax."""
+    for token in args.split():
+        if "://" in token or "$" in token or token.endswith((".rpm", ".deb", ".pkg.tar.zst")) or "-release" in token:
+            return True
+    return False
+def pkgbatch_queue_add(manager: str, args: str, error_on_fail: bool):
+    """Queue an install if a batch is active. Returns True if queued, False if the caller should install now."""
+    if pkgbatch_state["depth"] == 0 or pkgbatch_state["flushing"] is True:
+        return False
+    if pkgbatch_is_barrier(args):
+        package_batch_flush()
+        return False
+    print("Queueing {0} for {1}.".format(args, manager))
+    pkgbatch_state["queue"].append({"manager": manager, "args": args, "error_on_fail": error_on_fail})
+    return True
+def pkgbatch_run(manager: str, args: str):
+    """Run an install immediately, bypassing the batch. Returns the exit status."""
+    if manager == "dnf":
+        return dnfinstall(args, error_on_fail=False)
+    if manager == "apt":
+        return aptinstall(args, error_on_fail=False)
+    return pacman_install(args, error_on_fail=False)
+# Options which take their value as the next argument. Their values are kept with the options, instead of being read as package names.
+pkgbatch_option_values = {
+    "apt": ("-t", "--target-release", "--default-release", "-o", "--option", "-c", "--config-file"),
+    "dnf": ("--repo", "--repoid", "--enablerepo", "--disablerepo", "--setopt", "--releasever", "--exclude", "-x", "--installroot", "--forcearch", "-c", "--config"),
+    "pacman": ("--overwrite", "--ignore", "--ignoregroup", "--assume-installed", "--dbpath", "-b", "--root", "-r", "--cachedir", "--config"),
+}
+def pkgbatch_split(manager: str, args: str):
+    """Split install arguments into a tuple of options (with their values) and a list of packages."""
+    options = []
+    packages = []
+    tokens = args.split()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.startswith("-"):
+            options.append(token)
+            if token in pkgbatch_option_values.get(manager, ()) and i + 1 < len(tokens):
+                i += 1
+                options.append(tokens[i])
+        else:
+            packages.append(token)
+        i += 1
+    return tuple(options), packages
+def package_batch_flush():
+    """
+    Install all queued packages.
+    Consecutive queued installs for the same package manager with the same options are merged into one transaction, so installs still run in the order they were requested. If a merged transaction fails, its packages are installed one at a time to find the ones that fail. A failing package from an install with error_on_fail set raises CalledProcessError, like an unbatched install.
+    """
+    if not pkgbatch_state["queue"] or pkgbatch_state["flushing"] is True:
+        return
+    queue = pkgbatch_state["queue"]
+    pkgbatch_state["queue"] = []
+    pkgbatch_state["flushing"] = True
+    try:
+        # Merge runs of installs with the same package manager and options.
+        transactions = []
+        for item in queue:
+            options, packages = pkgbatch_split(item["manager"], item["args"])
+            if not transactions or transactions[-1]["manager"] != item["manager"] or transactions[-1]["options"] != options:
+                transactions.append({"manager": item["manager"], "options": options, "packages": {}})
+            transaction = transactions[-1]
+            for pkg in packages:
+                transaction["packages"][pkg] = transaction["packages"].get(pkg, False) or item["error_on_fail"]
+        print("\nInstalling {0} queued installs as {1} transaction(s).".format(len(queue), len(transactions)))
+        for transaction in transactions:
+            manager = transaction["manager"]
+            options = transaction["options"]
+            packages = list(transaction["packages"])
+            if not packages:
+                continue
+            status = pkgbatch_run(manager, " ".join(options + tuple(packages)))
+            if status == 0:
+                continue
+            print("\nBatched {0} install failed. Installing packages individually.".format(manager))
+            failed = []
+            for pkg in packages:
+                if pkgbatch_run(manager, " ".join(options + (pkg,))) != 0:
+                    failed.append(pkg)
+            if failed:
+                print("ERROR: Failed to install {0} using {1}.".format(" ".join(failed), manager))
+            required = [pkg for pkg in failed if transaction["packages"][pkg] is True]
+            if required:
+                raise subprocess.CalledProcessError(status, "{0} install {1}".format(manager, " ".join(required)))
+    finally:
+        pkgbatch_state["flushing"] = False
 # Apt
 def aptupdate():
     """Update apt sources"""
+    package_batch_flush()
     cmd = "apt"
     if shutil.which("nala"):
         cmd = "nala"
     subprocess.run(f"{cmd} update", shell=True, check=True)
 def aptdistupg():
     """Upgrade/Dist-Upgrade system using apt"""
+    package_batch_flush()
     cmd = "apt"
     if shutil.which("nala"):
         cmd = "nala"
     print(f"\nPerforming full-upgrade using {cmd}.")
+    package_index_invalidate("apt")
     subprocess.run(f"{cmd} full-upgrade -y --update", shell=True, check=True)
 def aptinstall(aptapps, error_on_fail=True):
     """Install application(s) using apt"""
+    if pkgbatch_queue_add("apt", aptapps, error_on_fail):
+        return 0
+    aptapps = package_index_filter("apt", aptapps)
+    if aptapps is None:
+        return 0
     cmd = "apt"
     if shutil.which("nala"):
         cmd = "nala"
     print(f"\nInstalling {aptapps} using {cmd}.")
+    package_index_invalidate("apt")
     if os.geteuid() == 0:
-        subprocess.run(f"{cmd} install -y {aptapps}", shell=True, check=error_on_fail)
+        status = subprocess.run(f"{cmd} install -y {aptapps}", shell=True, check=error_on_fail).returncode
     else:
-        subprocess.run(f"sudo {cmd} install -y {aptapps}", shell=True, check=error_on_fail)
+        status = subprocess.run(f"sudo {cmd} install -y {aptapps}", shell=True, check=error_on_fail).returncode
+    return status
 def aptmark(aptapps, mark=True):
     """Set or unset apt-mark hold for packages. mark=True for holding, mark=False for unholding."""
+    package_batch_flush()
     if mark is True:
         mark_text = "hold"
     else:
@@ -631,12 +1425,20 @@ def aptmark(aptapps, mark=True):
 # DNF
 def dnfupdate():
     """Update system"""
+    package_batch_flush()
     print("\nPerforming system update.")
+    package_index_invalidate("dnf")
     subprocess.run("dnf update -y", shell=True, check=True)
 def dnfinstall(dnfapps, error_on_fail=True):
     """Install application(s) using dnf"""
+    if pkgbatch_queue_add("dnf", dnfapps, error_on_fail):
+        return 0
+    dnfapps = package_index_filter("dnf", dnfapps)
+    if dnfapps is None:
+        return 0
     status = None
     print("\nInstalling {0} using dnf.".format(dnfapps))
+    package_index_invalidate("dnf")
     if os.geteuid() == 0:
         status = subprocess.run("dnf install -y {0}".format(dnfapps), shell=True, check=error_on_fail).returncode
     else:
@@ -644,23 +1446,33 @@ def dnfinstall(dnfapps, error_on_fail=True):
     return status
 def rpmimport(keyurl):
     """Import a gpg key for rpm."""
+    package_batch_flush()
     subprocess.run("rpm --import {0}".format(keyurl), shell=True, check=True)
 # Pacman
-def pacman_invoke(options: str):
+def pacman_invoke(options: str, error_on_fail: bool = True):
     """Invoke pacman"""
+    package_batch_flush()
     pacman_cmd = "pacman"
-    subprocess.run("{0} --noconfirm {1}".format(pacman_cmd, options), shell=True, check=True)
-def pacman_install(packages: str):
+    package_index_invalidate("pacman")
+    return subprocess.run("{0} --noconfirm {1}".format(pacman_cmd, options), shell=True, check=error_on_fail).returncode
+def pacman_install(packages: str, error_on_fail: bool = True):
     """Install packages with pacman"""
-    pacman_invoke("-S --needed {0}".format(packages))
+    if pkgbatch_queue_add("pacman", packages, error_on_fail):
+        return 0
+    packages = package_index_filter("pacman", packages)
+    if packages is None:
+        return 0
+    return pacman_invoke("-S --needed {0}".format(packages), error_on_fail=error_on_fail)
 # Flatpak
 def flatpak_addremote(remotename, remoteurl):
     """Add a remote to flatpak."""
+    package_batch_flush()
     if shutil.which("flatpak"):
         print("Installing remote {0}.".format(remotename))
         subprocess.run("{0}flatpak remote-add --if-not-exists {1} {2}".format(sudocmd(), remotename, remoteurl), shell=True, check=True)
 def flatpak_install(remote, app):
     """Install application(s) using flatpak using the specified remote."""
+    package_batch_flush()
     if shutil.which("flatpak"):
         print("\nInstalling {0} using flatpak using {1}.".format(app, remote))
         subprocess.run("{0}flatpak install --noninteractive --or-update -y {1} {2}".format(sudocmd(), remote, app), shell=True, check=True)
@@ -672,6 +1484,7 @@ def flatpak_override(app, override):
 # Snap
 def snap_install(app, classic=False):
     """Install application(s) using snap"""
+    package_batch_flush()
     # Options
     snap_classic = ""
     if classic is True:
@@ -146,6 +146,8 @@ def ytdlp_install(install_path: str = os.path.join(os.sep, "usr", "local", "bin"
     """
     Install yt-dlp.
     """
+    # Install queued packages first, since these run outside the package batch.
+    CFunc.package_batch_flush()
     CFunc.downloadfile("https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp", install_path, overwrite=True)
     os.chmod(os.path.join(install_path, "yt-dlp"), 0o755)
     # Symlink youtube-dl
@@ -176,6 +178,7 @@ def nix_standalone_install(username: str, packages: str):
     CNixRootSetup.call_nix_update_user(USERNAMEVAR)
 def topgrade_install(dest_folder: str = os.path.join(os.sep, "usr", "local", "bin")):
     """Install the latest topgrade version from github"""
+    CFunc.package_batch_flush()
     releasejson_link = "https://api.github.com/repos/topgrade-rs/topgrade/tags"
     latestrelease = ""
     # Get the json data from GitHub.
@@ -207,6 +210,7 @@ def topgrade_install(dest_folder: str = os.path.join(os.sep, "usr", "local", "bi
         print(f"ERROR: {dest_folder} does not exist.")
 def gse_script_install(localpath: str = os.path.join(os.sep, "usr", "local", "bin")):
     """ Install gs installer script. """
+    CFunc.package_batch_flush()
     gs_installer = CFunc.downloadfile("https://raw.githubusercontent.com/PedMan/gnome-shell-extension-installer/master/gnome-shell-extension-installer", localpath, overwrite=True)
     os.chmod(gs_installer[0], 0o777)
     return gs_installer[0]
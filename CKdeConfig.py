@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Read and write KDE config (rc) files without kwriteconfig6."""
+
+# Python includes.
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Parsed config files, by path. Edits are kept here until kconfig_flush() writes each file once.
+kconfig_files = {}
+
+### Functions ###
+def kconfig_path(file: str):
+    """Return the path of a KDE config file. Relative names are in the config folder, like kwriteconfig6 --file."""
+    if os.path.isabs(file):
+        return file
+    return os.path.join(os.environ.get("XDG_CONFIG_HOME", os.path.join(os.path.expanduser("~"), ".config")), file)
+def kconfig_escape(value: str):
+    """Escape a value the way KConfig writes it."""
+    escaped = ""
+    for c in value:
+        if c == "\\":
+            escaped += "\\\\"
+        elif c == "\n":
+            escaped += "\\n"
+        elif c == "\t":
+            escaped += "\\t"
+        elif c == "\r":
+            escaped += "\\r"
+        elif ord(c) < 32:
+            escaped += "\\x{0:02x}".format(ord(c))
+        else:
+            escaped += c
+    # Leading and trailing spaces would be stripped when reading.
+    if escaped.startswith(" "):
+        escaped = "\\s" + escaped[1:]
+    if escaped.endswith(" "):
+        escaped = escaped[:-1] + "\\s"
+    return escaped
+def kconfig_unescape(value: str):
+    """Unescape a value read from a KDE config file."""
+    # Unknown escapes (like \; and \, in lists) are kept as they are.
+    escapes = {"s": " ", "t": "\t", "n": "\n", "r": "\r", "\\": "\\"}
+    return re.sub(r"\\(x[0-9a-fA-F]{2}|.)", lambda m: chr(int(m.group(1)[1:], 16)) if len(m.group(1)) == 3 else escapes.get(m.group(1), "\\" + m.group(1)), value)
+def kconfig_split_flags(text: str):
+    """Split trailing [$flags] markers from a key or group header. Returns the text and the set of flag letters."""
+    flags = set()
+    match = re.search(r"(\[\$[a-z]+\])+$", text)
+    if match:
+        flags = set(re.sub(r"[\[\]$]", "", match.group(0)))
+        text = text[:match.start()]
+    return text, flags
+def kconfig_parse(text: str):
+    """
+    Parse the text of a KDE config file.
+    Returns a dict of group tuple to group. Each group has a set of flags and an ordered dict of entries (key to flags and unescaped value). The () group holds entries before the first header.
+    """
+    groups = {(): {"flags": set(), "entries": {}}}
+    group = groups[()]
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("["):
+            header, flags = kconfig_split_flags(line)
+            if header == "":
+                # A file starting with [$i] is immutable.
+                group["flags"] |= flags
+                continue
+            name = tuple(part for part in header[1:-1].split("]["))
+            group = groups.setdefault(name, {"flags": set(), "entries": {}})
+            group["flags"] |= flags
+        elif "=" in line:
+            key, _, value = line.partition("=")
+            key, flags = kconfig_split_flags(key.strip())
+            group["entries"][key] = {"flags": flags, "value": kconfig_unescape(value.strip())}
+    return groups
+def kconfig_format(groups: dict):
+    """Return the text of a KDE config file for parsed groups."""
+    sections = []
+    for name, group in groups.items():
+        lines = []
+        flags = "[${0}]".format("".join(sorted(group["flags"]))) if group["flags"] else ""
+        if name:
+            lines.append("[{0}]{1}".format("][".join(name), flags))
+        elif flags:
+            lines.append(flags)
+        for key, entry in group["entries"].items():
+            entry_flags = "[${0}]".format("".join(sorted(entry["flags"]))) if entry["flags"] else ""
+            lines.append("{0}{1}={2}".format(key, entry_flags, kconfig_escape(entry["value"])))
+        if name and not group["entries"]:
+            continue
+        if lines:
+            sections.append("\n".join(lines) + "\n")
+    return "\n".join(sections)
+def kconfig_read(path: str):
+    """Parse a KDE config file. Missing files are empty."""
+    if not os.path.isfile(path):
+        return kconfig_parse("")
+    with open(path, 'r', errors='replace') as f:
+        return kconfig_parse(f.read())
+def kconfig_load(file: str):
+    """Return the cached parsed document for a file, reading it on first use."""
+    path = kconfig_path(file)
+    if path not in kconfig_files:
+        kconfig_files[path] = {"groups": kconfig_read(path), "changed": False}
+    return kconfig_files[path]
+def kconfig_encode(value: str, type: str = "str"):
+    """Convert a value to the text kwriteconfig6 writes for a type. Returns the text and entry flags."""
+    if type == "bool":
+        return ("true" if str(value).strip().lower() in ("true", "on", "yes", "1") else "false"), set()
+    if type == "int":
+        return str(int(value)), set()
+    if type == "double":
+        return str(float(value)), set()
+    if type == "path":
+        home = os.path.expanduser("~")
+        if value == home or value.startswith(home + "/"):
+            value = "$HOME" + value[len(home):]
+        return value, {"e"}
+    return value, set()
+def kconfig_get(file: str, group, key: str):
+    """Get a value from a KDE config file, or None if it is not set."""
+    group = tuple(group) if isinstance(group, (list, tuple)) else (group,)
+    entry = kconfig_load(file)["groups"].get(group, {"entries": {}})["entries"].get(key)
+    return entry["value"] if entry else None
+def kconfig_set(file: str, group, key: str, value: str, type: str = "str"):
+    """
+    Set a value in a KDE config file. The file is written by kconfig_flush().
+    Returns "changed", "unchanged", or "immutable" if the file, group or key is marked [$i].
+    """
+    group = tuple(group) if isinstance(group, (list, tuple)) else (group,)
+    document = kconfig_load(file)
+    groups = document["groups"]
+    # Immutability applies to the file, the group and its parent groups, and the entry.
+    if "i" in groups[()]["flags"] or any("i" in groups.get(group[:n], {"flags": set()})["flags"] for n in range(1, len(group) + 1)):
+        return "immutable"
+    value, flags = kconfig_encode(value, type)
+    entries = groups.setdefault(group, {"flags": set(), "entries": {}})["entries"]
+    entry = entries.get(key)
+    if entry and "i" in entry["flags"]:
+        return "immutable"
+    if entry and entry["value"] == value and entry["flags"] == flags:
+        return "unchanged"
+    entries[key] = {"flags": flags, "value": value}
+    document["changed"] = True
+    return "changed"
+def kconfig_write(path: str, groups: dict):
+    """Write a KDE config file atomically."""
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=folder, prefix=".{0}.".format(os.path.basename(path)), delete=False) as f:
+        f.write(kconfig_format(groups))
+    if os.path.isfile(path):
+        shutil.copymode(path, f.name)
+    os.replace(f.name, path)
+def kconfig_flush(file: str = None):
+    """Write changed config files (or only the given file). Returns the number of files written."""
+    written = 0
+    paths = [kconfig_path(file)] if file else list(kconfig_files)
+    for path in paths:
+        document = kconfig_files.get(path)
+        if document and document["changed"]:
+            kconfig_write(path, document["groups"])
+            document["changed"] = False
+            written += 1
+    return written
+def kconfig_discard(file: str):
+    """Drop cached edits for a file, i.e. before deleting or replacing it."""
+    kconfig_files.pop(kconfig_path(file), None)
+def kconfig_benchmark(keys: int = 300, files: int = 6):
+    """Compare writing a synthetic profile with one process per key against the batched writer."""
+    settings = []
+    for n in range(keys):
+        settings.append(("benchmark{0}rc".format(n % files), ["Group{0}".format(n % 10), "Sub{0}".format(n % 3)], "Key{0}".format(n), "Value {0}\twith tab".format(n)))
+    tool = shutil.which("kwriteconfig6")
+    if tool:
+        fork_cmd = [tool]
+    else:
+        # Without kwriteconfig6, fork this script per key to measure the same process cost.
+        print("kwriteconfig6 not found, forking {0} per key instead.".format(os.path.basename(__file__)))
+        fork_cmd = [sys.executable, os.path.abspath(__file__)]
+    results = {}
+    xdg_config_home = os.environ.get("XDG_CONFIG_HOME")
+    with tempfile.TemporaryDirectory() as tempfolder:
+        env = dict(os.environ, XDG_CONFIG_HOME=os.path.join(tempfolder, "fork"))
+        start = time.perf_counter()
+        for file, group, key, value in settings:
+            cmd = fork_cmd + ["--file", file]
+            for g in group:
+                cmd += ["--group", g]
+            cmd += ["--key", key, value]
+            subprocess.run(cmd, env=env, check=True, stdout=subprocess.DEVNULL)
+        results["fork"] = time.perf_counter() - start
+        os.environ["XDG_CONFIG_HOME"] = os.path.join(tempfolder, "batch")
+        start = time.perf_counter()
+        for file, group, key, value in settings:
+            kconfig_set(file, group, key, value)
+        written = kconfig_flush()
+        results["batch"] = time.perf_counter() - start
+        # Both paths should produce the same settings.
+        mismatches = 0
+        for folder in ("fork", "batch"):
+            kconfig_files.clear()
+            os.environ["XDG_CONFIG_HOME"] = os.path.join(tempfolder, folder)
+            for file, group, key, value in settings:
+                if kconfig_get(file, group, key) != value:
+                    mismatches += 1
+        kconfig_files.clear()
+    if xdg_config_home is None:
+        os.environ.pop("XDG_CONFIG_HOME", None)
+    else:
+        os.environ["XDG_CONFIG_HOME"] = xdg_config_home
+    print("Fork per key: {0} keys in {1:.3f}s ({2:.2f}ms per key)".format(keys, results["fork"], results["fork"] * 1000 / keys))
+    print("Batched: {0} keys in {1:.3f}s ({2:.3f}ms per key), {3} files written".format(keys, results["batch"], results["batch"] * 1000 / keys, written))
+    print("Speedup: {0:.0f}x, mismatched keys: {1}".format(results["fork"] / max(results["batch"], 1e-9), mismatches))
+    return results
+
+
+if __name__ == '__main__':
+    # Get arguments
+    parser = argparse.ArgumentParser(description='Read and write KDE config files. Options match kwriteconfig6/kreadconfig6.')
+    parser.add_argument("--file", help='Config file name (in the config folder) or path.')
+    parser.add_argument("--group", help='Group. Repeat for nested groups.', action="append", default=[])
+    parser.add_argument("--key", help='Key to read or write.')
+    parser.add_argument("--type", help='Type of the value (default: %(default)s)', default="str", choices=["str", "bool", "int", "double", "path"])
+    parser.add_argument("-b", "--benchmark", help='Benchmark fork-per-key writes against batched writes with this many keys.', type=int, nargs="?", const=300)
+    parser.add_argument("value", help='Value to write. If omitted, the current value is printed.', nargs="?")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        kconfig_benchmark(args.benchmark)
+    elif args.file and args.key:
+        # Without --group, use the default group (entries before the first group header).
+        groups = [g for g in args.group if g != "<default>"]
+        if args.value is None:
+            current_value = kconfig_get(args.file, groups, args.key)
+            if current_value is None:
+                sys.exit(1)
+            print(current_value)
+        else:
+            status = kconfig_set(args.file, groups, args.key, args.value, args.type)
+            kconfig_flush()
+            if status == "immutable":
+                print("ERROR, {0} is immutable.".format(args.key))
+                sys.exit(1)
+    else:
+        parser.print_help()
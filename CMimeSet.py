@@ -3,13 +3,19 @@
 
 # Python includes.
 import argparse
+import collections
+import concurrent.futures
+import configparser
 import fnmatch
 import glob
+import json
 import mimetypes
 import os
 import re
+import shutil
 import sys
 import subprocess
+import tempfile
 # Custom includes
 import CFunc
 
@@ -21,6 +27,48 @@ types_archive = "application/x-7z-compressed,application/x-xz-compressed-tar,app
 types_audio = "application/octet-stream,audio/flac,audio/mpeg,audio/ogg,audio/x-m4a"
 types_text = "text/plain,application/x-sh,text/x-python,text/markdown"
 predefine_types = ["archive", "text", "audio"]
+# Bytes read from the start of each file to sniff its type.
+SNIFF_BYTES = 512
+# Magic numbers as (offset, bytes, mime type). The first match wins.
+mime_magic = [
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"PK\x03\x04", "application/zip"),
+    (0, b"PK\x05\x06", "application/zip"),
+    (0, b"\x1f\x8b", "application/gzip"),
+    (0, b"BZh", "application/x-bzip"),
+    (0, b"\xfd7zXZ\x00", "application/x-xz"),
+    (0, b"\x28\xb5\x2f\xfd", "application/zstd"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (0, b"Rar!\x1a\x07", "application/vnd.rar"),
+    (257, b"ustar", "application/x-tar"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"\xff\xfb", "audio/mpeg"),
+    (0, b"\xff\xf3", "audio/mpeg"),
+    (0, b"\xff\xf2", "audio/mpeg"),
+    (8, b"WAVE", "audio/x-wav"),
+    (8, b"AVI ", "video/x-msvideo"),
+    (8, b"WEBP", "image/webp"),
+    (4, b"ftypM4A", "audio/x-m4a"),
+    (4, b"ftypqt", "video/quicktime"),
+    (4, b"ftypheic", "image/heic"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x1a\x45\xdf\xa3", "video/x-matroska"),
+    (0, b"\x7fELF", "application/x-executable"),
+    (0, b"\x00\x00\x01\x00", "image/vnd.microsoft.icon"),
+]
+# Compressed tar types, by compression type.
+mime_compressed_tar = {"application/gzip": "application/x-compressed-tar", "application/x-bzip": "application/x-bzip-compressed-tar", "application/x-xz": "application/x-xz-compressed-tar", "application/zstd": "application/x-zstd-compressed-tar"}
+# Parsed mimeapps.list files in the user config folder, by path, and the ones with unwritten changes. Set "native" to False to use xdg-mime for setting and querying instead.
+mimeapps_state = {"native": True, "configs": {}, "changed": set(), "comments": set()}
+# Index of desktop files in the XDG data folders, built once per process.
+desktop_index_state = {"dirs": None, "index": None}
+DESKTOP_INDEX_PATH = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "CustomScripts", "desktop_index.json")
 
 ### Functions ###
 def Retrieve_XdgDataDir():
@@ -33,15 +81,113 @@ def Retrieve_XdgDataDir():
 def Mime_CheckCmds():
     """Check for required utilities."""
     return CFunc.commands_check(["xdg-mime"], exit_if_fail=False)
-def Mime_Set(mimetype: str, app: str):
-    """Set mime-type."""
-    if Mime_CheckCmds():
+def Mimeapps_Path():
+    """Return the path of the user mimeapps.list."""
+    return os.path.join(os.environ.get("XDG_CONFIG_HOME", os.path.join(os.path.expanduser("~"), ".config")), "mimeapps.list")
+def Mimeapps_Read(path: str):
+    """Parse a mimeapps.list file. Returns None if it can't be parsed."""
+    config = configparser.ConfigParser(interpolation=None, strict=False, delimiters=("=",), comment_prefixes=("#",))
+    # Keys are mime types, which are case sensitive.
+    config.optionxform = str
+    try:
+        config.read(path)
+    except (configparser.Error, UnicodeDecodeError) as e:
+        print("ERROR: unable to parse {0}: {1}".format(path, e))
+        return None
+    return config
+def Mimeapps_Load(path: str = None):
+    """Return a parsed mimeapps.list from the user config folder (the user mimeapps.list by default), reading it on first use. Returns False if it can't be parsed."""
+    if path is None:
+        path = Mimeapps_Path()
+    if path not in mimeapps_state["configs"]:
+        # Don't retry a file which can't be parsed.
+        config = Mimeapps_Read(path)
+        mimeapps_state["configs"][path] = config if config is not None else False
+        # configparser drops comments when writing, so note the files which have them.
+        try:
+            with open(path, 'r', errors='replace') as f:
+                if any(line.lstrip().startswith("#") for line in f):
+                    mimeapps_state["comments"].add(path)
+        except OSError:
+            pass
+    return mimeapps_state["configs"][path]
+def Mimeapps_Write():
+    """Write the changed mimeapps.list files atomically."""
+    for path in sorted(mimeapps_state["changed"]):
+        if path in mimeapps_state["comments"]:
+            print("WARNING: comments in {0} are not kept when it is rewritten.".format(path))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), prefix=".mimeapps.list.", delete=False) as f:
+            mimeapps_state["configs"][path].write(f, space_around_delimiters=False)
+        os.replace(f.name, path)
+    mimeapps_state["changed"] = set()
+def Mimeapps_Desktops():
+    """Return the current desktop names, lowercased, in order of precedence."""
+    return [d.lower() for d in os.environ.get("XDG_CURRENT_DESKTOP", "").split(":") if d]
+def Mimeapps_Files():
+    """
+    List mimeapps.list files in lookup order, following the XDG mime applications spec.
+    https://specifications.freedesktop.org/mime-apps-spec/latest/file.html
+    """
+    config_home = os.path.dirname(Mimeapps_Path())
+    config_dirs = os.environ.get("XDG_CONFIG_DIRS", "/etc/xdg").split(":")
+    data_home = os.environ.get("XDG_DATA_HOME", os.path.join(os.path.expanduser("~"), ".local", "share"))
+    desktops = Mimeapps_Desktops()
+    files = []
+    for folder in [config_home] + config_dirs:
+        files += [os.path.join(folder, "{0}-mimeapps.list".format(d)) for d in desktops]
+        files.append(os.path.join(folder, "mimeapps.list"))
+    for folder in [os.path.join(d, "applications") for d in [data_home] + Retrieve_XdgDataDir()]:
+        files += [os.path.join(folder, "{0}-mimeapps.list".format(d)) for d in desktops]
+        files.append(os.path.join(folder, "mimeapps.list"))
+    return files
+def Mimeapps_Query(mimetype: str):
+    """Return the default application for a mime type from the mimeapps.list files, or None if it isn't set."""
+    for path in Mimeapps_Files():
+        # Use the parsed copy of files being changed.
+        if path in mimeapps_state["configs"]:
+            config = mimeapps_state["configs"][path]
+        elif os.path.isfile(path):
+            config = Mimeapps_Read(path)
+        else:
+            continue
+        if not config or not config.has_option("Default Applications", mimetype):
+            continue
+        # The first installed application in the list is the default.
+        for app in config.get("Default Applications", mimetype).split(";"):
+            if app and FindDesktopFile(app):
+                return app
+    return None
+def Mime_Set(mimetype: str, app: str, write: bool = True):
+    """
+    Set mime-type.
+    With the native backend, write=False only updates the parsed mimeapps.list files, to be written later by Mimeapps_Write().
+    """
+    if mimeapps_state["native"] and Mimeapps_Load():
+        config = Mimeapps_Load()
+        if not config.has_section("Default Applications"):
+            config.add_section("Default Applications")
+        config.set("Default Applications", mimetype, app)
+        mimeapps_state["changed"].add(Mimeapps_Path())
+        # Desktop-specific files in the user config folder take precedence over mimeapps.list, so the type is also set in any which define it.
+        for desktop in Mimeapps_Desktops():
+            path = os.path.join(os.path.dirname(Mimeapps_Path()), "{0}-mimeapps.list".format(desktop))
+            if os.path.isfile(path) and Mimeapps_Load(path) and Mimeapps_Load(path).has_option("Default Applications", mimetype):
+                Mimeapps_Load(path).set("Default Applications", mimetype, app)
+                mimeapps_state["changed"].add(path)
+        if write:
+            Mimeapps_Write()
+    elif Mime_CheckCmds():
         subprocess.run(["xdg-mime", "default", app, mimetype], check=False)
 def Mime_Query(mimetype: str):
     """Query currently set mime-type."""
-    if Mime_CheckCmds():
+    output = None
+    if mimeapps_state["native"]:
+        output = Mimeapps_Query(mimetype)
+    # Fall back to xdg-mime, which also checks the mimeinfo.cache files.
+    if output is None and (shutil.which("xdg-mime") if mimeapps_state["native"] else Mime_CheckCmds()):
         output = subprocess.run(["xdg-mime", "query", "default", mimetype], stdout=subprocess.PIPE, universal_newlines=True, check=False).stdout.strip()
-        print("Mime: {0}\tSetting: {1}".format(mimetype, output))
+    print("Mime: {0}\tSetting: {1}".format(mimetype, output if output else ""))
 def Mime_Set_All(mimes: str, app: str):
     """
     Set all mime-types.
@@ -52,7 +198,10 @@ def Mime_Set_All(mimes: str, app: str):
     else:
         split_mimes = mimes.split(",")
         for mime in split_mimes:
-            Mime_Set(mime, app)
+            Mime_Set(mime, app, write=False)
+        # Write all the types at once.
+        if mimeapps_state["native"] and mimeapps_state["changed"]:
+            Mimeapps_Write()
 def Mime_Query_All(mimes):
     """
     Query all mime-types.
@@ -75,16 +224,89 @@ def HandlePredefines(predefines, app):
         Mime_Set_All(selecteddefine, app)
     # Query types
     Mime_Query_All(selecteddefine)
+def Desktop_Entry_Read(path: str):
+    """Read the Name, Exec and MimeType keys of the [Desktop Entry] group of a desktop file."""
+    entry = {"Name": None, "Exec": None, "MimeType": []}
+    in_group = False
+    try:
+        with open(path, 'r', errors='replace') as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("["):
+                    # Other groups (like actions) come after the main group.
+                    if in_group:
+                        break
+                    in_group = line == "[Desktop Entry]"
+                elif in_group and "=" in line:
+                    key, _, value = line.partition("=")
+                    key = key.strip()
+                    if key in ("Name", "Exec"):
+                        entry[key] = value.strip()
+                    elif key == "MimeType":
+                        entry["MimeType"] = [m for m in value.strip().split(";") if m]
+    except OSError:
+        pass
+    return entry
+def Desktop_Index_Folder(folder: str):
+    """Index the files in an applications folder. Desktop files have their entry, other files are None."""
+    files = {}
+    for f in sorted(os.listdir(folder)):
+        path = os.path.join(folder, f)
+        if os.path.isfile(path):
+            files[f] = Desktop_Entry_Read(path) if f.endswith(".desktop") else None
+    return files
+def Desktop_Index():
+    """
+    Return the desktop file index for the XDG data folders.
+    The index is kept in a cache file, and a folder is only read again when its mtime changes.
+    Returns a dict with "files" (list of paths in search order), "ids" (desktop file name to its first path and entry) and "mimes" (mime type to desktop file names).
+    """
+    xdg_app_folders = [os.path.join(xdg_folder, "applications") for xdg_folder in Retrieve_XdgDataDir()]
+    if desktop_index_state["index"] is not None and desktop_index_state["dirs"] == xdg_app_folders:
+        return desktop_index_state["index"]
+    cache = {}
+    if os.path.isfile(DESKTOP_INDEX_PATH):
+        try:
+            with open(DESKTOP_INDEX_PATH, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+    cache_changed = False
+    index = {"files": [], "ids": {}, "mimes": {}}
+    for folder in xdg_app_folders:
+        if not os.path.isdir(folder):
+            continue
+        mtime = os.stat(folder).st_mtime_ns
+        if folder not in cache or cache[folder].get("mtime") != mtime:
+            cache[folder] = {"mtime": mtime, "files": Desktop_Index_Folder(folder)}
+            cache_changed = True
+        for f, entry in cache[folder]["files"].items():
+            path = os.path.join(folder, f)
+            index["files"].append(path)
+            # The first folder in XDG_DATA_DIRS takes precedence.
+            if entry is None or f in index["ids"]:
+                continue
+            index["ids"][f] = dict(entry, path=path)
+            for mime in entry["MimeType"]:
+                index["mimes"].setdefault(mime, []).append(f)
+    if cache_changed:
+        try:
+            os.makedirs(os.path.dirname(DESKTOP_INDEX_PATH), exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(DESKTOP_INDEX_PATH), prefix=".desktop_index.", delete=False) as f:
+                json.dump(cache, f)
+            os.replace(f.name, DESKTOP_INDEX_PATH)
+        except OSError as e:
+            print("WARNING: unable to write desktop file index {0}: {1}".format(DESKTOP_INDEX_PATH, e))
+    desktop_index_state["dirs"] = xdg_app_folders
+    desktop_index_state["index"] = index
+    return index
+def Desktop_Apps_For_Mime(mimetype: str):
+    """Return the desktop files which can handle a mime type."""
+    return Desktop_Index()["mimes"].get(mimetype, [])
 def LocateDesktopFile(desktop_search_term: str):
     """Search for a desktop file."""
-    desktopref = []
-    XDG_DATA_DIRS = Retrieve_XdgDataDir()
-    for xdg_folder in XDG_DATA_DIRS:
-        xdg_app_folder = os.path.join(xdg_folder, "applications")
-        if os.path.isdir(xdg_app_folder):
-            list_path = [i for i in os.listdir(xdg_app_folder) if os.path.isfile(os.path.join(xdg_app_folder, i))]
-            desktopref += [os.path.join(xdg_app_folder, j) for j in list_path if re.match(fnmatch.translate("*{0}*".format(desktop_search_term)), j, re.IGNORECASE)]
-    return desktopref
+    desktop_regex = re.compile(fnmatch.translate("*{0}*".format(desktop_search_term)), re.IGNORECASE)
+    return [f for f in Desktop_Index()["files"] if desktop_regex.match(os.path.basename(f))]
 def LocateDesktopFileName(desktop_search_term: str):
     """Return either the basename of the desktop file searched, or None."""
     desktop_basename = None
@@ -94,17 +316,124 @@ def LocateDesktopFileName(desktop_search_term: str):
     return desktop_basename
 def FindDesktopFile(desktop_ref: str):
     """Find out if a desktop file exists."""
-    desktopref_exists = False
-    XDG_DATA_DIRS = Retrieve_XdgDataDir()
-    for xdg_folder in XDG_DATA_DIRS:
-        xdg_app_folder = os.path.join(xdg_folder, "applications")
-        if os.path.isdir(xdg_app_folder):
-            if glob.glob(os.path.join(xdg_app_folder, desktop_ref)):
-                desktopref_exists = True
-    return desktopref_exists
-def FindMimeTypes(folder: str = os.getcwd()):
+    index = Desktop_Index()
+    if desktop_ref in index["ids"]:
+        return True
+    # Desktop files are looked up by name, but globs are also accepted.
+    if glob.has_magic(desktop_ref):
+        return any(fnmatch.fnmatchcase(os.path.basename(f), desktop_ref) for f in index["files"])
+    return False
+def Mime_Sniff(filename: str, data: bytes):
+    """Guess the mime type of a file from its first bytes, using the file name to refine container and text types."""
+    guess = mimetypes.guess_type(filename)[0]
+    for offset, magic, mime in mime_magic:
+        if data[offset:offset + len(magic)] == magic:
+            if mime in mime_compressed_tar and ".tar." in filename.lower():
+                return mime_compressed_tar[mime]
+            # Zip is the container for many formats (docx, odt, jar, epub), which are told apart by name.
+            if mime == "application/zip" and guess and guess != mime:
+                return guess
+            # Matroska and webm share the EBML header.
+            if mime == "video/x-matroska" and guess == "video/webm":
+                return guess
+            return mime
+    if data.startswith(b"#!"):
+        shebang = data.split(b"\n", 1)[0]
+        if b"python" in shebang:
+            return "text/x-python"
+        if re.search(rb"\b(ba|da|z|k)?sh\b", shebang):
+            return "application/x-sh"
+    if not data:
+        return "application/x-zerosize"
+    # Text files have no NUL bytes, and decode as UTF-8 (ignoring a character cut off at the end of the read).
+    if b"\x00" not in data:
+        try:
+            data.decode("utf-8")
+            is_text = True
+        except UnicodeDecodeError as e:
+            is_text = e.start >= len(data) - 3
+        if is_text:
+            if guess and (guess.startswith("text/") or guess in ("application/json", "application/xml", "application/x-sh", "application/javascript")):
+                return guess
+            return "text/plain"
+    return guess if guess else "application/octet-stream"
+def Mime_Sniff_File(path: str):
+    """Sniff the mime type of a file with a bounded read. Returns None if it can't be read."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(SNIFF_BYTES)
+    except OSError:
+        return None
+    return Mime_Sniff(os.path.basename(path), data)
+def Mime_Sniff_Tree(folder: str, workers: int = None, chunk: int = 256):
+    """
+    Recursively count the mime types of files in a folder, sniffed from their content.
+    Folders are listed with os.scandir and files are read in chunks across a thread pool, so only the counts are kept in memory. Symlinks are not followed.
+    """
+    if workers is None:
+        workers = min(32, (os.cpu_count() or 1) * 4)
+    counts = collections.Counter()
+    totals = {"files": 0, "unreadable": 0}
+
+    def directory_scan(dirpath: str):
+        """List one folder. Returns the files, the subfolders to descend into, and the number of unreadable entries."""
+        files = []
+        subdirs = []
+        unreadable = 0
+        try:
+            with os.scandir(dirpath) as it:
+                for dirent in it:
+                    try:
+                        if dirent.is_dir(follow_symlinks=False):
+                            subdirs.append(dirent.path)
+                        elif dirent.is_file(follow_symlinks=False):
+                            files.append(dirent.path)
+                    except OSError:
+                        unreadable += 1
+        except OSError:
+            print("ERROR, unable to open {0}".format(dirpath))
+            unreadable += 1
+        return (files, subdirs, unreadable)
+
+    def files_sniff(paths: list):
+        """Count the mime types of a chunk of files."""
+        return collections.Counter(Mime_Sniff_File(path) for path in paths)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(directory_scan, folder)}
+        while futures:
+            done, futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if isinstance(result, collections.Counter):
+                    totals["unreadable"] += result.pop(None, 0)
+                    counts.update(result)
+                    previous_total = totals["files"]
+                    totals["files"] += sum(result.values())
+                    # Show progress for large trees.
+                    if totals["files"] // 10000 > previous_total // 10000:
+                        print("Scanned {0} files, {1} types.".format(totals["files"], len(counts)), flush=True)
+                    continue
+                files, subdirs, unreadable = result
+                totals["unreadable"] += unreadable
+                for subdir in subdirs:
+                    futures.add(executor.submit(directory_scan, subdir))
+                for i in range(0, len(files), chunk):
+                    futures.add(executor.submit(files_sniff, files[i:i + chunk]))
+    return counts, totals
+def FindMimeTypes(folder: str = os.getcwd(), recursive: bool = False):
+    """
+    Print the mime types of files in a folder, and their associations.
+    recursive: Include subfolders, and sniff types from file contents instead of the extensions.
+    """
     mimes = []
-    if os.path.isdir(folder):
+    if recursive and os.path.isdir(folder):
+        counts, totals = Mime_Sniff_Tree(folder)
+        print("\n{0} files, {1} unreadable.".format(totals["files"], totals["unreadable"]))
+        for mime, count in counts.most_common():
+            print("{0}\t{1}".format(count, mime))
+        mimes = list(counts)
+    elif os.path.isdir(folder):
         files = os.listdir(folder)
         for f in files:
             if os.path.isfile(os.path.join(folder, f)):
@@ -129,22 +458,30 @@ if __name__ == '__main__':
     parser.add_argument("-a", "--application", help='Application to set mimetype to (i.e. "org.kde.ark.desktop". Must be used with set options.')
     parser.add_argument("-q", "--query", help='Query mimetypes. (i.e. "application/x-7z-compressed,application/x-xz-compressed-tar")')
     parser.add_argument("-m", "--mimes", help='Check Mimetypes of specified folder.')
+    parser.add_argument("-r", "--recursive", help='With -m, include subfolders and sniff types from file contents.', action="store_true")
     parser.add_argument("-p", "--predefines", help='Set or query predefines. Set when combined with -a flag.', choices=predefine_types)
+    parser.add_argument("-w", "--handlers", help='List desktop files which can handle a mime type.')
+    parser.add_argument("-x", "--xdgmime", help='Use xdg-mime instead of editing mimeapps.list directly.', action="store_true")
     args = parser.parse_args()
 
     # Ensure proper commands are on system.
-    if not Mime_CheckCmds():
-        sys.exit(0)
+    if args.xdgmime:
+        mimeapps_state["native"] = False
+        if not Mime_CheckCmds():
+            sys.exit(0)
 
     # Query command
     if args.query:
         Mime_Query_All(args.query)
+    elif args.handlers:
+        for d in Desktop_Apps_For_Mime(args.handlers):
+            print("{0}\t{1}".format(d, Desktop_Index()["ids"][d]["path"]))
     elif args.locate:
         locatedfiles = LocateDesktopFile(args.locate)
         for f in locatedfiles:
             print(f)
     elif args.mimes:
-        FindMimeTypes(args.mimes)
+        FindMimeTypes(args.mimes, args.recursive)
     # Passed set command
     elif args.set:
         Mime_Set_All(args.set, args.application)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Caching HTTP proxy for package downloads during VM and chroot builds."""
+
+# Python includes.
+import argparse
+import functools
+import hashlib
+import http.server
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Disable buffered stdout (to ensure prints are in order)
+print = functools.partial(print, flush=True)
+
+# Shared package cache. Blobs are stored once by sha256 in objects/, and each url path points to its blob in paths/.
+PKGPROXY_PATH = os.environ.get("CPKGPROXY_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "CustomScripts", "packages"))
+# Published package files never change, so they are served from the cache. Repository metadata changes, and is always fetched.
+pkgproxy_extensions = (".rpm", ".drpm", ".deb", ".udeb", ".pkg.tar.zst", ".pkg.tar.xz", ".pkg.tar.gz", ".apk", ".pkg", ".txz")
+# Request headers which only apply to the connection to the proxy.
+pkgproxy_hop_headers = ("connection", "keep-alive", "proxy-authorization", "proxy-connection", "te", "trailer", "transfer-encoding", "upgrade", "host", "range", "if-range")
+pkgproxy_state = {"cachepath": PKGPROXY_PATH, "lock": threading.Lock(), "stats": {}}
+PKGPROXY_CHUNK = 1024 * 1024
+
+
+### Functions ###
+def proxy_stats_reset():
+    """Reset the proxy counters."""
+    with pkgproxy_state["lock"]:
+        pkgproxy_state["stats"] = {"hits": 0, "misses": 0, "passthrough": 0, "errors": 0, "bytes_saved": 0, "bytes_fetched": 0}
+def proxy_stats_add(**counts):
+    """Add to the proxy counters."""
+    with pkgproxy_state["lock"]:
+        for key, value in counts.items():
+            pkgproxy_state["stats"][key] += value
+def proxy_cacheable(url: str):
+    """Return True if the url is a package file, which can be served from the cache."""
+    path = urllib.parse.urlsplit(url).path
+    if path.endswith(".sig"):
+        path = path[:-4]
+    return path.endswith(pkgproxy_extensions)
+def proxy_path_entry(url: str, cachepath: str):
+    """Return the path of the entry file for a url. The query is not part of the key, since mirrors ignore it for package files."""
+    parts = urllib.parse.urlsplit(url)
+    urlkey = hashlib.sha256("{0}{1}".format(parts.netloc.lower(), parts.path).encode()).hexdigest()
+    return os.path.join(cachepath, "paths", urlkey + ".json")
+def proxy_lookup(url: str, cachepath: str):
+    """Return the cached blob path and size for a url, or None."""
+    entry_path = proxy_path_entry(url, cachepath)
+    try:
+        with open(entry_path, 'r') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    blob_path = os.path.join(cachepath, "objects", entry["sha256"])
+    # A blob with the wrong size was truncated or replaced, and is fetched again.
+    if os.path.isfile(blob_path) and os.path.getsize(blob_path) == entry["size"]:
+        return blob_path, entry["size"]
+    return None
+def proxy_store(url: str, cachepath: str, tmp_path: str, sha256: str, size: int):
+    """Move a downloaded file into the cache, and point the url at it."""
+    blob_path = os.path.join(cachepath, "objects", sha256)
+    # Identical packages from different mirrors share one blob.
+    if os.path.isfile(blob_path) and os.path.getsize(blob_path) == size:
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, blob_path)
+    entry_path = proxy_path_entry(url, cachepath)
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(entry_path), delete=False) as f:
+        json.dump({"url": url, "sha256": sha256, "size": size}, f)
+    os.replace(f.name, entry_path)
+
+
+class ProxyHandler(http.server.BaseHTTPRequestHandler):
+    """Forward proxy request handler. Package files are served from and saved to the cache."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """Requests are counted instead of logged."""
+        return
+
+    def send_stats(self):
+        """Send the counters as json, for requests made directly to the proxy."""
+        with pkgproxy_state["lock"]:
+            body = json.dumps(pkgproxy_state["stats"]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_upstream_error(self, error):
+        """Relay an upstream HTTP error (like a 404 for a package which moved)."""
+        body = error.read() if self.command != "HEAD" else b""
+        self.send_response(error.code)
+        self.send_header("Content-Type", error.headers.get("Content-Type", "text/plain"))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def proxy_request(self):
+        """Handle a GET or HEAD request."""
+        url = self.path
+        if not url.startswith("http://"):
+            if url.split("?")[0] in ("/", "/stats"):
+                self.send_stats()
+            else:
+                self.send_error(400, "Only http proxy requests are supported.")
+            return
+        cachepath = pkgproxy_state["cachepath"]
+        cacheable = self.command == "GET" and proxy_cacheable(url)
+        if cacheable:
+            cached = proxy_lookup(url, cachepath)
+            if cached:
+                blob_path, size = cached
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(size))
+                self.end_headers()
+                with open(blob_path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile, PKGPROXY_CHUNK)
+                proxy_stats_add(hits=1, bytes_saved=size)
+                return
+        # Range requests for package files are fetched whole, so the cached copy is complete.
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in pkgproxy_hop_headers}
+        if not cacheable:
+            for header in ("Range", "If-Range"):
+                if self.headers.get(header):
+                    headers[header] = self.headers[header]
+        request = urllib.request.Request(url, headers=headers, method=self.command)
+        try:
+            response = urllib.request.urlopen(request, timeout=60)
+        except urllib.error.HTTPError as e:
+            proxy_stats_add(errors=1)
+            self.send_upstream_error(e)
+            return
+        except (urllib.error.URLError, OSError) as e:
+            proxy_stats_add(errors=1)
+            self.send_error(502, "Upstream request failed: {0}".format(e))
+            return
+        with response:
+            self.send_response(response.status)
+            for key, value in response.headers.items():
+                if key.lower() not in ("connection", "keep-alive", "transfer-encoding"):
+                    self.send_header(key, value)
+            length = response.headers.get("Content-Length")
+            if length is None and self.command != "HEAD":
+                # Without a length, the end of the body is the end of the connection.
+                self.send_header("Connection", "close")
+                self.close_connection = True
+            self.end_headers()
+            if self.command == "HEAD":
+                return
+            if not cacheable:
+                shutil.copyfileobj(response, self.wfile, PKGPROXY_CHUNK)
+                proxy_stats_add(passthrough=1)
+                return
+            # Stream to the client and the cache at the same time, hashing as it goes.
+            sha256 = hashlib.sha256()
+            size = 0
+            tmp = tempfile.NamedTemporaryFile(dir=os.path.join(cachepath, "tmp"), delete=False)
+            try:
+                with tmp:
+                    while True:
+                        chunk = response.read(PKGPROXY_CHUNK)
+                        if not chunk:
+                            break
+                        tmp.write(chunk)
+                        sha256.update(chunk)
+                        size += len(chunk)
+                        self.wfile.write(chunk)
+                if length is not None and size != int(length):
+                    raise OSError("Short read of {0}: {1} of {2} bytes.".format(url, size, length))
+                proxy_store(url, cachepath, tmp.name, sha256.hexdigest(), size)
+                proxy_stats_add(misses=1, bytes_fetched=size)
+            finally:
+                if os.path.exists(tmp.name):
+                    os.remove(tmp.name)
+
+    def do_GET(self):
+        self.proxy_request()
+
+    def do_HEAD(self):
+        self.proxy_request()
+
+
+def proxy_start(host: str = "127.0.0.1", port: int = 0, cachepath: str = PKGPROXY_PATH):
+    """Start the proxy in a background thread. Port 0 picks a free port. Returns the server, whose port is server.server_address[1]."""
+    for folder in ("objects", "paths", "tmp"):
+        os.makedirs(os.path.join(cachepath, folder), exist_ok=True)
+    pkgproxy_state["cachepath"] = cachepath
+    proxy_stats_reset()
+    server = http.server.ThreadingHTTPServer((host, port), ProxyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print("Package proxy listening on {0}:{1}, caching in {2}".format(host, server.server_address[1], cachepath))
+    return server
+def proxy_stop(server):
+    """Stop a proxy started with proxy_start."""
+    server.shutdown()
+    server.server_close()
+def proxy_report():
+    """Return a summary of the proxy counters."""
+    with pkgproxy_state["lock"]:
+        stats = dict(pkgproxy_state["stats"])
+    requests = stats["hits"] + stats["misses"]
+    ratio = stats["hits"] * 100 / requests if requests else 0
+    return "Package proxy: {0} hits, {1} misses ({2:.1f}% hit ratio), {3:.1f} MiB saved, {4:.1f} MiB fetched, {5} passed through, {6} errors.".format(stats["hits"], stats["misses"], ratio, stats["bytes_saved"] / 1048576, stats["bytes_fetched"] / 1048576, stats["passthrough"], stats["errors"])
+def proxy_host_address(guest_ip: str):
+    """Return the host address on the network used to reach a guest, to bind the proxy where the guest can see it."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        # Connecting a UDP socket sends nothing, but selects the route and source address.
+        s.connect((guest_ip, 22))
+        return s.getsockname()[0]
+
+
+if __name__ == '__main__':
+    # Get arguments
+    parser = argparse.ArgumentParser(description='Caching HTTP proxy for package downloads. Point http_proxy at it in build environments.')
+    parser.add_argument("-a", "--address", help='Address to listen on (default: %(default)s)', default="127.0.0.1")
+    parser.add_argument("-p", "--port", help='Port to listen on (default: %(default)s)', type=int, default=3142)
+    parser.add_argument("-c", "--cachepath", help='Cache folder (default: %(default)s)', default=PKGPROXY_PATH)
+    args = parser.parse_args()
+
+    server = proxy_start(args.address, args.port, os.path.abspath(args.cachepath))
+    print("Use with: export http_proxy=http://{0}:{1}".format(args.address, server.server_address[1]))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        proxy_stop(server)
+        print(proxy_report())
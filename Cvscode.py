@@ -3,14 +3,25 @@
 
 # Python includes.
 import argparse
+import concurrent.futures
 import functools
 import json
+import gzip
 import os
+import re
 import shutil
 import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import zipfile
 # Custom includes
 import CFunc
 
+# Folder of this script
+SCRIPTDIR = os.path.abspath(os.path.dirname(__file__))
+
 # Disable buffered stdout (to ensure prints are in order)
 print = functools.partial(print, flush=True)
 
@@ -25,6 +36,9 @@ parser.add_argument("-t", "--type", help='''Type of configuration. Leave blank f
     4: VSCodium
     5: VSCodium Flatpak
 ''', type=int, default=None)
+parser.add_argument("-c", "--vsixcache", help='Folder of cached extension packages (default: %(default)s). It is copied into VMs with the rest of the scripts.', default=os.environ.get("CVSCODE_VSIXCACHE", os.path.join(SCRIPTDIR, "vsix")))
+parser.add_argument("-s", "--seed", help='Download the extensions into the vsix cache and exit, without installing them.', action="store_true")
+parser.add_argument("-a", "--maxage", help='Days after which a cached extension is downloaded again, if the marketplace can be reached. 0 refreshes every extension (default: %(default)s)', type=float, default=float(os.environ.get("CVSCODE_VSIXMAXAGE", 30)))
 args = parser.parse_args()
 
 # Get user details.
@@ -41,29 +55,157 @@ def ce_ins(vscode_cmd=list, extension=str):
 def ce_unins(vscode_cmd=list, extension=str):
     """Uninstall an extension"""
     subprocess.run(vscode_cmd + ["--uninstall-extension", extension, "--force"], check=False, shell=False)
-def codeconfig_installext(vscode_cmd=list):
-    """Install vscode extensions"""
-    print("\nInstalling VS Code extensions.")
-    ce_ins(vscode_cmd, "detachhead.basedpyright")
-    ce_ins(vscode_cmd, "ms-azuretools.vscode-docker")
-    ce_ins(vscode_cmd, "mikestead.dotenv")
-    ce_ins(vscode_cmd, "timonwong.shellcheck")
-    ce_ins(vscode_cmd, "eamodio.gitlens")
-    ce_ins(vscode_cmd, "donjayamanne.githistory")
-    ce_ins(vscode_cmd, "vscode-icons-team.vscode-icons")
-    ce_ins(vscode_cmd, "yzhang.markdown-all-in-one")
-    ce_ins(vscode_cmd, "davidanson.vscode-markdownlint")
-    ce_ins(vscode_cmd, "dendron.dendron")
-    ce_ins(vscode_cmd, "dendron.dendron-paste-image")
-    ce_ins(vscode_cmd, "bbenoist.Nix")
-    ce_ins(vscode_cmd, "danielroedl.meld-diff")
-    ce_ins(vscode_cmd, "aaron-bond.better-comments")
-    ce_ins(vscode_cmd, "ms-toolsai.jupyter")
-    # Remove extensions
-    ce_unins(vscode_cmd, "ms-python.vscode-pylance")
-    ce_unins(vscode_cmd, "ms-pyright.pyright")
-    ce_unins(vscode_cmd, "ms-python.flake8")
-    ce_unins(vscode_cmd, "ms-python.python")
+def ce_list(vscode_cmd=list):
+    """Return a dict of installed extensions (lowercase id) and their versions, or None if they can't be listed."""
+    process = subprocess.run(vscode_cmd + ["--list-extensions", "--show-versions"], check=False, shell=False, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    if process.returncode != 0:
+        return None
+    extensions = {}
+    for line in process.stdout.splitlines():
+        ext_id, _, ext_version = line.strip().partition("@")
+        if "." in ext_id:
+            extensions[ext_id.lower()] = ext_version
+    return extensions
+def ce_bulk(vscode_cmd=list, option=str, extensions=list, label=str):
+    """Run one CLI invocation for several extensions, with the option repeated per extension. Output is printed after it finishes, so concurrent runs don't interleave."""
+    cmd = list(vscode_cmd)
+    for extension in extensions:
+        cmd += [option, extension]
+    process = subprocess.run(cmd + ["--force"], check=False, shell=False, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    for line in process.stdout.splitlines():
+        if line.strip():
+            print("[{0}] {1}".format(label, line))
+    return process.returncode
+# Extensions to install and remove.
+code_extensions_install = [
+    "detachhead.basedpyright",
+    "ms-azuretools.vscode-docker",
+    "mikestead.dotenv",
+    "timonwong.shellcheck",
+    "eamodio.gitlens",
+    "donjayamanne.githistory",
+    "vscode-icons-team.vscode-icons",
+    "yzhang.markdown-all-in-one",
+    "davidanson.vscode-markdownlint",
+    "dendron.dendron",
+    "dendron.dendron-paste-image",
+    "bbenoist.Nix",
+    "danielroedl.meld-diff",
+    "aaron-bond.better-comments",
+    "ms-toolsai.jupyter",
+]
+code_extensions_remove = [
+    "ms-python.vscode-pylance",
+    "ms-pyright.pyright",
+    "ms-python.flake8",
+    "ms-python.python",
+]
+def vsix_version_key(version=str):
+    """Sort key for extension versions."""
+    return [int(v) if v.isdigit() else 0 for v in re.split(r"[.-]", version)]
+def vsix_cache_path(extension=str, max_age=None):
+    """
+    Return the path of the newest cached vsix for an extension, or None. Cached files are named <id>-<version>.vsix.
+    max_age: Days since the file was downloaded, after which None is returned so it is downloaded again.
+    """
+    prefix = extension.lower() + "-"
+    versions = []
+    if os.path.isdir(args.vsixcache):
+        for f in os.listdir(args.vsixcache):
+            if f.startswith(prefix) and f.endswith(".vsix"):
+                versions.append(f[len(prefix):-len(".vsix")])
+    if not versions:
+        return None
+    vsix_path = os.path.join(args.vsixcache, "{0}{1}.vsix".format(prefix, max(versions, key=vsix_version_key)))
+    if max_age is not None and time.time() - os.path.getmtime(vsix_path) >= max_age * 86400:
+        return None
+    return vsix_path
+def vsix_download(extension=str):
+    """Download the latest version of an extension from the marketplace into the vsix cache. Returns the path, or None if it can't be downloaded."""
+    try:
+        os.makedirs(args.vsixcache, exist_ok=True)
+    except OSError:
+        return None
+    if not os.access(args.vsixcache, os.W_OK):
+        return None
+    publisher, _, name = extension.partition(".")
+    url = "https://marketplace.visualstudio.com/_apis/public/gallery/publishers/{0}/vsextensions/{1}/latest/vspackage".format(publisher, name)
+    print("Downloading {0} from {1}.".format(extension, url))
+    temp_path = None
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            data = response.read()
+        # The marketplace can send the package gzipped.
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        with tempfile.NamedTemporaryFile('wb', dir=args.vsixcache, prefix=".vsix.", delete=False) as f:
+            temp_path = f.name
+            f.write(data)
+        # The version is only known from the package manifest.
+        with zipfile.ZipFile(temp_path) as z:
+            version = json.loads(z.read("extension/package.json"))["version"]
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        print("ERROR: unable to download {0}: {1}".format(extension, e))
+        if temp_path and os.path.isfile(temp_path):
+            os.remove(temp_path)
+        return None
+    vsix_path = os.path.join(args.vsixcache, "{0}-{1}.vsix".format(extension.lower(), version))
+    # The file time is the download time, which the max age is checked against.
+    os.replace(temp_path, vsix_path)
+    # The marketplace version replaces all other cached versions.
+    prefix = extension.lower() + "-"
+    for f in os.listdir(args.vsixcache):
+        if f.startswith(prefix) and f.endswith(".vsix") and os.path.join(args.vsixcache, f) != vsix_path:
+            os.remove(os.path.join(args.vsixcache, f))
+    return vsix_path
+def vsix_seed():
+    """Fill the vsix cache with all extensions to install, downloading ones which are missing or older than the max age."""
+    for extension in code_extensions_install:
+        vsix_path = vsix_cache_path(extension, args.maxage)
+        if vsix_path:
+            print("{0} is cached as {1}.".format(extension, vsix_path))
+        elif not vsix_download(extension):
+            if vsix_cache_path(extension):
+                print("WARNING: {0} could not be refreshed, keeping {1}.".format(extension, vsix_cache_path(extension)))
+            else:
+                print("ERROR: {0} could not be cached.".format(extension))
+def codeconfig_installext(vscode_cmd=list, label=str, vsix=True):
+    """
+    Install vscode extensions. Only missing extensions are installed, in one CLI invocation.
+    vsix: Install from the vsix cache, downloading missing packages into it. Otherwise the editor downloads the extensions.
+    """
+    print("\nInstalling VS Code extensions for {0}.".format(label))
+    installed = ce_list(vscode_cmd)
+    if installed is None:
+        # Can't tell what is installed, so install each extension.
+        print("[{0}] Unable to list extensions, installing individually.".format(label))
+        for extension in code_extensions_install:
+            ce_ins(vscode_cmd, extension)
+        for extension in code_extensions_remove:
+            ce_unins(vscode_cmd, extension)
+        return
+    missing = [e for e in code_extensions_install if e.lower() not in installed]
+    unwanted = [e for e in code_extensions_remove if e.lower() in installed]
+    print("[{0}] {1} extensions installed, {2} missing, {3} to remove.".format(label, len(code_extensions_install) - len(missing), len(missing), len(unwanted)))
+    # Install from the cache if possible, and by id from the marketplace otherwise.
+    sources = {}
+    for extension in missing:
+        sources[extension] = extension
+        if vsix:
+            # An outdated cached package is still used when the marketplace can't be reached (i.e. offline VMs).
+            sources[extension] = vsix_cache_path(extension, args.maxage) or vsix_download(extension) or vsix_cache_path(extension) or extension
+    if missing and ce_bulk(vscode_cmd, "--install-extension", list(sources.values()), label) != 0:
+        # Retry the ones which did not install, so one bad extension doesn't stop the rest.
+        installed = ce_list(vscode_cmd) or {}
+        for extension in [e for e in missing if e.lower() not in installed]:
+            ce_ins(vscode_cmd, sources[extension])
+    if unwanted:
+        ce_bulk(vscode_cmd, "--uninstall-extension", unwanted, label)
+
+# Only fill the cache.
+if args.seed:
+    vsix_seed()
+    sys.exit()
 
 
 ########################## Variables ##########################
@@ -72,12 +214,16 @@ def codeconfig_installext(vscode_cmd=list):
 # List positions - en: Enabled
 #                  cmd: Command
 #                  path: settings.json path
+#                  extpath: extensions folder
 code_array = {}
 for idx in range(1, 6):
     code_array[idx] = {}
     code_array[idx]["en"] = [""]
     code_array[idx]["cmd"] = []
     code_array[idx]["path"] = [""]
+    code_array[idx]["extpath"] = os.path.join(userhome, ".vscode-oss", "extensions")
+code_array[1]["extpath"] = os.path.join(userhome, ".vscode", "extensions")
+code_array[3]["extpath"] = os.path.join(userhome, ".vscode", "extensions")
 
 # Native (Linux)
 code_array[1]["cmd"] = ["code"]
@@ -145,8 +291,8 @@ print(f"""Enabled choices:
 
 
 ########################## Begin Code ##########################
-# Process options
-for idx in range(1, 6):
+def codeconfig_apply(idx=int):
+    """Configure one option."""
     # Only process enabled options.
     if code_array[idx]["en"] is True:
         print("\nProcessing option {0}\n".format(idx))
@@ -171,7 +317,8 @@ for idx in range(1, 6):
                 json.dump(productjson, f, indent=2)
 
         # Extensions
-        codeconfig_installext(code_array[idx]["cmd"])
+        # The flatpak can only read the cache if it is in the home folder.
+        codeconfig_installext(code_array[idx]["cmd"], "option {0}".format(idx), vsix=idx != 5 or os.path.abspath(args.vsixcache).startswith(userhome + os.sep))
 
         # Keyboard bindings
         kb_data = [
@@ -299,3 +446,18 @@ for idx in range(1, 6):
 
         # Write json configuration
         CFunc.json_configwrite(data, os.path.join(code_array[idx]["path"], "settings.json"))
+def codeconfig_apply_list(idx_list=list):
+    """Configure options in order."""
+    for idx in idx_list:
+        codeconfig_apply(idx)
+
+
+# Process options concurrently. Options which share an extensions folder (like VSCodium native and flatpak) are processed in order, so they don't install into the same folder at once.
+option_groups = {}
+for idx in range(1, 6):
+    if code_array[idx]["en"] is True:
+        option_groups.setdefault(code_array[idx]["extpath"], []).append(idx)
+with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(option_groups))) as executor:
+    futures = [executor.submit(codeconfig_apply_list, idx_list) for idx_list in option_groups.values()]
+    for future in concurrent.futures.as_completed(futures):
+        future.result()
@@ -10,9 +10,11 @@ import pathlib
 import subprocess
 import shutil
 import sys
+import tempfile
 import xml.etree.ElementTree as ET
 # Custom includes
 import CFunc
+import CKdeConfig
 import CMimeSet
 
 # Disable buffered stdout (to ensure prints are in order)
@@ -29,42 +31,297 @@ def icon_theme_is_present():
     elif CFunc.is_nixos() is True:
         theme_exists = True
     return theme_exists
+# Counts of settings written, skipped because they already match (with --diff), and failed.
+settings_summary = {"changed": 0, "unchanged": 0, "failed": 0}
+# Current settings, loaded once on first use with --diff.
+current_state = {"dconf": None, "xfconf": {}}
+def dconf_current():
+    """Return the current dconf database as a dict of key path to value, using a single dconf dump."""
+    if current_state["dconf"] is None:
+        current_state["dconf"] = {}
+        dump = subprocess.run(['dconf', 'dump', '/'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, check=False).stdout
+        directory = "/"
+        for line in dump.splitlines():
+            if line.startswith("[") and line.endswith("]"):
+                directory = "/" + line[1:-1].strip("/") + "/"
+                directory = directory.replace("//", "/")
+            elif "=" in line:
+                name, _, value = line.partition("=")
+                current_state["dconf"][directory + name] = value
+    return current_state["dconf"]
+def dconf_matches(key: str, value: str):
+    """Check if a dconf key already has the value. Values which are unquoted strings (as accepted by gsettings) are also compared quoted."""
+    current = dconf_current().get(key)
+    if current is None:
+        return False
+    return current == value or current == "'{0}'".format(value)
+def gsettings_path(schema: str, key: str):
+    """Return the dconf path for a gsettings key. Assumes the usual path for non-relocatable schemas."""
+    if ":" in schema:
+        path = schema.split(":", 1)[1]
+    else:
+        path = "/" + schema.replace(".", "/") + "/"
+    return path.rstrip("/") + "/" + key
 def gsettings_set(schema: str, key: str, value: str):
     """Set dconf setting using gsettings."""
+    # Write queued dconf settings first if one could be the same key, so the settings are applied in order.
+    if any(path.endswith("/" + key) for path in dconf_queue):
+        dconf_flush()
+    if args.diff and dconf_matches(gsettings_path(schema, key), value):
+        settings_summary["unchanged"] += 1
+        return
     status = subprocess.run(['gsettings', 'set', schema, key, value], check=False).returncode
     if status != 0:
+        settings_summary["failed"] += 1
         print("ERROR, failed to run: gsettings set {0} {1} {2}".format(schema, key, value))
+    else:
+        settings_summary["changed"] += 1
+        if current_state["dconf"] is not None:
+            current_state["dconf"][gsettings_path(schema, key)] = value
+# Queued dconf settings, by key path.
+dconf_queue = {}
 def dconf_write(key: str, value: str):
-    """Set dconf setting using dconf write."""
-    status = subprocess.run(['dconf', 'write', key, value], check=False).returncode
-    if status != 0:
-        print("ERROR, failed to run: dconf write {0} {1}".format(key, value))
+    """Queue a dconf setting. Queued settings are written by dconf_flush()."""
+    if not key.startswith("/") or key.endswith("/") or "//" in key:
+        settings_summary["failed"] += 1
+        print("ERROR, invalid dconf key: {0}".format(key))
+        return
+    # Re-insert the key so it keeps the position of the latest write.
+    dconf_queue.pop(key, None)
+    if args.diff and dconf_matches(key, value):
+        settings_summary["unchanged"] += 1
+        return
+    dconf_queue[key] = value
+def dconf_flush():
+    """
+    Write all queued dconf settings with a single dconf load.
+    dconf load applies nothing if any value is invalid. In that case, the settings are written one at a time using dconf write, to report each failing key.
+    """
+    if not dconf_queue:
+        return
+    # Group keys by directory into a keyfile.
+    keyfile = {}
+    for path, value in dconf_queue.items():
+        directory, _, name = path.rpartition("/")
+        keyfile.setdefault(directory.strip("/") or "/", []).append("{0}={1}".format(name, value))
+    keyfile_text = "".join("[{0}]\n{1}\n\n".format(directory, "\n".join(lines)) for directory, lines in keyfile.items())
+    print("Writing {0} dconf settings in {1} directories.".format(len(dconf_queue), len(keyfile)))
+    status = subprocess.run(['dconf', 'load', '/'], input=keyfile_text, universal_newlines=True, check=False).returncode
+    if status == 0:
+        settings_summary["changed"] += len(dconf_queue)
+    else:
+        print("ERROR, dconf load failed. Writing settings individually.")
+        for path, value in dconf_queue.items():
+            status = subprocess.run(['dconf', 'write', path, value], check=False).returncode
+            if status != 0:
+                settings_summary["failed"] += 1
+                print("ERROR, failed to run: dconf write {0} {1}".format(path, value))
+            else:
+                settings_summary["changed"] += 1
+    # Keep the current state in sync for later comparisons.
+    if current_state["dconf"] is not None:
+        current_state["dconf"].update(dconf_queue)
+    dconf_queue.clear()
 def kwriteconfig(file: str, group, key: str, value: str, type: str = "str"):
-    """Set KDE configs using kwriteconfig6."""
-    cmd = ['kwriteconfig6', '--file', file]
-    # Loop through the group if it is a list.
-    if isinstance(group, list):
-        for x in group:
-            cmd += ["--group", x]
+    """
+    Set KDE configs, like kwriteconfig6.
+    Edits are batched in memory and each file is written once by kwriteconfig_flush(). Keys which already have the value are not written.
+    """
+    status = CKdeConfig.kconfig_set(file, group, key, value, type)
+    if status == "immutable":
+        settings_summary["failed"] += 1
+        print("ERROR, {0} is immutable in {1}".format(key, file))
     else:
-        cmd += ["--group", group]
-    cmd += ["--key", key, "--type", type, value]
-    # Run command
-    status = subprocess.run(cmd, check=False).returncode
-    # Print if error
-    if status != 0:
-        print(f"ERROR, failed to run: {cmd}")
+        settings_summary[status] += 1
+def kwriteconfig_flush(file: str = None):
+    """Write KDE config files with pending edits."""
+    try:
+        CKdeConfig.kconfig_flush(file)
+    except OSError as e:
+        print("ERROR, failed to write KDE config: {0}".format(e))
+# Queued xfconf operations, by channel. Each operation is ("set", property, type, values, force_array) or ("reset", property, recursive).
+xfconf_queue = {}
+# xfconf types and their D-Bus signatures.
+xfconf_dbus_types = {"int": "i", "uint": "u", "int64": "x", "uint64": "t", "bool": "b", "double": "d", "float": "d", "string": "s"}
+def xfconf_channel_path(channel: str):
+    """Return the path of the xml file for an xfconf channel."""
+    return os.path.join(os.environ.get("XDG_CONFIG_HOME", os.path.join(USERHOME, ".config")), "xfce4", "xfconf", "xfce-perchannel-xml", "{0}.xml".format(channel))
+def xfconf_channel_read(channel: str):
+    """Parse an xfconf channel file into a dict of property path to (type, value)."""
+    values = {}
+    channel_path = xfconf_channel_path(channel)
+    if not os.path.isfile(channel_path):
+        return values
+    try:
+        root = ET.parse(channel_path).getroot()
+    except ET.ParseError:
+        return values
+    def property_read(elem, prefix):
+        for prop in elem.findall("property"):
+            prop_path = "{0}/{1}".format(prefix, prop.get("name"))
+            if prop.get("value") is not None:
+                values[prop_path] = (prop.get("type"), prop.get("value"))
+            property_read(prop, prop_path)
+    property_read(root, "")
+    return values
 def xfconf(channel: str, prop: str, var_type: str, value: str, extra_options: list = None):
     """
-    Set value to property using xfconf.
+    Set value to property using xfconf. Queued settings are applied by xfconf_flush().
+    Only --force-array is supported in extra_options.
     https://docs.xfce.org/xfce/xfconf/xfconf-query
     """
-    cmd_list = ['xfconf-query', '--channel', channel, '--property', prop, '--type', var_type, '--set', value, '--create']
-    if extra_options:
-        cmd_list += extra_options
-    status = subprocess.run(cmd_list, check=False).returncode
-    if status != 0:
-        print("ERROR, failed to run: xfconf-query --channel {channel} --property {prop} --type {var_type} --set {value} --create".format(channel=channel, prop=prop, var_type=var_type, value=value))
+    # Arrays and other extra options are always written.
+    if args.diff and not extra_options:
+        if channel not in current_state["xfconf"]:
+            current_state["xfconf"][channel] = xfconf_channel_read(channel)
+        current = current_state["xfconf"][channel].get(prop)
+        if current is not None and current[0] == var_type and (current[1] == value or (var_type == "bool" and current[1].lower() == value.lower())):
+            settings_summary["unchanged"] += 1
+            return
+    force_array = bool(extra_options) and "--force-array" in extra_options
+    xfconf_queue.setdefault(channel, []).append(("set", prop, var_type, [value], force_array))
+def xfconf_array(channel: str, prop: str, var_type: str, values: list):
+    """Set an array property using xfconf. Queued settings are applied by xfconf_flush()."""
+    xfconf_queue.setdefault(channel, []).append(("set", prop, var_type, [str(v) for v in values], True))
+def xfconf_reset(channel: str, prop: str, recursive: bool = False):
+    """Reset (remove) a property using xfconf. Queued settings are applied by xfconf_flush()."""
+    xfconf_queue.setdefault(channel, []).append(("reset", prop, recursive))
+def xfconf_apply_dbus(channel: str, operations: list):
+    """Apply xfconf operations to the running xfconfd over one D-Bus connection. Returns None if D-Bus is not usable from Python."""
+    try:
+        from gi.repository import Gio, GLib
+        bus = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+    except Exception:
+        return None
+    def variant(var_type, value):
+        signature = xfconf_dbus_types[var_type]
+        if signature == "b":
+            return GLib.Variant(signature, value.lower() == "true")
+        if signature in "iuxt":
+            return GLib.Variant(signature, int(value))
+        if signature == "d":
+            return GLib.Variant(signature, float(value))
+        return GLib.Variant(signature, value)
+    failed = 0
+    for operation in operations:
+        try:
+            if operation[0] == "reset":
+                bus.call_sync("org.xfce.Xfconf", "/org/xfce/Xfconf", "org.xfce.Xfconf", "ResetProperty", GLib.Variant("(ssb)", (channel, operation[1], operation[2])), None, Gio.DBusCallFlags.NONE, -1, None)
+            else:
+                _, prop, var_type, values, force_array = operation
+                if force_array or len(values) > 1:
+                    value = GLib.Variant("av", [variant(var_type, v) for v in values])
+                else:
+                    value = variant(var_type, values[0])
+                bus.call_sync("org.xfce.Xfconf", "/org/xfce/Xfconf", "org.xfce.Xfconf", "SetProperty", GLib.Variant("(ssv)", (channel, prop, value)), None, Gio.DBusCallFlags.NONE, -1, None)
+        except Exception as e:
+            # Resetting a property which does not exist is not an error.
+            if operation[0] == "reset" and "not exist" in str(e):
+                continue
+            failed += 1
+            print("ERROR, failed to set {0} {1}: {2}".format(channel, operation[1], e))
+    return failed
+def xfconf_apply_xml(channel: str, operations: list):
+    """Apply xfconf operations directly to the channel xml file, for when xfconfd is not running. Returns the number of failed operations."""
+    channel_path = xfconf_channel_path(channel)
+    root = None
+    if os.path.isfile(channel_path):
+        try:
+            root = ET.parse(channel_path).getroot()
+        except ET.ParseError as e:
+            print("ERROR, unable to parse {0}: {1}".format(channel_path, e))
+            return len(operations)
+    if root is None:
+        root = ET.Element("channel", {"name": channel, "version": "1.0"})
+    failed = 0
+    for operation in operations:
+        names = operation[1].strip("/").split("/")
+        if operation[1] == "/" or not all(names):
+            failed += 1
+            print("ERROR, invalid xfconf property {0} {1}".format(channel, operation[1]))
+            continue
+        # Find the property element, creating missing parents when setting.
+        parent = None
+        elem = root
+        for name in names:
+            child = next((p for p in elem.findall("property") if p.get("name") == name), None)
+            if child is None:
+                if operation[0] == "reset":
+                    elem = None
+                    break
+                child = ET.SubElement(elem, "property", {"name": name, "type": "empty"})
+            parent = elem
+            elem = child
+        if operation[0] == "reset":
+            if elem is None:
+                continue
+            if operation[2] or elem.find("property") is None:
+                parent.remove(elem)
+            else:
+                # Keep child properties, but drop this property's value.
+                elem.set("type", "empty")
+                elem.attrib.pop("value", None)
+                for value_elem in elem.findall("value"):
+                    elem.remove(value_elem)
+            continue
+        _, prop, var_type, values, force_array = operation
+        for value_elem in elem.findall("value"):
+            elem.remove(value_elem)
+        if force_array or len(values) > 1:
+            elem.set("type", "array")
+            elem.attrib.pop("value", None)
+            for v in values:
+                ET.SubElement(elem, "value", {"type": var_type, "value": v})
+        else:
+            elem.set("type", var_type)
+            elem.set("value", values[0])
+    os.makedirs(os.path.dirname(channel_path), exist_ok=True)
+    xml_indent(root)
+    with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(channel_path), prefix=".{0}.".format(os.path.basename(channel_path)), delete=False) as f:
+        ET.ElementTree(root).write(f, xml_declaration=True, encoding='UTF-8')
+    os.replace(f.name, channel_path)
+    return failed
+def xfconf_apply_cmd(channel: str, operations: list):
+    """Apply xfconf operations using xfconf-query, one process per property. Returns the number of failed operations."""
+    failed = 0
+    for operation in operations:
+        if operation[0] == "reset":
+            cmd_list = ['xfconf-query', '--channel', channel, '--property', operation[1], '--reset']
+            if operation[2]:
+                cmd_list.append('--recursive')
+        else:
+            _, prop, var_type, values, force_array = operation
+            cmd_list = ['xfconf-query', '--channel', channel, '--property', prop]
+            for v in values:
+                cmd_list += ['--type', var_type, '--set', v]
+            cmd_list.append('--create')
+            if force_array:
+                cmd_list.append('--force-array')
+        status = subprocess.run(cmd_list, check=False).returncode
+        if status != 0 and operation[0] != "reset":
+            failed += 1
+            print("ERROR, failed to run: {0}".format(" ".join(cmd_list)))
+    return failed
+def xfconf_flush():
+    """
+    Apply queued xfconf settings, one batch per channel.
+    If xfconfd is running, the settings are sent over one D-Bus connection (or with xfconf-query if the Python GObject bindings are missing). Otherwise, like before the first login, the channel xml files are written directly.
+    """
+    if not xfconf_queue:
+        return
+    xfconfd_running = subprocess.run(["pgrep", "-x", "xfconfd"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False).returncode == 0
+    for channel, operations in xfconf_queue.items():
+        print("Applying {0} xfconf settings to {1}.".format(len(operations), channel))
+        if xfconfd_running:
+            failed = xfconf_apply_dbus(channel, operations)
+            if failed is None:
+                failed = xfconf_apply_cmd(channel, operations)
+        else:
+            failed = xfconf_apply_xml(channel, operations)
+        settings_summary["failed"] += failed
+        settings_summary["changed"] += len(operations) - failed
+    xfconf_queue.clear()
+    current_state["xfconf"] = {}
 def xml_indent(elem, level=0):
     """
     Pretty Print XML using Python Standard libraries only
@@ -88,6 +345,7 @@ def xml_indent(elem, level=0):
 # Get arguments
 parser = argparse.ArgumentParser(description='Set Desktop Settings.')
 parser.add_argument("-p", "--disable_powersave", help='Force turning off powersave modes (like for VMs).', action="store_true")
+parser.add_argument("-d", "--diff", help='Only write settings which differ from the current settings.', action="store_true")
 parser.add_argument("-s", "--screens", help='Number of screens (for panels) for Plasma Desktop (default: %(default)s)', type=int, choices=range(1, 6), default=1)
 
 args = parser.parse_args()
@@ -387,7 +645,8 @@ if shutil.which("dconf-editor"):
 # KDE/Plasma specific Settings
 # https://askubuntu.com/questions/839647/gsettings-like-tools-for-kde#839773
 # https://manned.org/kwriteconfig/d47c2de0
-if shutil.which("kwriteconfig6") and shutil.which("plasma_session"):
+# The configs are written directly, so kwriteconfig6 is not needed.
+if shutil.which("plasma_session") or shutil.which("plasmashell"):
     # Archiver settings
     CMimeSet.HandlePredefines("archive", "org.kde.ark.desktop")
     # Dolphin settings
@@ -399,18 +658,20 @@ if shutil.which("kwriteconfig6") and shutil.which("plasma_session"):
         kwriteconfig("dolphinrc", "IconsMode", "PreviewSize", "32")
         kwriteconfig("dolphinrc", "DetailsMode", "PreviewSize", "22")
         kwriteconfig("dolphinrc", "CompactMode", "PreviewSize", "16")
-        subprocess.run('kwriteconfig6 --file dolphinrc --group "MainWindow" --group "Toolbar mainToolBar" --key ToolButtonStyle "IconOnly"', shell=True, check=False)
+        kwriteconfig("dolphinrc", ["MainWindow", "Toolbar mainToolBar"], "ToolButtonStyle", "IconOnly")
     # KDE Globals
-    subprocess.run('kwriteconfig6 --file kdeglobals --group KDE --key SingleClick --type bool false', shell=True, check=False)
+    kwriteconfig("kdeglobals", "KDE", "SingleClick", "false", type="bool")
     os.makedirs("{0}/.kde/share/config".format(USERHOME), exist_ok=True)
     if icon_theme_is_present():
-        subprocess.run('kwriteconfig6 --file kdeglobals --group Icons --key Theme "Numix-Circle"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file kdeglobals --group General --key ColorScheme "BreezeDark"', shell=True, check=False)
+        kwriteconfig("kdeglobals", "Icons", "Theme", "Numix-Circle")
+    kwriteconfig("kdeglobals", "General", "ColorScheme", "BreezeDark")
     # Keyboard shortcuts
     kwriteconfig("kglobalshortcutsrc", "kwin", "Window Maximize", "Meta+Up,Meta+PgUp,Maximize Window")
     kwriteconfig("kglobalshortcutsrc", "kwin", "Window Minimize", "Meta+Down,Meta+PgDown,Minimize Window")
     # Workaround for kwriteconfig escaping \t as \\t. Without quotes, \t is escaped as only t.
+    kwriteconfig_flush("kglobalshortcutsrc")
     subprocess.run("sed -i 's@\\\\t@\\t@g' $HOME/.config/kglobalshortcutsrc", shell=True, check=False)
+    CKdeConfig.kconfig_discard("kglobalshortcutsrc")
     kwriteconfig("kglobalshortcutsrc", "kwin", "Window Quick Tile Left", "Meta+Left,none,Quick Tile Window to the Left")
     kwriteconfig("kglobalshortcutsrc", "kwin", "Window Quick Tile Right", "Meta+Right,none,Quick Tile Window to the Right")
     kwriteconfig("kglobalshortcutsrc", "kwin", "Window Quick Tile Bottom", "Meta+PgDown,Meta+Down,Quick Tile Window to the Bottom")
@@ -437,9 +698,9 @@ if shutil.which("kwriteconfig6") and shutil.which("plasma_session"):
     kwriteconfig("powerdevilrc", ["Battery", "Display"], "TurnOffDisplayIdleTimeoutWhenLockedSec", "20")
     kwriteconfig("powerdevilrc", ["Battery", "SuspendAndShutdown"], "PowerButtonAction", "1")
     kwriteconfig("powerdevilrc", ["LowBattery", "Display"], "TurnOffDisplayIdleTimeoutWhenLockedSec", "0")
-    subprocess.run('kwriteconfig6 --file kscreenlockerrc --group Daemon --key Autolock --type bool false', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file kscreenlockerrc --group Daemon --key LockOnResume --type bool false', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file kscreenlockerrc --group Daemon --key Timeout 10', shell=True, check=False)
+    kwriteconfig("kscreenlockerrc", "Daemon", "Autolock", "false", type="bool")
+    kwriteconfig("kscreenlockerrc", "Daemon", "LockOnResume", "false", type="bool")
+    kwriteconfig("kscreenlockerrc", "Daemon", "Timeout", "10")
     kwriteconfig("ksmserverrc", "General", "confirmLogout", "false")
     kwriteconfig("ksmserverrc", "General", "offerShutdown", "true")
     kwriteconfig("ksmserverrc", "General", "loginMode", "emptySession")
@@ -459,56 +720,56 @@ if shutil.which("kwriteconfig6") and shutil.which("plasma_session"):
     kwriteconfig("ktrashrc", "{0}/.local/share/Trash".format(USERHOME), "UseTimeLimit", "true")
 
     # Notification settings
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/Textcompletion: no match" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/Textcompletion: no match" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/Textcompletion: no match" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/Trash: emptied" --key "Action" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/Trash: emptied" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/Trash: emptied" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/Trash: emptied" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/beep" --key "Action" "Execute"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/beep" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/beep" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/beep" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/catastrophe" --key "Action" "Popup"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/catastrophe" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/catastrophe" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/catastrophe" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/fatalerror" --key "Action" "Popup"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/fatalerror" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/fatalerror" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/fatalerror" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageCritical" --key "Action" "Taskbar"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageCritical" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageCritical" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageCritical" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageInformation" --key "Action" "Taskbar"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageInformation" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageInformation" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageInformation" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageWarning" --key "Action" "Taskbar"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageWarning" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageWarning" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageWarning" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageboxQuestion" --key "Action" "Taskbar"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageboxQuestion" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageboxQuestion" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/messageboxQuestion" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/notification" --key "Action" "Popup"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/notification" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/notification" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/notification" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/printerror" --key "Action" "Popup"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/printerror" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/printerror" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/printerror" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/startkde" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/startkde" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/startkde" --key "TTS" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/warning" --key "Action" "Popup"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/warning" --key "Execute" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/warning" --key "Logfile" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma_workspace.notifyrc --group "Event/warning" --key "TTS" ""', shell=True, check=False)
+    kwriteconfig("plasma_workspace.notifyrc", "Event/Textcompletion: no match", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/Textcompletion: no match", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/Textcompletion: no match", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/Trash: emptied", "Action", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/Trash: emptied", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/Trash: emptied", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/Trash: emptied", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/beep", "Action", "Execute")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/beep", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/beep", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/beep", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/catastrophe", "Action", "Popup")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/catastrophe", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/catastrophe", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/catastrophe", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/fatalerror", "Action", "Popup")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/fatalerror", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/fatalerror", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/fatalerror", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageCritical", "Action", "Taskbar")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageCritical", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageCritical", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageCritical", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageInformation", "Action", "Taskbar")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageInformation", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageInformation", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageInformation", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageWarning", "Action", "Taskbar")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageWarning", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageWarning", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageWarning", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageboxQuestion", "Action", "Taskbar")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageboxQuestion", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageboxQuestion", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/messageboxQuestion", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/notification", "Action", "Popup")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/notification", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/notification", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/notification", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/printerror", "Action", "Popup")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/printerror", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/printerror", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/printerror", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/startkde", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/startkde", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/startkde", "TTS", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/warning", "Action", "Popup")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/warning", "Execute", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/warning", "Logfile", "")
+    kwriteconfig("plasma_workspace.notifyrc", "Event/warning", "TTS", "")
     kwriteconfig("plasmanotifyrc", "Jobs", "PermanentPopups", "false")
     # Turn off monitors on lock screen
     # Currently not implemented in plasma6: https://bugs.kde.org/show_bug.cgi?id=481069
@@ -521,6 +782,7 @@ if shutil.which("kwriteconfig6") and shutil.which("plasma_session"):
         kwriteconfig("krunnerrc", "Plugins", "baloosearchEnabled", "false")
         kwriteconfig("baloofilerc", "Basic Settings", "Indexing-Enabled", "false")
 
+    kwriteconfig_flush()
     if shutil.which("qdbus"):
         # Reload kwin.
         subprocess.run('qdbus org.kde.KWin /KWin reconfigure', shell=True, check=False)
@@ -529,41 +791,43 @@ if shutil.which("kwriteconfig6") and shutil.which("plasma_session"):
     # Config information and example: https://github.com/shalva97/kde-configuration-files
     # Convert kde config to kwriteconfig line: https://gist.github.com/shalva97/a705590f2c0e309374cccc7f6bd667cb
     if os.path.isfile(os.path.join(USERHOME, ".config", "plasmashellrc")):
+        CKdeConfig.kconfig_discard("plasmashellrc")
         os.remove(os.path.join(USERHOME, ".config", "plasmashellrc"))
-    subprocess.run('kwriteconfig6 --file plasmashellrc --group "PlasmaTransientsConfig" --key "PreloadWeight" "34"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasmashellrc --group "PlasmaViews" --group "Panel 2" --group "Defaults" --key "thickness" "28"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasmashellrc --group "PlasmaViews" --group "Panel 2" --key "floating" "0"', shell=True, check=False)
+    kwriteconfig("plasmashellrc", "PlasmaTransientsConfig", "PreloadWeight", "34")
+    kwriteconfig("plasmashellrc", ["PlasmaViews", "Panel 2", "Defaults"], "thickness", "28")
+    kwriteconfig("plasmashellrc", ["PlasmaViews", "Panel 2"], "floating", "0")
 
     # Panels
     if os.path.isfile(os.path.join(USERHOME, ".config", "plasma-org.kde.plasma.desktop-appletsrc")):
+        CKdeConfig.kconfig_discard("plasma-org.kde.plasma.desktop-appletsrc")
         os.remove(os.path.join(USERHOME, ".config", "plasma-org.kde.plasma.desktop-appletsrc"))
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "ActionPlugins" --group "0" --key "MiddleButton;NoModifier" "org.kde.paste"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "ActionPlugins" --group "0" --key "RightButton;NoModifier" "org.kde.contextmenu"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "ActionPlugins" --group "0" --key "wheel:Vertical;NoModifier" "org.kde.switchdesktop"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "ActionPlugins" --group "1" --key "RightButton;NoModifier" "org.kde.contextmenu"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --key "activityId" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --key "formfactor" "2"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --key "lastScreen" "0"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --key "location" "3"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --key "plugin" "org.kde.panel"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --key "wallpaperplugin" "org.kde.image"', shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["ActionPlugins", "0"], "MiddleButton;NoModifier", "org.kde.paste")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["ActionPlugins", "0"], "RightButton;NoModifier", "org.kde.contextmenu")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["ActionPlugins", "0"], "wheel:Vertical;NoModifier", "org.kde.switchdesktop")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["ActionPlugins", "1"], "RightButton;NoModifier", "org.kde.contextmenu")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2"], "activityId", "")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2"], "formfactor", "2")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2"], "lastScreen", "0")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2"], "location", "3")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2"], "plugin", "org.kde.panel")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2"], "wallpaperplugin", "org.kde.image")
     toppanel_appletgroup_id = 3
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.kickoff"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "100"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Configuration/General" --key "showAppsByName" "true"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "General" --key "favoritesPortedToKAstats" "true"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Shortcuts" --key "global" "Alt+F1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Shortcuts" --key "global" "Alt+F1"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.kickoff")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "100")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Configuration/General"], "showAppsByName", "true")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "General"], "favoritesPortedToKAstats", "true")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Shortcuts"], "global", "Alt+F1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Shortcuts"], "global", "Alt+F1")
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.pager"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "42"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.pager")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "42")
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.icontasks"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "42"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.icontasks")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "42")
 
     plasma_desktop_string = ""
     plasma_desktop_search_list = ["firefox.desktop", "brave-browser.desktop", "chrome.desktop", 'org.mozilla.thunderbird_esr.desktop', 'thunderbird.desktop', 'kde.dolphin.desktop', "org.kde.konsole.desktop", 'virt-manager.desktop', 'org.gnome.SystemMonitor.desktop']
@@ -573,155 +837,155 @@ if shutil.which("kwriteconfig6") and shutil.which("plasma_session"):
         if ds:
             plasma_desktop_file_list.append("applications:" + ds)
     plasma_desktop_string = ','.join(plasma_desktop_file_list)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "General" --key "launchers" "{1}"'.format(toppanel_appletgroup_id, plasma_desktop_string), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "General"], "launchers", plasma_desktop_string)
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.marginsseparator"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "42"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.marginsseparator")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "42")
     # System monitor applets
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.systemmonitor"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "100"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "chartFace" "org.kde.ksysguard.linechart"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "title" "CPU Usage"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "updateRateLimit" "1000"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Sensors" --key "highPrioritySensorIds" "[\\"cpu/all/usage\\"]"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Sensors" --key "totalSensors" "[cpu/all/usage]"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorColors" --key "cpu/all/usage" "85,255,255"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "org.kde.ksysguard.linechart" --group "General" --key "historyAmount" "30"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "org.kde.ksysguard.linechart" --group "General" --key "rangeAutoY" "false"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.systemmonitor")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "100")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "chartFace", "org.kde.ksysguard.linechart")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "title", "CPU Usage")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "updateRateLimit", "1000")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Sensors"], "highPrioritySensorIds", '["cpu/all/usage"]')
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Sensors"], "totalSensors", "[cpu/all/usage]")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorColors"], "cpu/all/usage", "85,255,255")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "org.kde.ksysguard.linechart", "General"], "historyAmount", "30")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "org.kde.ksysguard.linechart", "General"], "rangeAutoY", "false")
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.systemmonitor"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "70"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "chartFace" "org.kde.ksysguard.linechart"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "title" "Memory Usage"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "updateRateLimit" "1000"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Sensors" --key "highPrioritySensorIds" "[\\"memory/physical/usedPercent\\",\\"memory/swap/usedPercent\\"]"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorColors" --key "memory/physical/usedPercent" "0,255,0"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorColors" --key "memory/swap/usedPercent" "255,0,0"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorLabels" --key "memory/physical/usedPercent" "Physical"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorLabels" --key "memory/swap/usedPercent" "Swap"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "org.kde.ksysguard.linechart" --group "General" --key "rangeAutoY" "false"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.systemmonitor")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "70")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "chartFace", "org.kde.ksysguard.linechart")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "title", "Memory Usage")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "updateRateLimit", "1000")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Sensors"], "highPrioritySensorIds", '["memory/physical/usedPercent","memory/swap/usedPercent"]')
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorColors"], "memory/physical/usedPercent", "0,255,0")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorColors"], "memory/swap/usedPercent", "255,0,0")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorLabels"], "memory/physical/usedPercent", "Physical")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorLabels"], "memory/swap/usedPercent", "Swap")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "org.kde.ksysguard.linechart", "General"], "rangeAutoY", "false")
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.systemmonitor"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "100"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "chartFace" "org.kde.ksysguard.linechart"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "title" "I/O Rate"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "updateRateLimit" "1000"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Sensors" --key "highPrioritySensorIds" "[\\"disk/all/read\\",\\"disk/all/write\\"]"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorColors" --key "disk/all/read" "233,61,217"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorColors" --key "disk/all/write" "160,233,61"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "org.kde.ksysguard.linechart" --group "General" --key "historyAmount" "30"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.systemmonitor")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "100")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "chartFace", "org.kde.ksysguard.linechart")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "title", "I/O Rate")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "updateRateLimit", "1000")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Sensors"], "highPrioritySensorIds", '["disk/all/read","disk/all/write"]')
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorColors"], "disk/all/read", "233,61,217")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorColors"], "disk/all/write", "160,233,61")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "org.kde.ksysguard.linechart", "General"], "historyAmount", "30")
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.systemmonitor"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "55"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "chartFace" "org.kde.ksysguard.linechart"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "title" "Network"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Appearance" --key "updateRateLimit" "1000"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "Sensors" --key "highPrioritySensorIds" "[\\"network/all/download\\",\\"network/all/upload\\"]"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorColors" --key "network/all/download" "0,255,0"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "SensorColors" --key "network/all/upload" "255,170,255"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --group "org.kde.ksysguard.linechart" --group "General" --key "historyAmount" "30"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.systemmonitor")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "55")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "chartFace", "org.kde.ksysguard.linechart")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "title", "Network")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Appearance"], "updateRateLimit", "1000")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "Sensors"], "highPrioritySensorIds", '["network/all/download","network/all/upload"]')
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorColors"], "network/all/download", "0,255,0")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "SensorColors"], "network/all/upload", "255,170,255")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration", "org.kde.ksysguard.linechart", "General"], "historyAmount", "30")
     # Battery widget
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.battery"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.battery")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
     # System Tray
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.systemtray"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "57"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "SystrayContainmentId" "8"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.systemtray")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "57")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "SystrayContainmentId", "8")
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.digitalclock"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "52"'.format(toppanel_appletgroup_id), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.digitalclock")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "52")
     toppanel_appletgroup_id = toppanel_appletgroup_id + 1
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "immutability" "1"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --key "plugin" "org.kde.plasma.minimizeall"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Applets" --group "{0}" --group "Configuration" --key "PreloadWeight" "42"'.format(toppanel_appletgroup_id), shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id)], "plugin", "org.kde.plasma.minimizeall")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Applets", str(toppanel_appletgroup_id), "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "Configuration"], "PreloadWeight", "42")
 
     toppanel_appletgroup_list = []
     for x in range(3, toppanel_appletgroup_id):
         toppanel_appletgroup_list.append(str(x))
     toppanel_appletgroup_string = ';'.join(toppanel_appletgroup_list)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "2" --group "General" --key "AppletOrder" "{0}"'.format(toppanel_appletgroup_string), shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "2", "General"], "AppletOrder", toppanel_appletgroup_string)
 
     # Create multiple panels for each screen.
     extrapanel_id = 50
     extrapanel_appletid = extrapanel_id + 1
     for x in range(args.screens):
         extrapanel_appletid = extrapanel_id + 1
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --key "activityId" ""'.format(extrapanel_id), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --key "formfactor" "2"'.format(extrapanel_id), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --key "immutability" "1"'.format(extrapanel_id), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --key "lastScreen" "{1}"'.format(extrapanel_id, x), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --key "location" "4"'.format(extrapanel_id), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --key "plugin" "org.kde.panel"'.format(extrapanel_id), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --key "wallpaperplugin" "org.kde.image"'.format(extrapanel_id), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "Applets" --group "{1}" --key "immutability" "1"'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "Applets" --group "{1}" --key "plugin" "org.kde.plasma.taskmanager"'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "Applets" --group "{1}" --group "Configuration" --group "General" --key "groupedTaskVisualization" "1"'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "Applets" --group "{1}" --group "Configuration" --group "General" --key "maxStripes" "1"'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "Applets" --group "{1}" --group "Configuration" --group "General" --key "showOnlyCurrentScreen" "true"'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "Applets" --group "{1}" --group "Configuration" --group "General" --key "showOnlyCurrentDesktop" "false"'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "Applets" --group "{1}" --group "Configuration" --group "General" --key "showOnlyCurrentActivity" "false"'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "Applets" --group "{1}" --group "Configuration" --group "General" --key "launchers" ""'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "{0}" --group "General" --key "AppletOrder" "{1}"'.format(extrapanel_id, extrapanel_appletid), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasmashellrc --group "PlasmaViews" --group "Panel {0}" --group "Defaults" --key "thickness" "24"'.format(extrapanel_id), shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file plasmashellrc --group "PlasmaViews" --group "Panel {0}" --key "floating" "0"'.format(extrapanel_id), shell=True, check=False)
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id)], "activityId", "")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id)], "formfactor", "2")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id)], "immutability", "1")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id)], "lastScreen", str(x))
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id)], "location", "4")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id)], "plugin", "org.kde.panel")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id)], "wallpaperplugin", "org.kde.image")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "Applets", str(extrapanel_appletid)], "immutability", "1")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "Applets", str(extrapanel_appletid)], "plugin", "org.kde.plasma.taskmanager")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "Applets", str(extrapanel_appletid), "Configuration", "General"], "groupedTaskVisualization", "1")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "Applets", str(extrapanel_appletid), "Configuration", "General"], "maxStripes", "1")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "Applets", str(extrapanel_appletid), "Configuration", "General"], "showOnlyCurrentScreen", "true")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "Applets", str(extrapanel_appletid), "Configuration", "General"], "showOnlyCurrentDesktop", "false")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "Applets", str(extrapanel_appletid), "Configuration", "General"], "showOnlyCurrentActivity", "false")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "Applets", str(extrapanel_appletid), "Configuration", "General"], "launchers", "")
+        kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", str(extrapanel_id), "General"], "AppletOrder", str(extrapanel_appletid))
+        kwriteconfig("plasmashellrc", ["PlasmaViews", f"Panel {extrapanel_id}", "Defaults"], "thickness", "24")
+        kwriteconfig("plasmashellrc", ["PlasmaViews", f"Panel {extrapanel_id}"], "floating", "0")
         extrapanel_id = extrapanel_appletid + 1
 
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --key "activityId" ""', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --key "formfactor" "2"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --key "lastScreen" "0"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --key "location" "3"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --key "plugin" "org.kde.plasma.private.systemtray"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --key "wallpaperplugin" "org.kde.image"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "10" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "10" --key "plugin" "org.kde.kdeconnect"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "10" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "11" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "11" --key "plugin" "org.kde.plasma.devicenotifier"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "11" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "12" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "12" --key "plugin" "org.kde.plasma.printmanager"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "12" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "13" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "13" --key "plugin" "org.kde.plasma.volume"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "13" --group "Configuration" --group "General" --key "showVirtualDevices" "true"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "13" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "14" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "14" --key "plugin" "org.kde.plasma.notifications"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "14" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "15" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "15" --key "plugin" "org.kde.plasma.keyboardindicator"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "15" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "16" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "16" --key "plugin" "org.kde.plasma.vault"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "16" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "17" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "17" --key "plugin" "org.kde.plasma.nightcolorcontrol"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "17" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "20" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "20" --key "plugin" "org.kde.plasma.battery"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "20" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "21" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "21" --key "plugin" "org.kde.plasma.networkmanagement"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "21" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "9" --key "immutability" "1"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "9" --key "plugin" "org.kde.plasma.clipboard"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Applets" --group "9" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "Configuration" --key "PreloadWeight" "42"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "General" --key "extraItems" "org.kde.plasma.networkmanagement,org.kde.plasma.clipboard,org.kde.kdeconnect,org.kde.plasma.devicenotifier,org.kde.plasma.printmanager,org.kde.plasma.bluetooth,org.kde.plasma.battery,org.kde.plasma.volume,org.kde.plasma.keyboardlayout,org.kde.kupapplet,org.kde.plasma.notifications,org.kde.plasma.keyboardindicator,org.kde.plasma.vault,org.kde.plasma.mediacontroller,org.kde.plasma.nightcolorcontrol"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "Containments" --group "8" --group "General" --key "knownItems" "org.kde.plasma.networkmanagement,org.kde.plasma.clipboard,org.kde.kdeconnect,org.kde.plasma.devicenotifier,org.kde.plasma.printmanager,org.kde.plasma.bluetooth,org.kde.plasma.battery,org.kde.plasma.volume,org.kde.plasma.keyboardlayout,org.kde.kupapplet,org.kde.plasma.notifications,org.kde.plasma.keyboardindicator,org.kde.plasma.vault,org.kde.plasma.mediacontroller,org.kde.plasma.nightcolorcontrol"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file plasma-org.kde.plasma.desktop-appletsrc --group "ScreenMapping" --key "itemsOnDisabledScreens" ""', shell=True, check=False)
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8"], "activityId", "")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8"], "formfactor", "2")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8"], "lastScreen", "0")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8"], "location", "3")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8"], "plugin", "org.kde.plasma.private.systemtray")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8"], "wallpaperplugin", "org.kde.image")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "10"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "10"], "plugin", "org.kde.kdeconnect")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "10", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "11"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "11"], "plugin", "org.kde.plasma.devicenotifier")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "11", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "12"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "12"], "plugin", "org.kde.plasma.printmanager")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "12", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "13"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "13"], "plugin", "org.kde.plasma.volume")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "13", "Configuration", "General"], "showVirtualDevices", "true")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "13", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "14"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "14"], "plugin", "org.kde.plasma.notifications")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "14", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "15"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "15"], "plugin", "org.kde.plasma.keyboardindicator")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "15", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "16"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "16"], "plugin", "org.kde.plasma.vault")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "16", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "17"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "17"], "plugin", "org.kde.plasma.nightcolorcontrol")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "17", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "20"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "20"], "plugin", "org.kde.plasma.battery")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "20", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "21"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "21"], "plugin", "org.kde.plasma.networkmanagement")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "21", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "9"], "immutability", "1")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "9"], "plugin", "org.kde.plasma.clipboard")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Applets", "9", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "Configuration"], "PreloadWeight", "42")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "General"], "extraItems", "org.kde.plasma.networkmanagement,org.kde.plasma.clipboard,org.kde.kdeconnect,org.kde.plasma.devicenotifier,org.kde.plasma.printmanager,org.kde.plasma.bluetooth,org.kde.plasma.battery,org.kde.plasma.volume,org.kde.plasma.keyboardlayout,org.kde.kupapplet,org.kde.plasma.notifications,org.kde.plasma.keyboardindicator,org.kde.plasma.vault,org.kde.plasma.mediacontroller,org.kde.plasma.nightcolorcontrol")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", ["Containments", "8", "General"], "knownItems", "org.kde.plasma.networkmanagement,org.kde.plasma.clipboard,org.kde.kdeconnect,org.kde.plasma.devicenotifier,org.kde.plasma.printmanager,org.kde.plasma.bluetooth,org.kde.plasma.battery,org.kde.plasma.volume,org.kde.plasma.keyboardlayout,org.kde.kupapplet,org.kde.plasma.notifications,org.kde.plasma.keyboardindicator,org.kde.plasma.vault,org.kde.plasma.mediacontroller,org.kde.plasma.nightcolorcontrol")
+    kwriteconfig("plasma-org.kde.plasma.desktop-appletsrc", "ScreenMapping", "itemsOnDisabledScreens", "")
     print('Use "nohup plasmashell --replace > /dev/null &" to refresh plasma shell.')
 # Dolphin bookmarks
 places_xml_path = os.path.join(USERHOME, ".local", "share", "user-places.xbel")
@@ -761,8 +1025,8 @@ if shutil.which("konsole"):
     kwriteconfig("konsolerc", "TabBar", "NewTabButton", "true")
     kwriteconfig("konsolerc", "TabBar", "TabBarPosition", "Top")
     kwriteconfig("konsolerc", "TabBar", "TabBarVisibility", "AlwaysShowTabBar")
-    subprocess.run('kwriteconfig6 --file konsolerc --group "MainWindow" --group "Toolbar mainToolBar" --key ToolButtonStyle "IconOnly"', shell=True, check=False)
-    subprocess.run('kwriteconfig6 --file konsolerc --group "MainWindow" --group "Toolbar sessionToolbar" --key ToolButtonStyle "IconOnly"', shell=True, check=False)
+    kwriteconfig("konsolerc", ["MainWindow", "Toolbar mainToolBar"], "ToolButtonStyle", "IconOnly")
+    kwriteconfig("konsolerc", ["MainWindow", "Toolbar sessionToolbar"], "ToolButtonStyle", "IconOnly")
     # Konsole profile settings
     os.makedirs("{0}/.local/share/konsole".format(USERHOME), exist_ok=True)
     kwriteconfig(os.path.join(USERHOME, ".local", "share", "konsole", "Profile 1.profile"), "General", "Name", "Profile 1")
@@ -774,10 +1038,10 @@ if shutil.which("konsole"):
     kwriteconfig(os.path.join(USERHOME, ".local", "share", "konsole", "Profile 1.profile"), "General", "TerminalRows", "30")
     # Fish config for konsole
     if shutil.which("fish"):
-        subprocess.run('kwriteconfig6 --file konsolerc --group "Desktop Entry" --key DefaultProfile "Profile 1.profile"', shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file "$HOME/.local/share/konsole/Profile 1.profile" --group "General" --key Name "Profile 1"', shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file "$HOME/.local/share/konsole/Profile 1.profile" --group "General" --key Parent "FALLBACK/"', shell=True, check=False)
-        subprocess.run('kwriteconfig6 --file "$HOME/.local/share/konsole/Profile 1.profile" --group "General" --key Command "$(which fish)"', shell=True, check=False)
+        kwriteconfig("konsolerc", "Desktop Entry", "DefaultProfile", "Profile 1.profile")
+        kwriteconfig(os.path.join(USERHOME, ".local", "share", "konsole", "Profile 1.profile"), "General", "Name", "Profile 1")
+        kwriteconfig(os.path.join(USERHOME, ".local", "share", "konsole", "Profile 1.profile"), "General", "Parent", "FALLBACK/")
+        kwriteconfig(os.path.join(USERHOME, ".local", "share", "konsole", "Profile 1.profile"), "General", "Command", shutil.which("fish"))
 
 # Konsole session
 konsolesession_xml_path = os.path.join(USERHOME, ".local", "share", "kxmlgui5", "konsole", "sessionui.rc")
@@ -865,7 +1129,7 @@ if shutil.which("xfconf-query") and shutil.which("xfce4-panel"):
     # List panels
     # xfconf-query -c xfce4-panel -p /panels -lv
     # Setup 2 panels
-    subprocess.run("xfconf-query -c xfce4-panel -p /panels -t int -s 1 -t int -s 2 -a", shell=True, check=False)
+    xfconf_array("xfce4-panel", "/panels", "int", [1, 2])
     # Panel settings
     xfconf("xfce4-panel", "/panels/panel-1/length", "int", "100")
     xfconf("xfce4-panel", "/panels/panel-2/length", "int", "100")
@@ -883,7 +1147,7 @@ if shutil.which("xfconf-query") and shutil.which("xfce4-panel"):
     # List plugins
     # xfconf-query -c xfce4-panel -p /plugins -lv
     # Delete all existing plugin ids
-    subprocess.run("xfconf-query -c xfce4-panel -p /plugins --reset --recursive", shell=True, check=False)
+    xfconf_reset("xfce4-panel", "/plugins", recursive=True)
     # Recreate plugin ids
     xfconf("xfce4-panel", "/plugins/plugin-1", "string", "applicationsmenu")
     xfconf("xfce4-panel", "/plugins/plugin-2", "string", "actions")
@@ -906,24 +1170,25 @@ if shutil.which("xfconf-query") and shutil.which("xfce4-panel"):
     # Panel shortcuts
     xfce_search_list = ["firefox.desktop", "brave-browser.desktop", "chrome.desktop", 'org.mozilla.thunderbird_esr.desktop', 'thunderbird.desktop', 'thunar.desktop', "ptyxis.desktop", "tilix.desktop", "xfce4-terminal.desktop", 'virt-manager.desktop', 'xfce4-taskmanager.desktop', 'org.gnome.SystemMonitor.desktop']
     xfce_file_list = []
-    xfce_panel_string = ""
+    xfce_panel_ids = []
     xfce_panel_id = 20
     for d in xfce_search_list:
         ds = CMimeSet.LocateDesktopFileName(d)
         if ds:
             xfconf("xfce4-panel", "/plugins/plugin-{0}".format(xfce_panel_id), "string", "launcher")
             xfconf("xfce4-panel", "/plugins/plugin-{0}/items".format(xfce_panel_id), "string", ds, extra_options=['--force-array'])
-            xfce_panel_string += " -t int -s {0}".format(xfce_panel_id)
+            xfce_panel_ids.append(xfce_panel_id)
             xfce_panel_id = xfce_panel_id + 1
 
     # List existing array
     # xfconf-query -c xfce4-panel -p /panels/panel-2/plugin-ids
     # Delete existing plugin arrays
-    subprocess.run("xfconf-query -c xfce4-panel -p /panels/panel-1/plugin-ids -rR", shell=True, check=False)
-    subprocess.run("xfconf-query -c xfce4-panel -p /panels/panel-2/plugin-ids -rR", shell=True, check=False)
+    xfconf_reset("xfce4-panel", "/panels/panel-1/plugin-ids", recursive=True)
+    xfconf_reset("xfce4-panel", "/panels/panel-2/plugin-ids", recursive=True)
     # Create plugins for panels
-    subprocess.run("xfconf-query -c xfce4-panel -p /panels/panel-1/plugin-ids -t int -s 9 -t int -s 1 -t int{0} -s 11 -t int -s 12 -t int -s 13 -t int -s 14 -t int -s 15 -t int -s 6 -t int -s 5 -t int -s 2 --force-array --create".format(xfce_panel_string), shell=True, check=False)
-    subprocess.run("xfconf-query -c xfce4-panel -p /panels/panel-2/plugin-ids -t int -s 3 --force-array --create", shell=True, check=False)
+    xfconf_array("xfce4-panel", "/panels/panel-1/plugin-ids", "int", [9, 1] + xfce_panel_ids + [11, 12, 13, 14, 15, 6, 5, 2])
+    xfconf_array("xfce4-panel", "/panels/panel-2/plugin-ids", "int", [3])
+    xfconf_flush()
 
     # Reset the panel
     if subprocess.run(["pgrep", "xfce4-panel"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False).returncode == 0:
@@ -1243,3 +1508,9 @@ dpmsEnabled:    True
 """
     with open(xscreensaver_file, 'w') as f:
         f.write(xscreensaver_text)
+
+# Write all queued settings.
+dconf_flush()
+kwriteconfig_flush()
+xfconf_flush()
+print("Settings: {changed} changed, {unchanged} unchanged, {failed} failed.".format(**settings_summary))
@@ -21,6 +21,10 @@ SCRIPTDIR = sys.path[0]
 ### Functions ###
 def apkinstall(apks):
     """Install packages with apk."""
+    apks = CFunc.package_index_filter("apk", apks)
+    if apks is None:
+        return
+    CFunc.package_index_invalidate("apk")
     subprocess.run(f"apk add {apks}", shell=True)
     # Run apk fix after every install due to I/O errors.
     apkfix()
@@ -67,6 +71,7 @@ subprocess.run("apk upgrade --update-cache --available", shell=True)
 apkinstall("btop git nano sudo bash zsh fish starship topgrade shadow tmux perl-datetime-hires rsync curl util-linux util-linux-login")
 # Replace doas with sudo
 subprocess.run("apk del doas", shell=True, check=False)
+CFunc.package_index_invalidate("apk")
 apkinstall("sudo")
 # Sudoers changes
 CFuncExt.SudoersEnvSettings()
@@ -166,3 +171,4 @@ subprocess.run(os.path.join(SCRIPTDIR, "CVMGeneral.py"), shell=True, check=True)
 subprocess.run(os.path.join(SCRIPTDIR, "Cxdgdirs.py"), shell=True, check=True)
 # subprocess.run(os.path.join(SCRIPTDIR, "Czram.py"), shell=True, check=True)
 subprocess.run(os.path.join(SCRIPTDIR, "CSysConfig.sh"), shell=True, check=True)
+CFunc.package_index_summary()
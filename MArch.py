@@ -39,6 +39,7 @@ def pacman_check_remove(package):
     package_found_status = subprocess.run("pacman -Qi {0}".format(package), shell=True, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
     if package_found_status == 0:
         subprocess.run("pacman -Rscn --noconfirm {0}".format(package), shell=True, check=False)
+        CFunc.package_index_invalidate("pacman")
 def lightdm_configure():
     """Configure lightdm"""
     CFunc.pacman_install("lightdm lightdm-webkit2-greeter lightdm-webkit-theme-litarvan")
@@ -174,31 +175,33 @@ if __name__ == '__main__':
         CFunc.pacman_install("xorg xorg-drivers")
         # Update font cache
         subprocess.run("fc-cache", shell=True, check=True)
-        # Browsers
-        CFunc.pacman_install("firefox")
-        # Cups
-        CFunc.pacman_install("cups-pdf")
-        # Remote access
-        CFunc.pacman_install("remmina")
-        CFunc.pacman_install("ffmpeg mpv yt-dlp")
-        yay_install(USERNAMEVAR, "yt-dlp-drop-in")
-        # Editors
-        yay_install(USERNAMEVAR, "vscodium-bin")
-        # Syncthing
-        CFunc.pacman_install("syncthing")
-        CFunc.pacman_install("dconf-editor")
-        CFunc.pacman_install("gnome-disk-utility")
+        with CFunc.package_batch():
+            # Browsers
+            CFunc.pacman_install("firefox")
+            # Cups
+            CFunc.pacman_install("cups-pdf")
+            # Remote access
+            CFunc.pacman_install("remmina")
+            CFunc.pacman_install("ffmpeg mpv yt-dlp")
+            yay_install(USERNAMEVAR, "yt-dlp-drop-in")
+            # Editors
+            yay_install(USERNAMEVAR, "vscodium-bin")
+            # Syncthing
+            CFunc.pacman_install("syncthing")
+            CFunc.pacman_install("dconf-editor")
+            CFunc.pacman_install("gnome-disk-utility")
 
     # Install software for VMs
     if vmstatus == "kvm":
         CFunc.pacman_install("spice-vdagent qemu-guest-agent")
         CFunc.sysctl_enable("spice-vdagentd qemu-guest-agent", error_on_fail=True)
     if vmstatus == "vbox":
-        if args.nogui:
-            CFunc.pacman_install("virtualbox-guest-utils-nox")
-        else:
-            CFunc.pacman_install("virtualbox-guest-utils")
-        CFunc.pacman_install("virtualbox-guest-dkms")
+        with CFunc.package_batch():
+            if args.nogui:
+                CFunc.pacman_install("virtualbox-guest-utils-nox")
+            else:
+                CFunc.pacman_install("virtualbox-guest-utils")
+            CFunc.pacman_install("virtualbox-guest-dkms")
 
     # Install Desktop Software
     if args.desktop == "gnome":
@@ -293,4 +296,5 @@ if __name__ == '__main__':
     # Update system. Done at the end to avoid kernel updates.
     pacman_update()
 
+    CFunc.package_index_summary()
     print("\nScript End")
@@ -170,29 +170,30 @@ Acquire::ftp::Timeout "5";''')
     deb_mm(debrelease)
 
     # Cli Software
-    CFunc.aptinstall("ssh tmux zsh fish starship btrfs-progs f2fs-tools xfsprogs mdadm nano p7zip-full 7zip-rar unrar curl wget rsync less iotop sshfs sudo python-is-python3")
-    # Topgrade
-    CFuncExt.topgrade_install()
-    # Firmware
-    CFunc.aptinstall("firmware-linux")
-    # Needed for systemd user sessions.
-    CFunc.aptinstall("dbus-user-session")
-    # Samba
-    CFunc.aptinstall("samba cifs-utils")
-    # NTP
-    CFunc.aptinstall("systemd-timesyncd")
-    CFunc.sysctl_enable("systemd-timesyncd")
-    subprocess.run(["timedatectl", "set-local-rtc", "false"], check=True)
-    subprocess.run(["timedatectl", "set-ntp", "1"], check=True)
-    subprocess.run(["timedatectl", "set-timezone", "America/New_York"], check=True)
-    # Avahi
-    CFunc.aptinstall("avahi-daemon avahi-discover libnss-mdns")
-    # Firewalld
-    CFunc.aptinstall("firewalld")
-    CFunc.sysctl_enable("firewalld", now=True, error_on_fail=True)
-    CFuncExt.FirewalldConfig()
-    # Container stuff
-    CFunc.aptinstall("podman")
+    with CFunc.package_batch():
+        CFunc.aptinstall("ssh tmux zsh fish starship btrfs-progs f2fs-tools xfsprogs mdadm nano p7zip-full 7zip-rar unrar curl wget rsync less iotop sshfs sudo python-is-python3")
+        # Topgrade
+        CFuncExt.topgrade_install()
+        # Firmware
+        CFunc.aptinstall("firmware-linux")
+        # Needed for systemd user sessions.
+        CFunc.aptinstall("dbus-user-session")
+        # Samba
+        CFunc.aptinstall("samba cifs-utils")
+        # NTP
+        CFunc.aptinstall("systemd-timesyncd")
+        CFunc.sysctl_enable("systemd-timesyncd")
+        subprocess.run(["timedatectl", "set-local-rtc", "false"], check=True)
+        subprocess.run(["timedatectl", "set-ntp", "1"], check=True)
+        subprocess.run(["timedatectl", "set-timezone", "America/New_York"], check=True)
+        # Avahi
+        CFunc.aptinstall("avahi-daemon avahi-discover libnss-mdns")
+        # Firewalld
+        CFunc.aptinstall("firewalld")
+        CFunc.sysctl_enable("firewalld", now=True, error_on_fail=True)
+        CFuncExt.FirewalldConfig()
+        # Container stuff
+        CFunc.aptinstall("podman")
 
     # Sudoers changes
     CFuncExt.SudoersEnvSettings()
@@ -208,15 +209,16 @@ Acquire::ftp::Timeout "5";''')
 
     # General GUI software
     if args.nogui is False:
-        CFunc.aptinstall("synaptic gnome-disk-utility gdebi gparted xdg-utils")
-        CFunc.aptinstall("dconf-cli dconf-editor")
-        # Cups-pdf
-        CFunc.aptinstall("printer-driver-cups-pdf")
-        # Media Playback
-        CFunc.aptinstall("ffmpeg")
-        CFuncExt.ytdlp_install()
-        CFunc.aptinstall("gstreamer1.0-vaapi")
-        CFunc.aptinstall("fonts-powerline fonts-noto fonts-roboto")
+        with CFunc.package_batch():
+            CFunc.aptinstall("synaptic gnome-disk-utility gdebi gparted xdg-utils")
+            CFunc.aptinstall("dconf-cli dconf-editor")
+            # Cups-pdf
+            CFunc.aptinstall("printer-driver-cups-pdf")
+            # Media Playback
+            CFunc.aptinstall("ffmpeg")
+            CFuncExt.ytdlp_install()
+            CFunc.aptinstall("gstreamer1.0-vaapi")
+            CFunc.aptinstall("fonts-powerline fonts-noto fonts-roboto")
         # VSCodium
         vscode_deb()
         # Flatpak
@@ -236,40 +238,43 @@ Acquire::ftp::Timeout "5";''')
         # Install pacstall
         pacstall_install()
 
-        # Install Desktop Software
-        if args.desktop == "gnome":
-            print("\n Installing gnome desktop")
-            CFunc.aptinstall("gnome-core")
-            CFunc.aptinstall("gnome-clocks")
-            CFunc.aptinstall("gnome-shell-extensions gnome-shell-extension-gpaste")
-            CFunc.aptinstall("ptyxis", error_on_fail=False)
-            gs_installer = CFuncExt.gse_script_install()
-            # Dash to panel
-            CFunc.run_as_user_su(USERNAMEVAR, "{0} --yes 1160".format(gs_installer))
-            # Kstatusnotifier
-            CFunc.run_as_user_su(USERNAMEVAR, "{0} --yes 615".format(gs_installer))
-        elif args.desktop == "mate":
-            print("\n Installing mate desktop")
-            CFunc.aptinstall("task-mate-desktop mate-tweak dconf-cli")
-            CFunc.aptinstall("mate-applet-brisk-menu")
-            # Run MATE Configuration
-            subprocess.run("{0}/DExtMate.py".format(SCRIPTDIR), shell=True, check=True)
-        elif args.desktop == "kde":
-            print("\n Installing kde desktop")
-            CFunc.aptinstall("task-kde-desktop")
-        elif args.desktop == "xfce":
-            print("\n Installing xfce desktop")
-            CFunc.aptinstall("task-xfce-desktop")
-        elif args.desktop == "lxqt":
-            print("\n INstalling lxqt desktop")
-            CFunc.aptinstall("task-lxqt-desktop")
+        with CFunc.package_batch():
+            # Install Desktop Software
+            if args.desktop == "gnome":
+                print("\n Installing gnome desktop")
+                CFunc.aptinstall("gnome-core")
+                CFunc.aptinstall("gnome-clocks")
+                CFunc.aptinstall("gnome-shell-extensions gnome-shell-extension-gpaste")
+                CFunc.aptinstall("ptyxis", error_on_fail=False)
+                gs_installer = CFuncExt.gse_script_install()
+                # Dash to panel
+                CFunc.run_as_user_su(USERNAMEVAR, "{0} --yes 1160".format(gs_installer))
+                # Kstatusnotifier
+                CFunc.run_as_user_su(USERNAMEVAR, "{0} --yes 615".format(gs_installer))
+            elif args.desktop == "mate":
+                print("\n Installing mate desktop")
+                CFunc.aptinstall("task-mate-desktop mate-tweak dconf-cli")
+                CFunc.aptinstall("mate-applet-brisk-menu")
+                CFunc.package_batch_flush()
+                # Run MATE Configuration
+                subprocess.run("{0}/DExtMate.py".format(SCRIPTDIR), shell=True, check=True)
+            elif args.desktop == "kde":
+                print("\n Installing kde desktop")
+                CFunc.aptinstall("task-kde-desktop")
+            elif args.desktop == "xfce":
+                print("\n Installing xfce desktop")
+                CFunc.aptinstall("task-xfce-desktop")
+            elif args.desktop == "lxqt":
+                print("\n INstalling lxqt desktop")
+                CFunc.aptinstall("task-lxqt-desktop")
         # Post DE install stuff.
         # Numix Icon Theme
         CFuncExt.numix_icons(os.path.join(os.sep, "usr", "local", "share", "icons"))
 
     # Network Manager
-    CFunc.aptinstall("network-manager network-manager-ssh")
-    CFunc.aptinstall("network-manager-config-connectivity-debian")
+    with CFunc.package_batch():
+        CFunc.aptinstall("network-manager network-manager-ssh")
+        CFunc.aptinstall("network-manager-config-connectivity-debian")
     subprocess.run("sed -i 's/managed=.*/managed=true/g' /etc/NetworkManager/NetworkManager.conf", shell=True, check=True)
     # https://askubuntu.com/questions/882806/ethernet-device-not-managed
     with open('/etc/NetworkManager/conf.d/10-globally-managed-devices.conf', 'w') as writefile:
@@ -287,9 +292,10 @@ Acquire::ftp::Timeout "5";''')
     if vmstatus == "kvm":
         CFunc.aptinstall("spice-vdagent qemu-guest-agent")
     if vmstatus == "vbox":
-        CFunc.aptinstall("virtualbox-guest-utils virtualbox-guest-dkms dkms")
-        if not args.nogui:
-            CFunc.aptinstall("virtualbox-guest-x11")
+        with CFunc.package_batch():
+            CFunc.aptinstall("virtualbox-guest-utils virtualbox-guest-dkms dkms")
+            if not args.nogui:
+                CFunc.aptinstall("virtualbox-guest-x11")
         subprocess.run("gpasswd -a {0} vboxsf".format(USERNAMEVAR), shell=True, check=True)
         CFunc.sysctl_enable("virtualbox-guest-utils", error_on_fail=True)
 
@@ -351,4 +357,5 @@ Acquire::ftp::Timeout "5";''')
     subprocess.run(os.path.join(SCRIPTDIR, "Czram.py"), shell=True, check=True)
     subprocess.run(os.path.join(SCRIPTDIR, "CSysConfig.sh"), shell=True, check=True)
 
+    CFunc.package_index_summary()
     print("\nScript End")
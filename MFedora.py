@@ -36,6 +36,7 @@ metadata_expire=1h
 """)
 def fed_starship():
     """Install starship"""
+    CFunc.package_batch_flush()
     subprocess.run("dnf copr enable -y atim/starship", shell=True, check=True)
     CFunc.dnfinstall("starship")
 def fed_packer_repo():
@@ -68,6 +69,8 @@ def fed_cli(sysd_status: bool, vmstatus: str):
     CFuncExt.topgrade_install()
     # Podman
     CFunc.dnfinstall("podman")
+    # Install queued packages before the sudoers changes look them up.
+    CFunc.package_batch_flush()
     # Sudoers changes
     CFuncExt.SudoersEnvSettings()
     # Edit sudoers to add dnf.
@@ -135,8 +138,10 @@ def fed_desktop(desktop: str = None):
         # Applications
         CFunc.dnfinstall("dconf-editor")
         # Brisk-menu
+        CFunc.package_batch_flush()
         subprocess.run("dnf copr enable -y rmkrishna/rpms", shell=True, check=True)
         CFunc.dnfinstall("brisk-menu")
+        CFunc.package_batch_flush()
         # Run MATE Configuration
         subprocess.run("{0}/DExtMate.py".format(SCRIPTDIR), shell=True, check=False)
     elif desktop == "xfce":
@@ -155,6 +160,7 @@ def fed_desktop(desktop: str = None):
 def fed_flatpak():
     """Fedora: Flatpak setup"""
     CFunc.dnfinstall("flatpak xdg-desktop-portal")
+    CFunc.package_batch_flush()
     flatpak_sudoersfile = os.path.join(os.sep, "etc", "sudoers.d", "flatpak")
     CFunc.AddLineToSudoersFile(flatpak_sudoersfile, "{0} ALL=(ALL) NOPASSWD: {1}".format(USERNAMEVAR, shutil.which("flatpak")))
     subprocess.run(os.path.join(SCRIPTDIR, "CFlatpakConfig.py"), shell=True, check=True)
@@ -195,16 +201,19 @@ if __name__ == '__main__':
     CFunc.dnfupdate()
 
     ### Install Fedora Software ###
-    fed_cli(sysd_status=sysd_status, vmstatus=vmstatus)
+    with CFunc.package_batch():
+        fed_cli(sysd_status=sysd_status, vmstatus=vmstatus)
 
-    # GUI Packages
-    if not args.nogui:
-        fed_gui()
-        if not args.bootc:
-            fed_flatpak()
+        # GUI Packages
+        if not args.nogui:
+            fed_gui()
+            if not args.bootc:
+                fed_flatpak()
+
+        if not args.nogui:
+            fed_desktop(args.desktop)
 
     if not args.nogui:
-        fed_desktop(args.desktop)
         CFuncExt.numix_icons()
 
     # Add normal user to all reasonable groups
@@ -230,11 +239,12 @@ if __name__ == '__main__':
     CFunc.AddUserToGroup("nm-openconnect")
     CFunc.AddUserToGroup("vboxsf")
 
-    # Hdparm
-    CFunc.dnfinstall("smartmontools hdparm")
+    with CFunc.package_batch():
+        # Hdparm
+        CFunc.dnfinstall("smartmontools hdparm")
 
-    # Plymouth and grub
-    CFunc.dnfinstall("plymouth-theme-spinner")
+        # Plymouth and grub
+        CFunc.dnfinstall("plymouth-theme-spinner")
     if sysd_status is True:
         subprocess.run("plymouth-set-default-theme spinner -R", shell=True, check=True)
         grub_config = os.path.join(os.sep, "etc", "default", "grub")
@@ -257,4 +267,5 @@ if __name__ == '__main__':
     subprocess.run([os.path.join(SCRIPTDIR, "Cxdgdirs.py")], check=True)
     subprocess.run([os.path.join(SCRIPTDIR, "Czram.py")], check=True)
     subprocess.run([os.path.join(SCRIPTDIR, "CSysConfig.sh")], check=True)
+    CFunc.package_index_summary()
     print("\nScript End")
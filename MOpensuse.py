@@ -26,6 +26,10 @@ def repos():
     subprocess.run('zypper --gpg-auto-import-keys refresh', shell=True, check=True)
 def zypp_install(packages: str):
     """Install packages using zypper."""
+    packages = CFunc.package_index_filter("zypper", packages)
+    if packages is None:
+        return
+    CFunc.package_index_invalidate("zypper")
     subprocess.run(f"zypper install -y {packages}", shell=True, check=True)
 
 
@@ -120,20 +120,21 @@ if __name__ == '__main__':
     CFuncExt.topgrade_install()
     # Timezone stuff
     subprocess.run("dpkg-reconfigure -f noninteractive tzdata", shell=True, check=True)
-    # Needed for systemd user sessions.
-    CFunc.aptinstall("dbus-user-session")
-    # Samba
-    CFunc.aptinstall("samba cifs-utils")
-    # NTP
-    subprocess.run("""systemctl enable systemd-timesyncd
+    with CFunc.package_batch():
+        # Needed for systemd user sessions.
+        CFunc.aptinstall("dbus-user-session")
+        # Samba
+        CFunc.aptinstall("samba cifs-utils")
+        # NTP
+        subprocess.run("""systemctl enable systemd-timesyncd
     timedatectl set-local-rtc false
     timedatectl set-ntp 1""", shell=True, check=True)
-    # Avahi
-    CFunc.aptinstall("avahi-daemon avahi-discover libnss-mdns")
-    # Java
-    CFunc.aptinstall("default-jre")
-    # Drivers
-    CFunc.aptinstall("intel-microcode")
+        # Avahi
+        CFunc.aptinstall("avahi-daemon avahi-discover libnss-mdns")
+        # Java
+        CFunc.aptinstall("default-jre")
+        # Drivers
+        CFunc.aptinstall("intel-microcode")
     # Syncthing
     MDebian.syncthing()
 
@@ -222,17 +223,18 @@ renderer: NetworkManager""")
         # Numix Icon Theme
         CFuncExt.numix_icons(os.path.join(os.sep, "usr", "local", "share", "icons"))
 
-        CFunc.aptinstall("dconf-cli dconf-editor")
-        CFunc.aptinstall("synaptic gnome-disk-utility gdebi gparted xdg-utils")
-        CFunc.aptinstall("fonts-powerline fonts-noto fonts-roboto")
-        subprocess.run("echo ttf-mscorefonts-installer msttcorefonts/accepted-mscorefonts-eula select true | debconf-set-selections", shell=True, check=True)
-        CFunc.aptinstall("ttf-mscorefonts-installer")
-        # Cups-pdf
-        CFunc.aptinstall("printer-driver-cups-pdf")
-        # Media Playback
-        CFunc.aptinstall("gstreamer1.0-vaapi")
-        # Flatpak
-        CFunc.aptinstall("flatpak")
+        with CFunc.package_batch():
+            CFunc.aptinstall("dconf-cli dconf-editor")
+            CFunc.aptinstall("synaptic gnome-disk-utility gdebi gparted xdg-utils")
+            CFunc.aptinstall("fonts-powerline fonts-noto fonts-roboto")
+            subprocess.run("echo ttf-mscorefonts-installer msttcorefonts/accepted-mscorefonts-eula select true | debconf-set-selections", shell=True, check=True)
+            CFunc.aptinstall("ttf-mscorefonts-installer")
+            # Cups-pdf
+            CFunc.aptinstall("printer-driver-cups-pdf")
+            # Media Playback
+            CFunc.aptinstall("gstreamer1.0-vaapi")
+            # Flatpak
+            CFunc.aptinstall("flatpak")
         CFunc.AddLineToSudoersFile(sudoersfile, "{0} ALL=(ALL) NOPASSWD: {1}".format(USERNAMEVAR, shutil.which("flatpak")))
         subprocess.run(os.path.join(SCRIPTDIR, "CFlatpakConfig.py"), shell=True, check=True)
         # Browsers
@@ -259,9 +261,10 @@ yt-dlp""")
     if vmstatus == "kvm":
         CFunc.aptinstall("spice-vdagent qemu-guest-agent")
     if vmstatus == "vbox":
-        CFunc.aptinstall("virtualbox-guest-utils virtualbox-guest-dkms dkms")
-        if not args.nogui:
-            CFunc.aptinstall("virtualbox-guest-x11")
+        with CFunc.package_batch():
+            CFunc.aptinstall("virtualbox-guest-utils virtualbox-guest-dkms dkms")
+            if not args.nogui:
+                CFunc.aptinstall("virtualbox-guest-x11")
         subprocess.run("gpasswd -a {0} vboxsf".format(USERNAMEVAR), shell=True, check=True)
         subprocess.run("systemctl enable virtualbox-guest-utils", shell=True, check=True)
 
@@ -304,4 +307,5 @@ yt-dlp""")
     subprocess.run("{0}/Czram.py".format(SCRIPTDIR), shell=True, check=True)
     subprocess.run("{0}/CSysConfig.sh".format(SCRIPTDIR), shell=True, check=True)
 
+    CFunc.package_index_summary()
     print("\nScript End")
@@ -15,6 +15,7 @@ import tempfile
 import time
 # Custom includes
 import CFunc
+import CPkgProxy
 import Pkvm
 import Snetvm
 
@@ -218,6 +219,7 @@ if __name__ == '__main__':
     parser.add_argument("-z", "--vmpass", help="VM Password", default="asdf")
     parser.add_argument("-m", "--memory", help="Memory for VM (default: %(default)s)", default=Pkvm.vm_memory_range())
     parser.add_argument("--noprompt", help='Do not prompt to continue.', action="store_true")
+    parser.add_argument("--pkgproxy", type=int, help="Cache packages downloaded by the VM with a local caching http proxy on this port, which the host firewall must allow from the libvirt network (default port: %(const)s)", nargs="?", const=3142)
     args = parser.parse_args()
 
     debversion = ""
@@ -404,6 +406,13 @@ chown {args.vmuser}:users -R ~{args.vmuser}
     # Bootstrap the VM.
     sship = vm_getip(vm_name)
     ssh_wait(ip=sship, port=localsshport, user=args.livesshuser, password=args.livesshpass)
+    # Start the package proxy on the host address of the libvirt network, and use it in both scripts.
+    pkgproxy_server = None
+    if args.pkgproxy:
+        pkgproxy_server = CPkgProxy.proxy_start(host=CPkgProxy.proxy_host_address(sship), port=args.pkgproxy)
+        pkgproxy_url = "http://{0}:{1}".format(*pkgproxy_server.server_address)
+        vmbootstrap_cmd = vmbootstrap_cmd.replace("#!/bin/bash\n", f"#!/bin/bash\nexport http_proxy={pkgproxy_url} HTTP_PROXY={pkgproxy_url}\n", 1)
+        vmprovision_cmd = vmprovision_cmd.replace("#!/bin/bash\n", f"#!/bin/bash\nexport http_proxy={pkgproxy_url} HTTP_PROXY={pkgproxy_url}\n", 1)
     # Pre-bootstrap commands
     if args.ostype == 2:
         scp_vm(ip=sship, port=localsshport, user=args.livesshuser, password=args.livesshpass, filepath=args.nixconfig, destination="/nixos_config", folder=True)
@@ -425,4 +434,7 @@ chown {args.vmuser}:users -R ~{args.vmuser}
     vm_shutdown(vm_name)
     # Save finish time.
     fullfinishtime = datetime.datetime.now()
+    if pkgproxy_server:
+        CPkgProxy.proxy_stop(pkgproxy_server)
+        logging.info(CPkgProxy.proxy_report())
     logging.info("Creation completed in {0}".format(str(fullfinishtime - beforetime)))
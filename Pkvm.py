@@ -8,7 +8,7 @@ Libvirt: https://github.com/thomasklein94/packer-plugin-libvirt , https://develo
 
 # Python includes.
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta
 import functools
 import hashlib
 import json
@@ -16,16 +16,21 @@ import logging
 import multiprocessing
 import os
 import pathlib
+import re
 import shutil
 import signal
 import subprocess
 import sys
+import tarfile
 import tempfile
+import time
+import urllib.parse
 import urllib.request
 import xml.etree.ElementTree as ET
 # Custom includes
 from passlib import hash
 import CFunc
+import CPkgProxy
 import CVirtFuncs
 import PCreateChrootVM
 
@@ -34,19 +39,18 @@ print = functools.partial(print, flush=True)
 
 # Folder of this script
 SCRIPTDIR = os.path.abspath(os.path.dirname(__file__))
+# Seconds to keep published iso checksums before fetching the manifest again.
+CHECKSUM_TTL = 6 * 3600
 
 
 ### Functions ###
-def md5sum(md5_filename, blocksize=65536):
+def md5sum(md5_filename, blocksize=65536, indexpath: str = None):
     """
     Calculate the MD5Sum of a file
     https://stackoverflow.com/a/21565932
+    indexpath: Persistent digest index, which returns the stored MD5Sum if the file is unchanged.
     """
-    hashmd5 = hashlib.md5()
-    with open(md5_filename, "rb") as f:
-        for block in iter(lambda: f.read(blocksize), b""):
-            hashmd5.update(block)
-    return hashmd5.hexdigest()
+    return CFunc.file_digests(md5_filename, ("md5",), blocksize=blocksize, indexpath=indexpath)["md5"]
 def vm_memory_range(sizemb_upper: int = 16384, sizemb_lower: int = 4096):
     """Return memory in MB for a VM, bounded by the specified range."""
     mem_mb = int(((os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')) / (1024.**2)) / 4)
@@ -68,6 +72,65 @@ def packerversion_get():
         break
     print("Detected packer version: {0}".format(latestrelease))
     return latestrelease
+def checksum_manifest_parse(text: str):
+    """Parse a checksum manifest, in sha256sum or BSD (SHA256 (file) = hash) format, into a dict of file name to sha256."""
+    sums = {}
+    for line in text.splitlines():
+        match = re.match(r"^SHA256 \((.+)\) = ([0-9a-fA-F]{64})$", line.strip())
+        if match:
+            sums[match.group(1)] = match.group(2).lower()
+            continue
+        match = re.match(r"^([0-9a-fA-F]{64}) [ *](.+)$", line.strip())
+        if match:
+            sums[match.group(2).strip()] = match.group(1).lower()
+    return sums
+def checksum_manifest_urls(isourl: str):
+    """Yield the possible checksum manifest urls for an iso."""
+    folder = isourl.rsplit("/", 1)[0] + "/"
+    # Alpine (per file), Ubuntu and Debian, AlmaLinux.
+    yield isourl + ".sha256"
+    yield folder + "SHA256SUMS"
+    yield folder + "CHECKSUM"
+    # Fedora and FreeBSD manifests have release specific names, so look for them in the folder listing.
+    try:
+        with urllib.request.urlopen(folder, timeout=30) as response:
+            listing = response.read().decode("utf-8", errors="replace")
+    except (OSError, ValueError):
+        return
+    for name in sorted(set(re.findall(r'href="([^"/?]*(?:CHECKSUM|SHA256SUMS)[^"/?]*)"', listing))):
+        yield urllib.parse.urljoin(folder, name)
+def iso_checksum_resolve(isourl: str, cachepath: str, ttl: int = CHECKSUM_TTL, refresh: bool = False):
+    """
+    Return the published sha256 of an iso from the distro's checksum manifest, or None if it can't be found.
+    Resolved checksums are cached in the cachepath json file for ttl seconds.
+    """
+    cache = {}
+    if os.path.isfile(cachepath):
+        try:
+            with open(cachepath, 'r') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+    entry = cache.get(isourl)
+    if entry and not refresh and time.time() - entry["time"] < ttl:
+        return entry["sha256"]
+    filename = urllib.parse.unquote(os.path.basename(urllib.parse.urlparse(isourl).path))
+    for url in checksum_manifest_urls(isourl):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                sums = checksum_manifest_parse(response.read().decode("utf-8", errors="replace"))
+        except (OSError, ValueError):
+            continue
+        if filename in sums:
+            print("Published sha256 of {0} is {1} (from {2}).".format(filename, sums[filename], url))
+            cache[isourl] = {"time": time.time(), "sha256": sums[filename], "manifest": url}
+            os.makedirs(os.path.dirname(cachepath), exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(cachepath), prefix=".pkvm_checksums.", delete=False) as f:
+                json.dump(cache, f, indent=2)
+            os.replace(f.name, cachepath)
+            return sums[filename]
+    print("No published checksum found for {0}.".format(filename))
+    return None
 def xml_indent(elem, level=0):
     """
     Pretty Print XML using Python Standard libraries only
@@ -246,6 +309,263 @@ def sshkey_detect(user: str = os.getenv("USER")):
     else:
         sshkey = " "
     return sshkey
+def base_family(ostype: int):
+    """Return the distro name for OS types whose variants can share a golden base image, or None."""
+    if 1 <= ostype <= 5:
+        return "Fedora"
+    if 10 <= ostype <= 14:
+        return "Ubuntu"
+    if 15 <= ostype <= 19:
+        return "UbuntuLTS"
+    if 20 <= ostype <= 29:
+        return "AlmaLinux"
+    if 30 <= ostype <= 39:
+        return "Debian"
+    return None
+def base_image_path(vmpath: str, family: str, key_items: list, rebuild: bool = False):
+    """
+    Return the path of the golden base image for a distro. The name includes a hash of everything which changes the installed OS, and a generation number.
+    rebuild: Return the path of a new generation. Overlays use the old generation as their backing file, so it is never replaced.
+    """
+    key = hashlib.sha256(json.dumps(key_items).encode()).hexdigest()[:12]
+    basename = "Packer-Base-{0}-{1}".format(family, key)
+    # The first generation has no suffix, later ones are named -g2, -g3...
+    generation = 0
+    if os.path.isdir(os.path.join(vmpath, "bases")):
+        for filename in os.listdir(os.path.join(vmpath, "bases")):
+            if filename == basename + ".qcow2":
+                generation = max(generation, 1)
+            elif filename.startswith(basename + "-g") and filename.endswith(".qcow2") and filename[len(basename) + 2:-len(".qcow2")].isdigit():
+                generation = max(generation, int(filename[len(basename) + 2:-len(".qcow2")]))
+    if rebuild:
+        generation += 1
+    if generation <= 1:
+        return os.path.join(vmpath, "bases", basename + ".qcow2")
+    return os.path.join(vmpath, "bases", "{0}-g{1}.qcow2".format(basename, generation))
+def qcow2_compact(image_path: str, backing: str = None):
+    """
+    Rewrite a qcow2 image with zstd compression, dropping unused and zeroed clusters, and swap it in atomically.
+    backing: Keep this base image as the backing file, only writing the differences. Otherwise the image is flattened.
+    """
+    def image_size(path):
+        """Return the file size and allocated size of an image in MB."""
+        st = os.stat(path)
+        return st.st_size / 1024**2, st.st_blocks * 512 / 1024**2
+    starttime = datetime.now()
+    before_size, before_alloc = image_size(image_path)
+    temp_path = image_path + ".compact"
+    cmd = ["qemu-img", "convert", "-p", "-O", "qcow2", "-c", "-o", "compression_type=zstd"]
+    if backing:
+        cmd += ["-B", backing, "-F", "qcow2"]
+    subprocess.run(cmd + [image_path, temp_path], check=True)
+    os.replace(temp_path, image_path)
+    after_size, after_alloc = image_size(image_path)
+    logging.info("Compacted {0} from {1:.0f} MB ({2:.0f} MB allocated) to {3:.0f} MB ({4:.0f} MB allocated) in {5}.".format(image_path, before_size, before_alloc, after_size, after_alloc, str(datetime.now() - starttime)))
+def staging_manifest(scriptdir: str, entrypoints: list = None):
+    """
+    Return the files of the script folder which the entry scripts need, as names relative to the folder. Without entry scripts, all files are returned.
+    Imports are followed, as are file names mentioned in each file, which covers scripts run by path (like CShellConfig.py from MFedora.py).
+    """
+    names = {entry.name for entry in os.scandir(scriptdir) if entry.is_file()}
+    if entrypoints is None:
+        return sorted(names)
+    pending = [e for e in entrypoints if e in names]
+    manifest = set()
+    while pending:
+        name = pending.pop()
+        if name in manifest:
+            continue
+        manifest.add(name)
+        with open(os.path.join(scriptdir, name), 'r', errors='ignore') as f:
+            text = f.read()
+        found = set(re.findall(r"[\w.-]+", text))
+        if name.endswith(".py"):
+            for from_module, import_modules in re.findall(r"^\s*(?:from\s+(\w+)\s+import|import\s+([\w, .]+))", text, re.MULTILINE):
+                for module in [from_module] + import_modules.split(","):
+                    found.add(module.strip() + ".py")
+        pending += [n for n in found if n in names and n not in manifest]
+    return sorted(manifest)
+def staging_link(source: str, destination: str):
+    """Hardlink a file into the staged folder, or copy it across filesystems."""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+    return destination
+def staging_build(scriptdir: str, destination: str, entrypoints: list = None, templated: tuple = ("Win-provision.ps1",)):
+    """
+    Stage the script folder for a build with only the files in its manifest. Unmodified files are hardlinked (or copied across filesystems).
+    unattend/ and templated files are copied, since they are edited in the staged folder. The vsix cache of Cvscode.py is linked in when it exists, so VMs install extensions from it.
+    """
+    manifest = staging_manifest(scriptdir, entrypoints)
+    os.makedirs(destination)
+    for name in manifest:
+        if name in templated:
+            shutil.copy2(os.path.join(scriptdir, name), os.path.join(destination, name))
+        else:
+            staging_link(os.path.join(scriptdir, name), os.path.join(destination, name))
+    shutil.copytree(os.path.join(scriptdir, "unattend"), os.path.join(destination, "unattend"))
+    if os.path.isdir(os.path.join(scriptdir, "vsix")):
+        shutil.copytree(os.path.join(scriptdir, "vsix"), os.path.join(destination, "vsix"), copy_function=staging_link)
+    return manifest
+def staging_archive(folder: str, archive_path: str):
+    """Pack a staged folder into a gzip compressed tar, so it is uploaded to the guest as one file. Files are owned by root, like a direct upload."""
+    def tar_owner(tarinfo):
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = "root"
+        return tarinfo
+    with tarfile.open(archive_path, "w:gz", compresslevel=6) as tar:
+        tar.add(folder, arcname=os.path.basename(folder), filter=tar_owner)
+    return os.path.getsize(archive_path)
+def matrix_slots(memory_list: list, cpucores: int = multiprocessing.cpu_count(), jobs: int = None, reserve_mb: int = 2048):
+    """
+    Return how many builds can run at once, and the cores to give each build.
+    Builds are capped by the host memory (minus a reserve for the host) and by cores, allowing at least 2 cores per build.
+    """
+    host_mb = int((os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')) / (1024.**2))
+    slots_memory = (host_mb - reserve_mb) // max(min(memory_list), 1)
+    slots_cpu = cpucores // 2
+    slots = max(1, min(len(memory_list), slots_memory, slots_cpu))
+    if jobs:
+        slots = max(1, min(slots, jobs))
+    return slots, max(2, cpucores // slots) if cpucores >= 2 else 1
+def matrix_run(builds: list, vmpath: str, cpucores: int = multiprocessing.cpu_count(), jobs: int = None, http_port_base: int = 8100):
+    """
+    Build several VMs concurrently by running this script once per OS type.
+    builds: list of dicts with "ostype", "memory" (MB) and "args" (extra arguments for the build).
+    A build starts when a slot is free and its memory fits in what is left of the host memory. Each build gets its own log and packer http port range. The temp folder and swtpm socket are already separate per build, since they are created per VM name.
+    """
+    host_mb = int((os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')) / (1024.**2))
+    slots, cores = matrix_slots([b["memory"] for b in builds], cpucores=cpucores, jobs=jobs)
+    memory_budget = host_mb - 2048
+    print("Building {0} VMs, {1} at a time, with {2} cores each.".format(len(builds), slots, cores))
+    pending = list(enumerate(builds))
+    running = {}
+    results = []
+    matrix_start = datetime.now()
+    try:
+        while pending or running:
+            # Start builds which fit. If nothing is running, start the next build even if it uses more than the budget.
+            for idx, build in list(pending):
+                memory_used = sum(r["memory"] for r in running.values())
+                if len(running) >= slots or (running and memory_used + build["memory"] > memory_budget):
+                    continue
+                pending.remove((idx, build))
+                log_path = os.path.join(vmpath, "pkvm-matrix-{0}.log".format(build["ostype"]))
+                cmd = [sys.executable, os.path.abspath(__file__), "-a", str(build["ostype"]), "-p", vmpath, "-m", str(build["memory"]), "--cpus", str(cores), "--httpport", str(http_port_base + idx * 10), "--noprompt"] + build["args"]
+                log_handle = open(log_path, 'w')
+                print("Starting OS type {0} (log: {1}).".format(build["ostype"], log_path))
+                process = subprocess.Popen(cmd, stdout=log_handle, stderr=subprocess.STDOUT)
+                running[process] = {"ostype": build["ostype"], "memory": build["memory"], "log": log_path, "log_handle": log_handle, "start": datetime.now()}
+            time.sleep(2)
+            for process in [p for p in running if p.poll() is not None]:
+                build = running.pop(process)
+                build["log_handle"].close()
+                build["end"] = datetime.now()
+                build["status"] = process.returncode
+                print("OS type {0} finished with status {1} in {2}.".format(build["ostype"], build["status"], str(build["end"] - build["start"])))
+                results.append(build)
+    except KeyboardInterrupt:
+        # The builds receive the SIGINT too, and clean up their own folders.
+        print("Interrupted, waiting for running builds to stop.")
+        for process in running:
+            process.wait()
+            running[process]["log_handle"].close()
+        raise
+    matrix_end = datetime.now()
+    # Combined timing report.
+    report = ["", "{0:<8} {1:<8} {2:<16} {3}".format("OS type", "Status", "Time", "Log")]
+    for build in sorted(results, key=lambda b: b["start"]):
+        report.append("{0:<8} {1:<8} {2:<16} {3}".format(build["ostype"], "ok" if build["status"] == 0 else "failed", str(build["end"] - build["start"]).split(".")[0], build["log"]))
+    serial_time = sum(((b["end"] - b["start"]) for b in results), timedelta())
+    report.append("Matrix completed in {0}, serial build time {1}.".format(str(matrix_end - matrix_start).split(".")[0], str(serial_time).split(".")[0]))
+    with open(os.path.join(vmpath, "pkvm-matrix.log"), 'w') as f:
+        f.write("\n".join(report) + "\n")
+    for line in report:
+        print(line)
+    return all(b["status"] == 0 for b in results)
+# Packer status lines ("==> builder: message") which start a build phase. Provisioner output is indented instead, and is not matched.
+packer_phase_patterns = [
+    (re.compile(r"Retrieving (ISO|Guest additions)|Downloading or copying"), "iso"),
+    (re.compile(r"Starting HTTP server"), "http-serve"),
+    (re.compile(r"Creating (required )?virtual machine|Creating hard drive|Copying hard drive|Starting (the )?(VM|virtual machine)"), "vm-start"),
+    (re.compile(r"Waiting \S+ for boot"), "boot-wait"),
+    (re.compile(r"Typing the boot command"), "boot-command"),
+    (re.compile(r"Waiting for (SSH|WinRM) to become available"), "wait-ssh"),
+    (re.compile(r"Provisioning with (shell script|Powershell|Ansible|windows-shell)|Uploading .+ => |Restarting Machine"), "provision"),
+    (re.compile(r"Gracefully halting|Halting the virtual machine|Gracefully shutting down|Waiting for shutdown|Stopping the virtual machine"), "shutdown"),
+    (re.compile(r"Converting hard drive|Exporting virtual machine|Preparing to export|Compacting the disk image|Running post-processor"), "artifact"),
+]
+def packer_timeline_new():
+    """Start a timeline of packer build phases."""
+    return {"start": datetime.now(), "clock": time.monotonic(), "phases": [], "provisioners": 0}
+def packer_timeline_add(timeline: dict, phase: str, detail: str = ""):
+    """End the current phase and start a new one. A phase of None only ends the current phase."""
+    now = time.monotonic()
+    if timeline["phases"] and "duration" not in timeline["phases"][-1]:
+        current = timeline["phases"][-1]
+        current["duration"] = max(0.0, round(now - timeline["clock"] - current["offset"], 1))
+    if phase:
+        timeline["phases"].append({"phase": phase, "detail": detail, "offset": round(now - timeline["clock"], 1)})
+def packer_timeline_line(timeline: dict, line: str):
+    """Update the timeline from a line of packer output."""
+    if not line.startswith("==> "):
+        return
+    message = line.split(": ", 1)[-1]
+    if re.search(r"Builds? .*(finished|errored)", line):
+        packer_timeline_add(timeline, None)
+        return
+    for pattern, phase in packer_phase_patterns:
+        match = pattern.search(message)
+        if not match:
+            continue
+        current = timeline["phases"][-1] if timeline["phases"] and "duration" not in timeline["phases"][-1] else None
+        if phase == "provision":
+            # Each provisioner is its own phase, numbered in build order.
+            timeline["provisioners"] += 1
+            kind = match.group(1) or ("file" if message.startswith("Uploading") else "restart")
+            packer_timeline_add(timeline, "provision-{0} {1}".format(timeline["provisioners"], kind.split()[0].lower()), message)
+        elif not current or current["phase"] != phase:
+            packer_timeline_add(timeline, phase, message)
+        return
+def packer_timeline_write(path: str, timeline: dict, **info):
+    """End the timeline and write it as json. info is saved with it (like the vm name and os type)."""
+    packer_timeline_add(timeline, None)
+    data = dict(info)
+    data["start"] = timeline["start"].isoformat(timespec="seconds")
+    data["total"] = round(time.monotonic() - timeline["clock"], 1)
+    data["phases"] = timeline["phases"]
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    return data
+def packer_timeline_report(vmpath: str):
+    """Summarize the timelines of all builds in a folder: mean time per phase for each VM, and the slowest phases overall."""
+    builds = {}
+    for timeline_path in sorted(pathlib.Path(vmpath).glob("*.timeline.json")):
+        try:
+            with open(timeline_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        builds.setdefault(data.get("vmname", timeline_path.name), []).append(data)
+    report = []
+    slowest = []
+    for vmname, timelines in sorted(builds.items()):
+        totals = [t["total"] for t in timelines]
+        report.append("{0}: {1} builds, mean {2}".format(vmname, len(timelines), str(timedelta(seconds=int(sum(totals) / len(totals))))))
+        durations = {}
+        for t in timelines:
+            for phase in t["phases"]:
+                durations.setdefault(phase["phase"], []).append(phase.get("duration", 0))
+        for phase, values in sorted(durations.items(), key=lambda item: -sum(item[1]) / len(item[1])):
+            mean = sum(values) / len(values)
+            report.append("    {0:<24} mean {1:>9}  max {2:>9}".format(phase, str(timedelta(seconds=int(mean))), str(timedelta(seconds=int(max(values))))))
+            slowest.append((mean, vmname, phase))
+    if slowest:
+        report.append("Slowest phases:")
+        for mean, vmname, phase in sorted(slowest, reverse=True)[:10]:
+            report.append("    {0:>9}  {1} {2}".format(str(timedelta(seconds=int(mean))), vmname, phase))
+    return report
 def signal_handler(sig, frame):
     """Cleanup if given early termination."""
     if tpm_process:
@@ -271,6 +591,17 @@ if __name__ == '__main__':
     # Get arguments
     parser = argparse.ArgumentParser(description='Create a VM using packer.')
     parser.add_argument("-a", "--ostype", type=int, help="OS type (default: %(default)s)", default="1")
+    parser.add_argument("-x", "--matrix", help="Build several OS types concurrently, comma separated (default golden set: %(const)s)", nargs="?", const="1,2,10,32,20,45,40")
+    parser.add_argument("-j", "--jobs", type=int, help="Maximum number of concurrent builds in matrix mode (default: limited by memory and cores)")
+    parser.add_argument("--cpus", type=int, help="CPU cores for VM (default: %(default)s)", default=CPUCORES)
+    parser.add_argument("--httpport", type=int, help="First port of the packer http server port range")
+    parser.add_argument("-g", "--goldenbase", help="Build from a cached post-install base image of the distro, skipping the OS install (qemu only).", action="store_true")
+    parser.add_argument("--flatten", help="With --goldenbase, output a standalone image instead of an overlay on the base image.", action="store_true")
+    parser.add_argument("--rebuildbase", help="With --goldenbase, build a new generation of the base image. Existing overlays keep using the old one.", action="store_true")
+    parser.add_argument("--basebuild", help=argparse.SUPPRESS)
+    parser.add_argument("-c", "--compact", help="Trim free space in the guest before shutdown, and compress the image with zstd after the build (qemu only).", action="store_true")
+    parser.add_argument("--pkgproxy", help="Cache packages downloaded by the VM with a local caching http proxy (VirtualBox and qemu only). Only plain http downloads are cached, like the Debian and Ubuntu archives used by their installers and apt. https downloads pass through uncached: Fedora installs from the ISO, and the AlmaLinux kickstart and dnf mirrors use https, so their packages are not cached.", action="store_true")
+    parser.add_argument("--timelines", help="Print the phase times of the builds in the vm path from their timeline files, and exit.", action="store_true")
     parser.add_argument("-b", "--getpacker", help="Force refresh packer", action="store_true")
     parser.add_argument("-d", "--debug", help="Enable Debug output from packer", action="store_true")
     parser.add_argument("-e", "--desktopenv", help="Desktop Environment")
@@ -308,6 +639,12 @@ if __name__ == '__main__':
     print("VM User is {0}".format(args.vmuser))
     print("Headless:", args.headless)
 
+    # Summarize previous builds.
+    if args.timelines:
+        for line in packer_timeline_report(vmpath):
+            print(line)
+        sys.exit()
+
     # Get Packer
     if not shutil.which("packer") or args.getpacker is True:
         if not CFunc.is_windows():
@@ -328,6 +665,43 @@ if __name__ == '__main__':
     # Ensure that certain commands exist.
     CFunc.commands_check(["packer"])
 
+    # Build several VMs by calling this script for each OS type.
+    if args.matrix:
+        matrix_args = ["-t", str(args.vmtype), "-s", str(args.imgsize), "--fullname", args.fullname, "--vmuser", args.vmuser, "--vmpass", args.vmpass]
+        if args.desktopenv:
+            matrix_args += ["-e", args.desktopenv]
+        if args.headless:
+            matrix_args.append("-q")
+        if args.debug:
+            matrix_args.append("-d")
+        if args.sshkey:
+            matrix_args += ["--sshkey", args.sshkey]
+        if args.root:
+            matrix_args.append("--root")
+        # The base image lock makes variants of the same distro wait for one base build.
+        if args.goldenbase:
+            matrix_args.append("--goldenbase")
+        if args.flatten:
+            matrix_args.append("--flatten")
+        if args.compact:
+            matrix_args.append("--compact")
+        if args.pkgproxy:
+            matrix_args.append("--pkgproxy")
+        matrix_builds = []
+        for ostype in [int(o) for o in args.matrix.split(",") if o.strip()]:
+            matrix_memory = int(args.memory)
+            # ISOVM needs more memory, like below.
+            if ostype == 5 and mem_mib == args.memory:
+                matrix_memory = vm_memory_range(sizemb_lower=12288, sizemb_upper=32768)
+            matrix_builds.append({"ostype": ostype, "memory": matrix_memory, "args": matrix_args})
+        if args.noprompt is False:
+            input("Press Enter to continue.")
+        os.makedirs(vmpath, exist_ok=True)
+        matrix_ok = matrix_run(matrix_builds, vmpath, cpucores=CPUCORES, jobs=args.jobs)
+        for line in packer_timeline_report(vmpath):
+            print(line)
+        sys.exit(0 if matrix_ok else 1)
+
     # Determine VM hypervisor
     hvname = ""
     packer_type = "none"
@@ -349,8 +723,6 @@ if __name__ == '__main__':
     # EFI flag
     useefi = True
     secureboot = False
-    # Predetermined iso checksum.
-    md5_isourl = None
     # Local ansible folder
     ansiblefolder = os.path.join(os.sep, "var", "opt", "machineconfig")
 
@@ -524,6 +896,15 @@ if __name__ == '__main__':
     print("Desktop Environment:", args.desktopenv)
     print("VM Memory is {0}".format(args.memory))
 
+    # Golden base image, shared by the variants of a distro.
+    base_path = None
+    if args.goldenbase and not args.basebuild:
+        if args.vmtype == 2 and base_family(args.ostype):
+            base_path = base_image_path(vmpath, base_family(args.ostype), [isourl, args.iso, args.imgsize, useefi, secureboot, args.vmuser, args.vmpass, args.fullname, args.sshkey], rebuild=args.rebuildbase)
+            print("Base image is {0}".format(base_path))
+        else:
+            print("WARNING: Golden base images are not supported for this OS and VM type. Installing from the iso.")
+
     # Determine disk size in mb
     size_disk_mb = args.imgsize * 1024
 
@@ -565,11 +946,52 @@ if __name__ == '__main__':
             subprocess.run('VBoxManage unregistervm "{0}" --delete'.format(vmname), shell=True, check=True)
     # KVM VMs removed before copy below.
 
+    # Initiate logger
+    buildlog_path = os.path.join(vmpath, "{0}.log".format(vmname))
+    CFunc.log_config(buildlog_path)
+
+    # Build the base image if needed. Concurrent builds of the same distro wait for the first one.
+    if base_path:
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        with CFunc.dlcache_lock(os.path.dirname(base_path), "{0}.lock".format(os.path.basename(base_path))):
+            if not os.path.isfile(base_path):
+                logging.info("Building base image {0}.".format(base_path))
+                base_cmd = [sys.executable, os.path.abspath(__file__), "-a", str(args.ostype), "-p", vmpath, "-t", "2", "-n", os.path.splitext(os.path.basename(base_path))[0], "-s", str(args.imgsize), "-m", str(args.memory), "--cpus", str(args.cpus), "--noprompt", "--basebuild", base_path, "--fullname", args.fullname, "--vmuser", args.vmuser, "--vmpass", args.vmpass]
+                for flag, enabled in (("-q", args.headless), ("-d", args.debug), ("--root", args.root), ("--pkgproxy", args.pkgproxy)):
+                    if enabled:
+                        base_cmd.append(flag)
+                for option, value in (("-i", args.iso), ("--sshkey", args.sshkey), ("--httpport", args.httpport)):
+                    if value:
+                        base_cmd += [option, str(value)]
+                subprocess.run(base_cmd, check=True)
+
     # Check iso
-    if args.iso is not None:
+    iso_digests = None
+    iso_sha256 = None
+    # Digests of isos are kept under the vm path, keyed on the iso's inode metadata, so unchanged isos aren't hashed again.
+    digest_index_path = os.path.join(vmpath, ".pkvm_digests.json")
+    if base_path:
+        # The base image replaces the iso.
+        isopath = base_path
+    elif args.iso is not None:
         isopath = os.path.abspath(args.iso)
     else:
-        isopath = CFunc.downloadfile(isourl, vmpath)[0]
+        # Builds of the same iso (i.e. in matrix mode) download and verify it one at a time, so they never write or replace it under each other.
+        iso_filename = urllib.parse.unquote(os.path.basename(urllib.parse.urlparse(isourl).path))
+        with CFunc.dlcache_lock(vmpath, ".{0}.lock".format(iso_filename)):
+            # Published checksums are cached under the vm path.
+            checksum_cache_path = os.path.join(vmpath, ".pkvm_checksums.json")
+            iso_sha256 = iso_checksum_resolve(isourl, checksum_cache_path)
+            # Hash the iso while it downloads, instead of reading it again for the checksum.
+            isopath, _, iso_digests = CFunc.downloadfile(isourl, vmpath, digests=("sha256",) if iso_sha256 else ("md5",), digest_index=digest_index_path, readonly=True)
+            if iso_sha256 and iso_digests["sha256"] != iso_sha256:
+                # The iso may have been updated upstream (i.e. daily builds), so get the current manifest and iso.
+                logging.info("{0} does not match the published sha256 {1}, downloading it again.".format(isopath, iso_sha256))
+                iso_sha256 = iso_checksum_resolve(isourl, checksum_cache_path, refresh=True)
+                isopath, _, iso_digests = CFunc.downloadfile(isourl, vmpath, overwrite=True, digests=("sha256",) if iso_sha256 else ("md5",), digest_index=digest_index_path, readonly=True)
+                if iso_sha256 and iso_digests["sha256"] != iso_sha256:
+                    os.remove(isopath)
+                    sys.exit("\nError, {0} does not match the published sha256 {1}. The iso was removed.".format(isopath, iso_sha256))
     if os.path.isfile(isopath) is True:
         print("Path to ISO is {0}".format(isopath))
     else:
@@ -597,34 +1019,60 @@ if __name__ == '__main__':
     # Generate hashed password
     sha512_password = hash.sha512_crypt.hash(args.vmpass, rounds=5000)
 
+    # Start the package proxy on the host loopback.
+    pkgproxy_server = None
+    pkgproxy_url = ""
+    # The guest reaches it at 10.0.2.2, which only the VirtualBox NAT and qemu user mode networks map to the host loopback.
+    if args.pkgproxy and args.vmtype not in (1, 2):
+        print("WARNING: The package proxy is only used with VirtualBox and qemu (-t 1 or 2). Proceeding without it.")
+    elif args.pkgproxy and 1 <= args.ostype <= 49:
+        pkgproxy_server = CPkgProxy.proxy_start()
+        pkgproxy_url = "http://10.0.2.2:{0}".format(pkgproxy_server.server_address[1])
+
     # Copy unattend script folder
     if os.path.isdir(os.path.join(SCRIPTDIR, "unattend")):
         tempscriptbasename = os.path.basename(SCRIPTDIR)
         tempscriptfolderpath = os.path.join(packer_temp_folder, tempscriptbasename)
         tempunattendfolder = os.path.join(tempscriptfolderpath, "unattend")
-        shutil.copytree(SCRIPTDIR, tempscriptfolderpath, ignore=shutil.ignore_patterns('.git'))
-        # Set usernames and passwords
-        CFunc.find_replace(tempunattendfolder, "INSERTUSERHERE", args.vmuser, "*")
-        CFunc.find_replace(tempscriptfolderpath, "INSERTUSERHERE", args.vmuser, "Win-provision.ps1")
-        CFunc.find_replace(tempunattendfolder, "INSERTPASSWORDHERE", args.vmpass, "*")
-        CFunc.find_replace(tempscriptfolderpath, "INSERTPASSWORDHERE", args.vmpass, "Win-provision.ps1")
-        CFunc.find_replace(tempunattendfolder, "INSERTFULLNAMEHERE", args.fullname, "*")
+        # Stage only the files the provisioning scripts need. The ISO VM copies the whole folder into its chroots.
+        staging_entrypoints = [vmprovisionscript] if vmprovisionscript and args.ostype != 5 else None
+        if 50 <= args.ostype <= 59:
+            staging_entrypoints = ["Win-provision.ps1", "Wwinget.py"]
+        staged_files = staging_build(SCRIPTDIR, tempscriptfolderpath, staging_entrypoints)
+        staging_archive_path = os.path.join(packer_temp_folder, tempscriptbasename + ".tar.gz")
+        logging.info("Staged {0} files in {1}.".format(len(staged_files), tempscriptfolderpath))
         # Alpine hostname fix
+        vmname_host = vmname
         if 45 <= args.ostype <= 49:
-            vmname_lower = ''.join(char for char in vmname if char.isalnum()).lower()
-            CFunc.find_replace(tempunattendfolder, "INSERTHOSTNAMENAMEHERE", vmname_lower, "*")
-        else:
-            CFunc.find_replace(tempunattendfolder, "INSERTHOSTNAMENAMEHERE", vmname, "*")
-        CFunc.find_replace(tempunattendfolder, "INSERTHASHEDPASSWORDHERE", sha512_password, "*")
-        CFunc.find_replace(tempunattendfolder, "INSERTSSHKEYHERE", sshkey, "*")
-        CFunc.find_replace(tempscriptfolderpath, "INSERTSSHKEYHERE", sshkey, "Win-provision.ps1")
+            vmname_host = ''.join(char for char in vmname if char.isalnum()).lower()
+        # Set usernames and passwords
+        CFunc.find_replace_many(tempunattendfolder, {
+            "INSERTUSERHERE": args.vmuser,
+            "INSERTPASSWORDHERE": args.vmpass,
+            "INSERTFULLNAMEHERE": args.fullname,
+            "INSERTHOSTNAMENAMEHERE": vmname_host,
+            "INSERTHASHEDPASSWORDHERE": sha512_password,
+            "INSERTSSHKEYHERE": sshkey,
+            "INSERTPROXYHERE": pkgproxy_url,
+            "INSERTPROXYOPTSHERE": pkgproxy_url or "none",
+        }, "*")
+        CFunc.find_replace_many(tempscriptfolderpath, {
+            "INSERTUSERHERE": args.vmuser,
+            "INSERTPASSWORDHERE": args.vmpass,
+            "INSERTSSHKEYHERE": sshkey,
+        }, "Win-provision.ps1")
 
     # Get hash for iso.
-    if md5_isourl:
-        md5 = md5_isourl
+    if base_path:
+        iso_checksum = "none"
+    elif iso_sha256:
+        # Already verified against the published checksum.
+        iso_checksum = "sha256:{0}".format(iso_sha256)
+    elif iso_digests:
+        iso_checksum = "md5:{0}".format(iso_digests["md5"])
     else:
-        print("Generating Checksum of {0}".format(isopath))
-        md5 = md5sum(isopath)
+        logging.info("Generating Checksum of {0}".format(isopath))
+        iso_checksum = "md5:{0}".format(md5sum(isopath, indexpath=digest_index_path))
 
     # Create Packer json configuration
     # Packer Builder Configuration
@@ -653,7 +1101,7 @@ if __name__ == '__main__':
         data['source'][packer_type]['local']["vboxmanage"] = ['']
         data['source'][packer_type]['local']["vboxmanage"][0] = ["modifyvm", "{{.Name}}", "--memory", "{0}".format(args.memory)]
         data['source'][packer_type]['local']["vboxmanage"].append(["modifyvm", "{{.Name}}", "--vram", "64"])
-        data['source'][packer_type]['local']["vboxmanage"].append(["modifyvm", "{{.Name}}", "--cpus", "{0}".format(CPUCORES)])
+        data['source'][packer_type]['local']["vboxmanage"].append(["modifyvm", "{{.Name}}", "--cpus", "{0}".format(args.cpus)])
         data['source'][packer_type]['local']["vboxmanage"].append(["modifyvm", "{{.Name}}", "--nic2", "hostonly"])
         data['source'][packer_type]['local']["vboxmanage"].append(["modifyvm", "{{.Name}}", "--hostonlyadapter2", vbox_hostonlyif_name])
         data['source'][packer_type]['local']["vboxmanage_post"] = ['']
@@ -687,7 +1135,7 @@ if __name__ == '__main__':
         data['source'][packer_type]['local']["qemuargs"] = ['']
         data['source'][packer_type]['local']["qemuargs"][0] = ["-m", "{0}M".format(args.memory)]
         data['source'][packer_type]['local']["qemuargs"].append(["-cpu", "host"])
-        data['source'][packer_type]['local']["qemuargs"].append(["-smp", "cores={0},sockets=1,maxcpus={0}".format(CPUCORES)])
+        data['source'][packer_type]['local']["qemuargs"].append(["-smp", "cores={0},sockets=1,maxcpus={0}".format(args.cpus)])
         efi_bin, efi_nvram = "", ""
         if useefi is True:
             efi_bin, efi_nvram = ovmf_bin_nvramcopy(packer_temp_folder, vmname, secureboot=secureboot)
@@ -708,7 +1156,7 @@ if __name__ == '__main__':
         if 50 <= args.ostype <= 59:
             # Grab the virtio drivers
             # https://docs.fedoraproject.org/en-US/quick-docs/creating-windows-virtual-machines-using-virtio-drivers/
-            qemu_virtio_diskpath = CFunc.downloadfile("https://fedorapeople.org/groups/virt/virtio-win/direct-downloads/latest-virtio/virtio-win.iso", vmpath)[0]
+            qemu_virtio_diskpath = CFunc.downloadfile("https://fedorapeople.org/groups/virt/virtio-win/direct-downloads/latest-virtio/virtio-win.iso", vmpath, readonly=True)[0]
             # Set the iso as a new cdrom drive.
             data['source'][packer_type]['local']["qemuargs"].append(["--drive", "file={0},media=cdrom,index=1".format(qemu_virtio_diskpath)])
     elif args.vmtype == 3:
@@ -717,9 +1165,17 @@ if __name__ == '__main__':
         data['packer']["required_plugins"]["libvirt"]["source"] = "github.com/thomasklein94/libvirt"
     data['source'][packer_type]['local']["shutdown_command"] = "shutdown -P now"
     data['source'][packer_type]['local']["iso_url"] = "{0}".format(isopath)
-    data['source'][packer_type]['local']["iso_checksum"] = "md5:{0}".format(md5)
+    data['source'][packer_type]['local']["iso_checksum"] = iso_checksum
+    if base_path:
+        # Boot a copy-on-write overlay of the base image.
+        data['source'][packer_type]['local']["disk_image"] = True
+        data['source'][packer_type]['local']["use_backing_file"] = True
     data['source'][packer_type]['local']["output_directory"] = "{0}".format(vmname)
     data['source'][packer_type]['local']["http_directory"] = tempunattendfolder
+    # Use a separate http port range for each concurrent build.
+    if args.httpport:
+        data['source'][packer_type]['local']["http_port_min"] = args.httpport
+        data['source'][packer_type]['local']["http_port_max"] = args.httpport + 9
     data['source'][packer_type]['local']["disk_size"] = "{0}".format(size_disk_mb)
     data['source'][packer_type]['local']["boot_wait"] = "5s"
     data['source'][packer_type]['local']["ssh_username"] = "root"
@@ -736,8 +1192,8 @@ if __name__ == '__main__':
     # Always copy the current CustomScripts to the VM
     if 1 <= args.ostype <= 49:
         data['build']['provisioner'][0]["file"] = {}
-        data['build']['provisioner'][0]["file"]["source"] = os.path.join(tempscriptfolderpath)
-        data['build']['provisioner'][0]["file"]["destination"] = dest_basefolder
+        data['build']['provisioner'][0]["file"]["source"] = staging_archive_path
+        data['build']['provisioner'][0]["file"]["destination"] = os.path.join(dest_basefolder, os.path.basename(staging_archive_path))
     if 1 <= args.ostype <= 5:
         data['source'][packer_type]['local']["boot_command"] = ["<up><wait>e<wait><down><wait><down><wait><end> inst.text inst.ks=http://{{ .HTTPIP }}:{{ .HTTPPort }}/fedora.cfg<wait><f10>"]
         data['build']['provisioner'][1]["shell"] = {}
@@ -798,6 +1254,12 @@ if __name__ == '__main__':
         # Create user-data and meta-data.
         # https://cloudinit.readthedocs.io/en/latest/topics/datasources/nocloud.html
         shutil.move(os.path.join(tempscriptfolderpath, "unattend", "ubuntu.yaml"), os.path.join(tempscriptfolderpath, "unattend", "user-data"))
+        # Without the package proxy, drop the empty proxy key instead of passing the installer a null proxy.
+        if not pkgproxy_url:
+            with open(os.path.join(tempscriptfolderpath, "unattend", "user-data"), 'r') as f:
+                userdata = [line for line in f if line.strip() != "proxy:"]
+            with open(os.path.join(tempscriptfolderpath, "unattend", "user-data"), 'w') as f:
+                f.writelines(userdata)
         pathlib.Path(os.path.join(tempscriptfolderpath, "unattend", "meta-data")).touch(exist_ok=True)
         # Needed to hit enter quickly at the LTS grub screen (with the assistance/keyboard logo)
         data['source'][packer_type]['local']["boot_wait"] = "1s"
@@ -828,12 +1290,13 @@ if __name__ == '__main__':
         data['build']['provisioner'][0]["windows-restart"] = {}
         data['build']['provisioner'][0]["windows-restart"]["restart_timeout"] = "10m"
         data['build']['provisioner'][1]["file"] = {}
-        data['build']['provisioner'][1]["file"]["source"] = os.path.join(tempscriptfolderpath)
-        data['build']['provisioner'][1]["file"]["destination"] = "C:"
+        data['build']['provisioner'][1]["file"]["source"] = staging_archive_path
+        data['build']['provisioner'][1]["file"]["destination"] = "C:/{0}".format(os.path.basename(staging_archive_path))
         data['build']['provisioner'].append('')
         data['build']['provisioner'][2] = {}
         data['build']['provisioner'][2]["powershell"] = {}
         data['build']['provisioner'][2]["powershell"]["inline"] = [
+            "tar -xzf C:/{0} -C C:/; Remove-Item C:/{0}".format(os.path.basename(staging_archive_path)),
             r'''powershell -executionpolicy bypass "& Set-Variable ProgressPreference SilentlyContinue; &'{0}'; &'C:/Python*/python.exe' {1}; &'C:/Python*/python.exe' {2}; Remove-Item -Recurse {3} ; exit 0;"'''.format(os.path.join("C:/", tempscriptbasename, "Win-provision.ps1"), os.path.join("C:/", tempscriptbasename, "Wwinget.py"), os.path.join("C:/", tempscriptbasename, "Wwinget.py"), os.path.join("C:/", tempscriptbasename)),
         ]
         # data['build']['provisioner'][2]["powershell"]["debug_mode"] = 1
@@ -890,6 +1353,54 @@ if __name__ == '__main__':
         # Insert the virtio driver disk
         xml_insertqemudisk(os.path.join(tempunattendfolder, "autounattend.xml"))
 
+    # The OS is already installed in the base image, so skip the installer and go straight to provisioning.
+    if base_path:
+        data['source'][packer_type]['local'].pop("boot_command", None)
+        data['source'][packer_type]['local']["boot_wait"] = "5s"
+        if "shell" in data['build']['provisioner'][1]:
+            data['build']['provisioner'][1]["shell"]["inline"][0] = f"hostnamectl set-hostname '{vmname}'; " + data['build']['provisioner'][1]["shell"]["inline"][0]
+        # Boot entries are kept in the efi vars.
+        if useefi and os.path.isfile(base_path[:-len(".qcow2")] + "_VARS.fd"):
+            shutil.copy(base_path[:-len(".qcow2")] + "_VARS.fd", efi_nvram)
+    # Discard free space before shutdown, so it is not kept in the image.
+    if args.compact and args.vmtype == 2:
+        data['source'][packer_type]['local']["disk_discard"] = "unmap"
+        data['source'][packer_type]['local']["disk_detect_zeroes"] = "unmap"
+        if 50 <= args.ostype <= 59:
+            data['source'][packer_type]['local']["shutdown_command"] = "defrag C: /L & " + data['source'][packer_type]['local']["shutdown_command"]
+        elif 45 <= args.ostype <= 49:
+            data['source'][packer_type]['local']["shutdown_command"] = "fstrim -v /; " + data['source'][packer_type]['local']["shutdown_command"]
+        elif not 40 <= args.ostype <= 44:
+            data['source'][packer_type]['local']["shutdown_command"] = "fstrim -av; " + data['source'][packer_type]['local']["shutdown_command"]
+    # Only install the OS for a base image.
+    if args.basebuild:
+        # Overlays on the base must not share its identity. Empty the machine-id, so systemd generates a new one on first boot, and remove the ssh host keys, with a unit to generate new ones before sshd starts.
+        hostkeys_unit = "[Unit]\\nDescription=Generate missing ssh host keys\\nConditionPathExists=!/etc/ssh/ssh_host_ed25519_key\\nBefore=ssh.service sshd.service ssh.socket\\n\\n[Service]\\nType=oneshot\\nExecStart=/usr/bin/ssh-keygen -A\\n\\n[Install]\\nWantedBy=multi-user.target\\n"
+        data['build']['provisioner'] = [{"shell": {"inline": [
+            f"printf '{hostkeys_unit}' > /etc/systemd/system/ssh-hostkeys.service",
+            "systemctl enable ssh-hostkeys.service",
+            "rm -f /etc/ssh/ssh_host_*",
+            "truncate -s 0 /etc/machine-id",
+            "rm -f /var/lib/dbus/machine-id",
+            "sync"]}}]
+    else:
+        # The scripts are uploaded as one file after all templating is done, and unpacked before the other provisioners run.
+        archive_starttime = datetime.now()
+        archive_size = staging_archive(tempscriptfolderpath, staging_archive_path)
+        logging.info("Packed {0} into {1} ({2:.0f} KB) in {3}.".format(tempscriptfolderpath, staging_archive_path, archive_size / 1024, str(datetime.now() - archive_starttime)))
+        if 1 <= args.ostype <= 49:
+            archive_guest_path = os.path.join(dest_basefolder, os.path.basename(staging_archive_path))
+            data['build']['provisioner'].insert(1, {"shell": {"inline": [f"tar -xzf {archive_guest_path} -C {dest_basefolder} && rm -f {archive_guest_path}"]}})
+            if 40 <= args.ostype <= 41:
+                data['build']['provisioner'][1]["shell"]["execute_command"] = data['build']['provisioner'][2]["shell"]["execute_command"]
+    # Send package downloads through the proxy, and remove the proxy settings the installer saved in the guest.
+    if pkgproxy_server:
+        for provisioner in data['build']['provisioner']:
+            if "shell" in provisioner:
+                provisioner["shell"]["environment_vars"] = [f"http_proxy={pkgproxy_url}", f"HTTP_PROXY={pkgproxy_url}"]
+        if not 40 <= args.ostype <= 44:
+            data['build']['provisioner'].append({"shell": {"inline": ["rm -f /etc/profile.d/proxy.sh; if [ -f /etc/apt/apt.conf ]; then sed -i '/Acquire::http::Proxy/d' /etc/apt/apt.conf; fi"]}})
+
     # Write packer json file.
     with open(os.path.join(packer_temp_folder, 'file.pkr.json'), 'w') as file_json_wr:
         json.dump(data, file_json_wr, indent=2)
@@ -900,21 +1411,57 @@ if __name__ == '__main__':
 
     # Save start time.
     beforetime = datetime.now()
-    # Initiate logger
-    buildlog_path = os.path.join(vmpath, "{0}.log".format(vmname))
-    CFunc.log_config(buildlog_path)
     # Call packer.
     CFunc.subpout_logger(cmd="packer init file.pkr.json")
     packer_buildcmd = "packer build file.pkr.json"
-    CFunc.subpout_logger(cmd=packer_buildcmd)
+    # Split the packer output into phases as it arrives.
+    packer_timeline = packer_timeline_new()
+    packer_status = CFunc.subpout_logger(cmd=packer_buildcmd, line_callback=functools.partial(packer_timeline_line, packer_timeline))
+    # One timeline per build, so the report can compare builds of the same VM.
+    timeline_path = os.path.join(vmpath, "{0}-{1}.timeline.json".format(vmname, packer_timeline["start"].strftime("%Y%m%d-%H%M%S")))
     # Save packer finish time.
     packerfinishtime = datetime.now()
+    if pkgproxy_server:
+        CPkgProxy.proxy_stop(pkgproxy_server)
+        logging.info(CPkgProxy.proxy_report())
+    # Stop with an error if packer failed, so matrix builds report it.
+    if packer_status != 0 or (args.vmtype in (1, 2) and not os.path.isdir(output_folder)) or (args.vmtype == 2 and not os.path.isfile(os.path.join(output_folder, vmname + ".qcow2"))):
+        packer_timeline_write(timeline_path, packer_timeline, vmname=vmname, ostype=args.ostype, vmtype=args.vmtype, packer_status=packer_status, goldenbase=bool(base_path))
+        if tpm_process:
+            tpm_process.terminate()
+        os.chdir(vmpath)
+        if not args.debug:
+            shutil.rmtree(packer_temp_folder)
+        logging.info("ERROR: packer build failed with status {0} after {1}. See {2}.".format(packer_status, str(packerfinishtime - beforetime), buildlog_path))
+        sys.exit(packer_status or 1)
+
+    # Compact the image. Overlays keep their base image as backing file unless they are flattened here.
+    if args.compact and args.vmtype == 2 and not args.basebuild and os.path.isfile(os.path.join(output_folder, vmname + ".qcow2")):
+        packer_timeline_add(packer_timeline, "compact")
+        qcow2_compact(os.path.join(output_folder, vmname + ".qcow2"), backing=base_path if base_path and not args.flatten else None)
+        packer_timeline_add(packer_timeline, None)
 
     # Remove temp folder
     os.chdir(vmpath)
     buildlog_sourcepath = os.path.join(packer_temp_folder, "build.log")
 
-    # Copy output to VM folder.
+    # Save the base image, and stop before creating a VM from it.
+    if args.basebuild:
+        base_output = os.path.join(output_folder, vmname + ".qcow2")
+        if not os.path.isfile(base_output):
+            sys.exit("ERROR: Base image {0} was not built.".format(base_output))
+        os.replace(base_output, args.basebuild)
+        if useefi:
+            shutil.copy2(efi_nvram, args.basebuild[:-len(".qcow2")] + "_VARS.fd")
+        if tpm_process:
+            tpm_process.terminate()
+        if not args.debug:
+            shutil.rmtree(packer_temp_folder)
+        logging.info("Base image saved to {0}, built in {1}.".format(args.basebuild, str(datetime.now() - beforetime)))
+        packer_timeline_write(timeline_path, packer_timeline, vmname=vmname, ostype=args.ostype, vmtype=args.vmtype, packer_status=packer_status, basebuild=True)
+        sys.exit()
+
+    # Move output to VM folder. This is a rename on the same filesystem, and a sparse copy otherwise.
     if os.path.isdir(output_folder):
         # Remove previous folder, if it exists.
         if os.path.isdir(os.path.join(vmpath, vmname)):
@@ -922,16 +1469,25 @@ if __name__ == '__main__':
         # Remove existing VMs in KVM
         if args.vmtype == 2:
             PCreateChrootVM.vm_cleanup(vmname=vmname, img_path=os.path.join(vmpath, vmname + ".qcow2"))
-        logging.info("\nCopying {0} to {1}.".format(output_folder, vmpath))
+        logging.info("\nMoving {0} to {1}.".format(output_folder, vmpath))
+        movestarttime = datetime.now()
+        packer_timeline_add(packer_timeline, "move")
         if args.vmtype != 2:
-            shutil.copytree(output_folder, os.path.join(vmpath, vmname))
-        # Copy the qcow2 file, and remove the folder entirely for kvm.
+            move_method = CFunc.tree_move(output_folder, os.path.join(vmpath, vmname))
+            logging.info("Moved {0} ({1}) in {2}.".format(output_folder, move_method, str(datetime.now() - movestarttime)))
+        # Move the qcow2 file, and remove the folder entirely for kvm.
         if args.vmtype == 2 and os.path.isfile(os.path.join(output_folder, vmname + ".qcow2")):
-            shutil.copy2(os.path.join(output_folder, vmname + ".qcow2"), os.path.join(vmpath, vmname + ".qcow2"))
+            if base_path and args.flatten and not args.compact:
+                # Write a standalone image, without the base image as backing file.
+                logging.info("Flattening {0}.".format(vmname + ".qcow2"))
+                subprocess.run(["qemu-img", "convert", "-O", "qcow2", os.path.join(output_folder, vmname + ".qcow2"), os.path.join(vmpath, vmname + ".qcow2")], check=True)
+            else:
+                move_method = CFunc.file_move(os.path.join(output_folder, vmname + ".qcow2"), os.path.join(vmpath, vmname + ".qcow2"))
+                logging.info("Moved {0} ({1}) in {2}.".format(vmname + ".qcow2", move_method, str(datetime.now() - movestarttime)))
             if useefi:
-                shutil.copy2(efi_bin, vmpath)
-                shutil.copy2(efi_nvram, vmpath)
-                # Set code and nvram path to copied path.
+                CFunc.file_move(efi_bin, os.path.join(vmpath, os.path.basename(efi_bin)))
+                CFunc.file_move(efi_nvram, os.path.join(vmpath, os.path.basename(efi_nvram)))
+                # Set code and nvram path to moved path.
                 efi_bin = os.path.join(vmpath, os.path.basename(efi_bin))
                 efi_nvram = os.path.join(vmpath, os.path.basename(efi_nvram))
     if args.debug:
@@ -940,6 +1496,8 @@ if __name__ == '__main__':
         logging.info("Removing {0}".format(packer_temp_folder))
         shutil.rmtree(packer_temp_folder)
     logging.info("VM successfully output to {0}".format(os.path.join(vmpath, vmname)))
+    packer_timeline_write(timeline_path, packer_timeline, vmname=vmname, ostype=args.ostype, vmtype=args.vmtype, packer_status=packer_status, goldenbase=bool(base_path))
+    logging.info("Build timeline saved to {0}".format(timeline_path))
     # Save full finish time.
     fullfinishtime = datetime.now()
 